@@ -0,0 +1,38 @@
+"""Add book_similarities
+
+Revision ID: 3b1d7e9a4c52
+Revises: a0e30917396e
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b1d7e9a4c52'
+down_revision: Union[str, None] = 'a0e30917396e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'book_similarities',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('similar_book_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['audiobooks.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['similar_book_id'], ['audiobooks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('book_id', 'rank')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('book_similarities')
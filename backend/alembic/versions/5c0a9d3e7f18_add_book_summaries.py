@@ -0,0 +1,64 @@
+"""Add book_summaries read model
+
+Revision ID: 5c0a9d3e7f18
+Revises: 8e4f2a6c1d97
+Create Date: 2026-10-19 11:20:05.902311
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c0a9d3e7f18'
+down_revision: Union[str, None] = '8e4f2a6c1d97'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'book_summaries',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('author', sa.String(), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('category_name', sa.String(), nullable=True),
+        sa.Column('creator_id', sa.Integer(), nullable=True),
+        sa.Column('is_public', sa.Boolean(), nullable=True),
+        sa.Column('cover_thumbnail_url', sa.String(), nullable=True),
+        sa.Column('first_chapter_audio_url', sa.String(), nullable=True),
+        sa.Column('total_chapters', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['audiobooks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_index(op.f('ix_book_summaries_created_at'), 'book_summaries', ['created_at'], unique=False)
+    op.create_index(op.f('ix_book_summaries_creator_id'), 'book_summaries', ['creator_id'], unique=False)
+
+    # Backfill from the existing catalog
+    op.execute("""
+        INSERT INTO book_summaries (
+            book_id, title, author, description, category_id, category_name, creator_id, is_public,
+            cover_thumbnail_url, first_chapter_audio_url, total_chapters, created_at
+        )
+        SELECT
+            a.id, a.title, a.author, a.description, a.category_id, c.name, a.creator_id, a.is_public,
+            (SELECT ch.thumbnail_url FROM chapters ch WHERE ch.audiobook_id = a.id ORDER BY ch."order" LIMIT 1),
+            (SELECT ch.audio_url FROM chapters ch WHERE ch.audiobook_id = a.id ORDER BY ch."order" LIMIT 1),
+            (SELECT count(*) FROM chapters ch WHERE ch.audiobook_id = a.id),
+            a.created_at
+        FROM audiobooks a
+        LEFT JOIN categories c ON c.id = a.category_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_book_summaries_creator_id'), table_name='book_summaries')
+    op.drop_index(op.f('ix_book_summaries_created_at'), table_name='book_summaries')
+    op.drop_table('book_summaries')
@@ -0,0 +1,33 @@
+"""Add size, duration and content type to chapters
+
+Revision ID: 7a3e5f0b2c84
+Revises: d2b7c4e91a06
+Create Date: 2026-10-19 16:05:12.640931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3e5f0b2c84'
+down_revision: Union[str, None] = 'd2b7c4e91a06'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows stay NULL until jobs/backfill_chapter_media.py has run
+    op.add_column('chapters', sa.Column('size_bytes', sa.BigInteger(), nullable=True))
+    op.add_column('chapters', sa.Column('duration_seconds', sa.Float(), nullable=True))
+    op.add_column('chapters', sa.Column('content_type', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chapters', 'content_type')
+    op.drop_column('chapters', 'duration_seconds')
+    op.drop_column('chapters', 'size_bytes')
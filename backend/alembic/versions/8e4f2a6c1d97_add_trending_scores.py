@@ -0,0 +1,37 @@
+"""Add trending_scores
+
+Revision ID: 8e4f2a6c1d97
+Revises: 3b1d7e9a4c52
+Create Date: 2026-10-19 10:02:17.554120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4f2a6c1d97'
+down_revision: Union[str, None] = '3b1d7e9a4c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'trending_scores',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('log_score', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['audiobooks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('book_id')
+    )
+    op.create_index(op.f('ix_trending_scores_log_score'), 'trending_scores', ['log_score'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_trending_scores_log_score'), table_name='trending_scores')
+    op.drop_table('trending_scores')
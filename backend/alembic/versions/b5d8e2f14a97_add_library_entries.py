@@ -0,0 +1,69 @@
+"""Add library_entries and likes.created_at
+
+Revision ID: b5d8e2f14a97
+Revises: 9c1f4e7a2b63
+Create Date: 2026-10-19 18:02:17.503318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d8e2f14a97'
+down_revision: Union[str, None] = '9c1f4e7a2b63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing likes have no known time and stay NULL
+    op.add_column('likes', sa.Column('created_at', sa.DateTime(), nullable=True))
+
+    op.create_table(
+        'library_entries',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('last_activity', sa.DateTime(), nullable=False),
+        sa.Column('owned', sa.Boolean(), nullable=False),
+        sa.Column('liked', sa.Boolean(), nullable=False),
+        sa.Column('progress', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['book_id'], ['audiobooks.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'book_id'),
+    )
+    op.create_index(
+        'ix_library_entries_user_activity', 'library_entries', ['user_id', 'last_activity', 'book_id'],
+        unique=False, postgresql_include=['owned', 'liked', 'progress'],
+    )
+
+    # Same projection as utils.library.rebuild_library, written out so the migration doesn't import app code
+    op.execute("""
+        INSERT INTO library_entries (user_id, book_id, last_activity, owned, liked, progress)
+        SELECT user_id, book_id,
+               COALESCE(MAX(at), '1970-01-01 00:00:00'),
+               CASE WHEN MAX(owned) = 1 THEN TRUE ELSE FALSE END,
+               CASE WHEN MAX(liked) = 1 THEN TRUE ELSE FALSE END,
+               MAX(progress)
+        FROM (
+            SELECT creator_id AS user_id, id AS book_id, created_at AS at, 1 AS owned, 0 AS liked, NULL AS progress
+            FROM audiobooks WHERE creator_id IS NOT NULL
+            UNION ALL
+            SELECT user_id, book_id, created_at, 0, 1, NULL
+            FROM likes WHERE user_id IS NOT NULL AND book_id IS NOT NULL
+            UNION ALL
+            SELECT user_id, book_id, last_played, 0, 0, progress
+            FROM listening_history WHERE user_id IS NOT NULL AND book_id IS NOT NULL
+        ) AS sources
+        GROUP BY user_id, book_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_library_entries_user_activity', table_name='library_entries')
+    op.drop_table('library_entries')
+    op.drop_column('likes', 'created_at')
@@ -0,0 +1,27 @@
+"""Index chapters.audiobook_id
+
+Revision ID: d2b7c4e91a06
+Revises: 5c0a9d3e7f18
+Create Date: 2026-10-19 14:21:40.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b7c4e91a06'
+down_revision: Union[str, None] = '5c0a9d3e7f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_chapters_audiobook_id'), 'chapters', ['audiobook_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_chapters_audiobook_id'), table_name='chapters')
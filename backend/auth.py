@@ -1,9 +1,10 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
 from sqlalchemy.orm import Session
 from database import SessionLocal
 from models import User
-from schemas import UserCreate, UserLogin
+from schemas import UserCreate, UserLogin, MessageResponse, LoginResponse
 from passlib.context import CryptContext
+from utils import idempotency
 
 router = APIRouter()
 
@@ -27,25 +28,38 @@ def get_db():
         db.close()
 
 # ✅ Signup route
-@router.post("/signup")
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if db_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    user_data = user.model_dump()
-    user_data["password_hash"] = hash_password(user_data.pop("password"))  # 🔐 Securely hash password
-    new_user = User(**user_data)
-
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    return {"message": "Signup successful"}
+@router.post("/signup", response_model=MessageResponse)
+def signup(user: UserCreate, idempotency_key: str = Header(None), db: Session = Depends(get_db)):
+    # 🔁 A retried signup with the same Idempotency-Key gets the first response instead of "already registered".
+    # The password is left out of the fingerprint so no unsalted digest of it is ever stored.
+    call = idempotency.begin(
+        "signup", idempotency_key, idempotency.fingerprint(*user.model_dump(exclude={"password"}).values())
+    )
+    if call.replay is not None:
+        return call.replay
+
+    try:
+        db_user = db.query(User).filter(User.email == user.email).first()
+        if db_user:
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+        user_data = user.model_dump()
+        user_data["password_hash"] = hash_password(user_data.pop("password"))  # 🔐 Securely hash password
+        new_user = User(**user_data)
+
+        db.add(new_user)
+        result = {"message": "Signup successful"}
+        call.complete(db, 200, result)
+        db.commit()
+    except Exception:
+        call.release()
+        raise
+
+    return result
 
 # ✅ Login route with password verification
 # Login route
-@router.post("/login")
+@router.post("/login", response_model=LoginResponse)
 def login(credentials: UserLogin, db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == credentials.email).first()
 
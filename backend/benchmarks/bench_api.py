@@ -0,0 +1,216 @@
+"""Reproducible API load test.
+
+Boots the real FastAPI app in-process against SQLite (default, a fresh temp
+file) or any DATABASE_URL, swaps media storage for an in-memory fake, seeds a
+catalog and drives concurrent scenarios through an ASGI client:
+
+    python -m benchmarks.bench_api --books 2000 --chapters 8 --output bench.json
+    python -m benchmarks.bench_api --database-url postgresql://... --reset
+
+Per scenario it reports throughput, p50/p95/p99 latency and SQL statements per
+request; peak RSS and the git commit are recorded so runs can be compared
+across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def build_scenarios(args):
+    from benchmarks.generate_dataset import EMAIL_TEMPLATE, PASSWORD
+
+    books = args.books
+    rng = random.Random(args.seed)
+
+    async def catalog_browse(client, i):
+        return await client.get("/api/books/all")
+
+    async def home(client, i):
+        return await client.get("/api/home", params={"user_id": 1 + i % args.users})
+
+    async def book_details(client, i):
+        return await client.get(f"/api/books/{rng.randint(1, books)}")
+
+    async def chapter_listing(client, i):
+        return await client.get(f"/api/books/{rng.randint(1, books)}/chapters")
+
+    async def library(client, i):
+        return await client.get("/api/library", params={"user_id": 1 + i % args.users})
+
+    async def login_burst(client, i):
+        return await client.post("/api/auth/login", json={
+            "email": EMAIL_TEMPLATE.format(1 + i % args.users), "password": PASSWORD
+        })
+
+    audio_payload = b"ID3" + bytes(args.upload_kb * 1024)
+    thumbnail_payload = b"\xff\xd8\xff" + bytes(16 * 1024)
+
+    async def multi_file_upload(client, i):
+        return await client.post("/api/audio/upload", data={
+            "title": f"Uploaded {i}", "author": "Bench", "description": "", "category_id": "1",
+        }, files={
+            "audio": (f"upload_{i}.mp3", audio_payload, "audio/mpeg"),
+            "thumbnail": (f"upload_{i}.jpg", thumbnail_payload, "image/jpeg"),
+        })
+
+    return [
+        ("catalog_browse", catalog_browse, args.requests // 4),
+        ("home", home, args.requests // 2),
+        ("book_details", book_details, args.requests),
+        ("chapter_listing", chapter_listing, args.requests),
+        ("library", library, args.requests),
+        ("login_burst", login_burst, max(1, args.requests // 10)),
+        ("multi_file_upload", multi_file_upload, max(1, args.requests // 10)),
+    ]
+
+
+async def run_scenario(client, request, total, concurrency, query_counter):
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            response = await request(client, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries_before = query_counter[0]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "queries_per_request": round((query_counter[0] - queries_before) / total, 2),
+    }
+
+
+async def run(args):
+    import httpx
+    from sqlalchemy import event
+    from database import engine
+    from models import Base
+    from utils.storage import set_storage
+    from benchmarks.fakes import InMemoryBlobStorage
+    from benchmarks.generate_dataset import generate
+
+    storage = InMemoryBlobStorage()
+    set_storage(storage)
+
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    from main import app  # creates the tables
+    generate(
+        engine, storage, users=args.users, books=args.books, categories=args.categories,
+        mean_chapters=args.chapters, seed=args.seed,
+    )
+
+    query_counter = [0]
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _count(*_):
+        query_counter[0] += 1
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, request, total in build_scenarios(args):
+            if args.scenarios and name not in args.scenarios:
+                continue
+            # Warm-up so the first-request costs (caches, lazy init) don't skew p99
+            for i in range(min(5, total)):
+                await request(client, i)
+            results[name] = await run_scenario(client, request, total, args.concurrency, query_counter)
+            print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "catalog": {
+            "categories": args.categories, "books": args.books,
+            "mean_chapters_per_book": args.chapters, "users": args.users, "seed": args.seed,
+        },
+        "scenarios": results,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    parser.add_argument("--reset", action="store_true", help="drop all tables before seeding")
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--chapters", type=float, default=8, help="mean chapters per book")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=400, help="base request count per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--upload-kb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenarios", nargs="*", help="only run these scenarios")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        temp_dir = tempfile.TemporaryDirectory(prefix="darati-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(temp_dir.name, 'bench.db')}"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # One client address drives every scenario; measure the app, not the limiter
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("STREAM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "darati-bench-chunks"))
+
+    report = asyncio.run(run(args))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
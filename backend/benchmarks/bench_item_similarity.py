@@ -0,0 +1,74 @@
+"""Scaling benchmark for the item-item similarity job on synthetic data.
+
+    python -m benchmarks.bench_item_similarity --interactions 1000000
+
+Interactions follow a Zipf-like popularity curve so a few books get most of the
+plays, which is what the real catalogue looks like. Results are printed as JSON.
+"""
+import argparse
+import json
+import resource
+import time
+
+import numpy as np
+
+from utils.item_similarity import build_interaction_matrix, top_k_similar_items
+
+
+def synthetic_interactions(n_interactions, n_users, n_books, seed=0):
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, n_books + 1) ** 1.1
+    popularity /= popularity.sum()
+    user_ids = rng.integers(0, n_users, size=n_interactions)
+    book_ids = rng.choice(n_books, size=n_interactions, p=popularity)
+    weights = rng.uniform(0.5, 1.0, size=n_interactions).astype(np.float32)
+    return user_ids, book_ids, weights
+
+
+def run(n_interactions, n_users, n_books, top_k, block_mb):
+    user_ids, book_ids, weights = synthetic_interactions(n_interactions, n_users, n_books)
+
+    started = time.perf_counter()
+    matrix, _ = build_interaction_matrix(user_ids, book_ids, weights)
+    built = time.perf_counter()
+    top_k_similar_items(matrix, k=top_k, block_bytes=block_mb * 1024 * 1024)
+    finished = time.perf_counter()
+
+    return {
+        "interactions": n_interactions,
+        "users": n_users,
+        "books": n_books,
+        "nnz": int(matrix.nnz),
+        "top_k": top_k,
+        "build_matrix_s": round(built - started, 3),
+        "similarity_s": round(finished - built, 3),
+        "total_s": round(finished - started, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--interactions", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--block-mb", type=int, default=256)
+    parser.add_argument("--steps", type=int, default=4, help="also run at 1/2, 1/4, ... of the size")
+    args = parser.parse_args()
+
+    results = []
+    for step in reversed(range(args.steps)):
+        scale = 2 ** step
+        results.append(run(
+            args.interactions // scale,
+            max(1, args.users // scale),
+            max(2, args.books // scale),
+            args.top_k,
+            args.block_mb,
+        ))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Serialization cost of a large listing: ORM objects vs column rows + response models.
+
+    python -m benchmarks.bench_serialization --books 20000
+
+"legacy" is what /api/user_books did before typed responses: load Audiobook
+instances, run jsonable_encoder over them and render with json.dumps.
+"validated" selects columns and goes through FastAPI's response_model path
+(validate with from_attributes, dump, orjson). "rows" is what the listing
+routes do now: select columns and render them with RowsResponse. Query time is
+reported separately from encode time. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def best_of(repeats, fn):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def run(args):
+    from typing import List
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from pydantic import TypeAdapter
+    from database import Base, SessionLocal, engine
+    from models import Audiobook
+    from routes.user_books_routes import AUDIOBOOK_COLUMNS
+    from schemas import AudiobookResponse
+    from utils.json_response import RowsResponse
+    from benchmarks.fakes import InMemoryBlobStorage
+    from benchmarks.generate_dataset import generate
+
+    Base.metadata.create_all(bind=engine)
+    generate(engine, InMemoryBlobStorage(), users=max(100, args.books // 10), books=args.books,
+             likes_per_user=0, listens_per_user=0, seed=args.seed)
+    adapter = TypeAdapter(List[AudiobookResponse])
+
+    db = SessionLocal()
+    try:
+        def legacy_query():
+            db.expunge_all()
+            return db.query(Audiobook).all()
+
+        def typed_query():
+            return db.query(*AUDIOBOOK_COLUMNS).all()
+
+        legacy_query_s, books = best_of(args.repeats, legacy_query)
+        typed_query_s, rows = best_of(args.repeats, typed_query)
+
+        legacy_encode_s, legacy_body = best_of(args.repeats, lambda: JSONResponse(jsonable_encoder(books)).body)
+        validated_encode_s, validated_body = best_of(args.repeats, lambda: ORJSONResponse(
+            adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json")
+        ).body)
+        rows_encode_s, rows_body = best_of(args.repeats, lambda: RowsResponse(rows).body)
+    finally:
+        db.close()
+
+    return {
+        "books": args.books,
+        "legacy_query_s": round(legacy_query_s, 4),
+        "typed_query_s": round(typed_query_s, 4),
+        "legacy_encode_s": round(legacy_encode_s, 4),
+        "validated_encode_s": round(validated_encode_s, 4),
+        "rows_encode_s": round(rows_encode_s, 4),
+        "validated_encode_speedup": round(legacy_encode_s / validated_encode_s, 1),
+        "rows_encode_speedup": round(legacy_encode_s / rows_encode_s, 1),
+        "rows_total_speedup": round((legacy_query_s + legacy_encode_s) / (typed_query_s + rows_encode_s), 1),
+        "identical_payloads": json.loads(legacy_body) == json.loads(validated_body) == json.loads(rows_body),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="darati-bench-") as temp_dir:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(temp_dir, 'bench.db')}"
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""In-memory stand-ins for external services used by the benchmarks."""
+import base64
+import hashlib
+import hmac
+import mimetypes
+import threading
+import time
+from datetime import datetime, timezone
+
+from utils.storage import LIST_PAGE_SIZE, BlobEntry, BlobInfo, StorageBackend
+
+
+class InMemoryBlobStorage(StorageBackend):
+    """Behaves like AzureBlobStorage (full-URL references, HMAC-signed SAS query
+    strings of the same shape and cost) without any network I/O."""
+
+    name = "memory"
+
+    def __init__(self, account_name="benchaccount", container_name="bench-media"):
+        self.account_name = account_name
+        self.container_name = container_name
+        self._key = b"benchmark-signing-key"
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def blob_name(self, reference):
+        if 'blob.core.windows.net' in reference:
+            reference = reference.split(self.container_name + '/', 1)[-1]
+        return super().blob_name(reference)
+
+    def _url(self, blob_name):
+        return f"https://{self.account_name}.blob.core.windows.net/{self.container_name}/{blob_name}"
+
+    def _upload(self, name, data, content_type, progress):
+        with self._lock:
+            self._blobs[name] = (bytes(data), content_type, datetime.utcnow())
+        if progress:
+            progress(len(data))
+        return self._url(name)
+
+    def _signed_url(self, reference, expires_in):
+        blob_name = self.blob_name(reference)
+        expiry = datetime.utcfromtimestamp(time.time() + expires_in.total_seconds()).strftime("%Y-%m-%dT%H:%M:%SZ")
+        to_sign = f"r\n\n{expiry}\n/blob/{self.account_name}/{self.container_name}/{blob_name}\n\n\nhttps\n2021-08-06\nb"
+        signature = base64.b64encode(hmac.new(self._key, to_sign.encode("utf-8"), hashlib.sha256).digest()).decode()
+        return f"{self._url(blob_name)}?se={expiry}&sp=r&sv=2021-08-06&sr=b&sig={signature}"
+
+    def properties(self, reference):
+        blob_name = self.blob_name(reference)
+        data, content_type, created = self._blobs[blob_name]
+        content_type = content_type or mimetypes.guess_type(blob_name)[0] or "application/octet-stream"
+        return BlobInfo(len(data), f'"{hash((blob_name, created)) & 0xffffffff:x}"', content_type)
+
+    def download_range(self, reference, offset, length):
+        data = self._blobs[self.blob_name(reference)][0]
+        return data[offset:offset + length]
+
+    def delete(self, reference):
+        with self._lock:
+            self._blobs.pop(self.blob_name(reference), None)
+
+    def list_blobs(self, prefix="", page_size=LIST_PAGE_SIZE):
+        with self._lock:
+            entries = [
+                BlobEntry(name, len(data), created.replace(tzinfo=timezone.utc).timestamp())
+                for name, (data, _, created) in sorted(self._blobs.items()) if name.startswith(prefix)
+            ]
+        for start in range(0, len(entries), page_size):
+            yield entries[start:start + page_size]
+
+    def __len__(self):
+        return len(self._blobs)
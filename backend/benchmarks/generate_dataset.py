@@ -0,0 +1,218 @@
+"""Deterministic synthetic catalog at production scale.
+
+    python -m benchmarks.generate_dataset --users 1000000 --books 100000 --seed 7
+
+Generates users, categories, audiobooks with a skewed chapters-per-book
+distribution, and likes / listening history whose book popularity follows a
+power law. Rows are streamed in batches through utils.bulk_load. The same
+seed and sizes always produce the same rows. IDs continue after whatever is
+already in each table, so the generator can be pointed at a non-empty
+database.
+
+Chapters reference a small pool of placeholder media objects uploaded through
+the configured storage backend (or the in-memory fake when called from the
+benchmarks), so signing and streaming code paths still resolve real blobs.
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from models import Audiobook, Category, Chapter, Like, ListeningHistory, User
+from utils.bulk_load import bulk_load, next_id, reset_sequences
+
+logger = logging.getLogger(__name__)
+
+PASSWORD = "benchmark"
+EMAIL_TEMPLATE = "user{}@bench.local"
+PLACEHOLDER_VARIANTS = 16
+EPOCH = datetime(2024, 1, 1)
+
+# Tiny blobs with valid MP3 / JPEG headers so anything inspecting them sees real media
+PLACEHOLDER_AUDIO = b"ID3\x04\x00\x00\x00\x00\x00\x00" + b"\xff\xfb\x90\x00" + bytes(412)
+PLACEHOLDER_IMAGE = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + bytes(64) + b"\xff\xd9"
+
+
+def upload_placeholder_media(storage, variants=PLACEHOLDER_VARIANTS):
+    """Upload a few tiny audio/thumbnail blobs and return their references."""
+    audio = [
+        storage.upload(f"audiobooks/placeholder_{i}.mp3", PLACEHOLDER_AUDIO, "audio/mpeg")
+        for i in range(variants)
+    ]
+    thumbnails = [
+        storage.upload(f"thumbnails/placeholder_{i}.jpg", PLACEHOLDER_IMAGE, "image/jpeg")
+        for i in range(variants)
+    ]
+    return audio, thumbnails
+
+
+def power_law_weights(n, exponent, rng):
+    """Zipf-like popularity, shuffled so popularity is unrelated to id."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def chapters_per_book(n_books, mean, rng):
+    """Log-normal counts: most books are short, a long tail runs to hundreds."""
+    sigma = 0.9
+    mu = np.log(max(mean, 1)) - sigma ** 2 / 2
+    return np.clip(np.rint(rng.lognormal(mu, sigma, size=n_books)), 1, 500).astype(np.int64)
+
+
+def _timestamps(rng, size, days):
+    offsets = rng.uniform(0, days * 86400, size=size)
+    return [EPOCH + timedelta(seconds=float(seconds)) for seconds in offsets]
+
+
+def _interactions(rng, user_ids, book_ids, popularity, mean_per_user):
+    """Unique (user, book) pairs; per-user counts are geometric, books follow popularity."""
+    chunk = 100_000
+    for start in range(0, len(user_ids), chunk):
+        users = user_ids[start:start + chunk]
+        counts = rng.geometric(1.0 / (mean_per_user + 1), size=len(users)) - 1
+        owners = np.repeat(users, counts)
+        picks = book_ids[rng.choice(len(book_ids), size=len(owners), p=popularity)]
+        pairs = np.unique(np.stack([owners, picks], axis=1), axis=0)
+        yield pairs
+
+
+def generate(engine, storage, users=10_000, books=2_000, categories=30, mean_chapters=8,
+             likes_per_user=5, listens_per_user=8, creator_fraction=0.02, popularity_exponent=1.1, seed=0):
+    """Load a full synthetic dataset and rebuild the derived book_summaries and library_entries tables."""
+    from auth import hash_password
+    from database import SessionLocal
+    from utils.catalog import rebuild_book_summaries
+    from utils.library import rebuild_library
+
+    rng = np.random.default_rng(seed)
+    audio_refs, thumbnail_refs = upload_placeholder_media(storage)
+    password_hash = hash_password(PASSWORD)
+    counts = {}
+    started = time.perf_counter()
+
+    with engine.begin() as conn:
+        first_category = next_id(conn, Category)
+        first_user = next_id(conn, User)
+        first_book = next_id(conn, Audiobook)
+        first_chapter = next_id(conn, Chapter)
+
+        category_ids = np.arange(first_category, first_category + categories)
+        counts["categories"] = bulk_load(conn, Category, ["id", "name"], (
+            (int(category_id), f"Category {category_id}") for category_id in category_ids
+        ))
+
+        user_ids = np.arange(first_user, first_user + users)
+        n_creators = max(1, int(users * creator_fraction))
+        signup_times = _timestamps(rng, users, 730)
+        counts["users"] = bulk_load(conn, User, [
+            "id", "email", "full_name", "password_hash", "role", "is_verified", "created_at"
+        ], (
+            (int(user_id), EMAIL_TEMPLATE.format(user_id), f"User {user_id}", password_hash,
+             "creator" if index < n_creators else "user", True, signup_times[index])
+            for index, user_id in enumerate(user_ids)
+        ))
+
+        book_ids = np.arange(first_book, first_book + books)
+        category_popularity = power_law_weights(categories, 0.8, rng)
+        book_categories = category_ids[rng.choice(categories, size=books, p=category_popularity)]
+        book_creators = user_ids[rng.integers(0, n_creators, size=books)]
+        book_times = _timestamps(rng, books, 730)
+        counts["audiobooks"] = bulk_load(
+            conn, Audiobook, ["id", "title", "author", "description", "category_id", "creator_id", "is_public", "created_at"], (
+                (int(book_id), f"Book {book_id}", f"Author {int(book_creators[index])}",
+                 f"Synthetic audiobook {book_id} for load testing.", int(book_categories[index]),
+                 int(book_creators[index]), True, book_times[index])
+                for index, book_id in enumerate(book_ids)
+            ))
+
+        chapter_counts = chapters_per_book(books, mean_chapters, rng)
+
+        # Chapter lengths cluster around 20 minutes; the placeholder blobs themselves are tiny
+        durations = np.round(rng.lognormal(np.log(1200), 0.5, size=int(chapter_counts.sum())), 3)
+
+        def chapter_rows():
+            chapter_id = first_chapter
+            position = 0
+            for index, book_id in enumerate(book_ids):
+                variant = int(book_id) % PLACEHOLDER_VARIANTS
+                for order in range(1, int(chapter_counts[index]) + 1):
+                    yield (chapter_id, int(book_id), f"Chapter {order}", audio_refs[variant],
+                           thumbnail_refs[variant] if order == 1 else None, order, book_times[index],
+                           len(PLACEHOLDER_AUDIO), float(durations[position]), "audio/mpeg")
+                    chapter_id += 1
+                    position += 1
+
+        counts["chapters"] = bulk_load(
+            conn, Chapter, [
+                "id", "audiobook_id", "title", "audio_url", "thumbnail_url", "order", "created_at",
+                "size_bytes", "duration_seconds", "content_type",
+            ], chapter_rows()
+        )
+
+        popularity = power_law_weights(books, popularity_exponent, rng)
+
+        def like_rows():
+            for pairs in _interactions(rng, user_ids, book_ids, popularity, likes_per_user):
+                liked = _timestamps(rng, len(pairs), 730)
+                for index, (user_id, book_id) in enumerate(pairs):
+                    yield int(user_id), int(book_id), liked[index]
+
+        counts["likes"] = bulk_load(conn, Like, ["user_id", "book_id", "created_at"], like_rows())
+
+        def listen_rows():
+            for pairs in _interactions(rng, user_ids, book_ids, popularity, listens_per_user):
+                progress = rng.uniform(0.0, 1.0, size=len(pairs))
+                played = _timestamps(rng, len(pairs), 730)
+                for index, (user_id, book_id) in enumerate(pairs):
+                    yield int(user_id), int(book_id), round(float(progress[index]), 4), played[index]
+
+        counts["listening_history"] = bulk_load(
+            conn, ListeningHistory, ["user_id", "book_id", "progress", "last_played"], listen_rows()
+        )
+
+        reset_sequences(conn, [Category, User, Audiobook, Chapter, Like, ListeningHistory])
+
+    db = SessionLocal()
+    try:
+        rebuild_book_summaries(db, [int(book_id) for book_id in book_ids] if first_book > 1 else None)
+        rebuild_library(db, [int(user_id) for user_id in user_ids] if first_user > 1 else None)
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info(f"Generated {counts} in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--categories", type=int, default=30)
+    parser.add_argument("--mean-chapters", type=float, default=8)
+    parser.add_argument("--likes-per-user", type=float, default=5)
+    parser.add_argument("--listens-per-user", type=float, default=8)
+    parser.add_argument("--popularity-exponent", type=float, default=1.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from database import Base, engine
+    from logging_config import setup_logging
+    from utils.storage import get_storage
+
+    setup_logging()
+    Base.metadata.create_all(bind=engine)
+    counts = generate(
+        engine, get_storage(), users=args.users, books=args.books, categories=args.categories,
+        mean_chapters=args.mean_chapters, likes_per_user=args.likes_per_user,
+        listens_per_user=args.listens_per_user, popularity_exponent=args.popularity_exponent, seed=args.seed,
+    )
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
+import logging
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import random
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.sql.dml import UpdateBase
 from dotenv import load_dotenv
+from utils.metrics import db_replica_lag
+
+logger = logging.getLogger(__name__)
 
 # Get the directory where this file is located
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,8 +20,37 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+# Comma-separated read replicas of DATABASE_URL; empty means every query hits the primary
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# Replicas further behind than this stop receiving reads until they catch up
+MAX_REPLICA_LAG_SECONDS = float(os.getenv("MAX_REPLICA_LAG_SECONDS", 5))
+REPLICA_LAG_CHECK_SECONDS = 5
+# After a write the client reads from the primary for at least this long (longer if replicas lag more)
+PRIMARY_PIN_SECONDS = float(os.getenv("PRIMARY_PIN_SECONDS", 5))
+MAX_PRIMARY_PIN_SECONDS = 60
+PRIMARY_PIN_COOKIE = "darati_primary_until"
+PRIMARY_PIN_HEADER = "X-Darati-Primary-Until"
+
+def _connect_args(url):
+    # SQLite (benchmarks, local dev) is used from FastAPI's threadpool
+    return {"check_same_thread": False} if url.startswith("sqlite") else {}
+
+engine = create_engine(DATABASE_URL, connect_args=_connect_args(DATABASE_URL))
+replica_engines = [create_engine(url, connect_args=_connect_args(url)) for url in DATABASE_REPLICA_URLS]
+# Last measured lag per replica index; None until measured or while unreachable
+replica_lag = {index: None for index in range(len(replica_engines))}
+
+class RoutingSession(Session):
+    """Reads go to read_engine when one is set; flushes and DML always go to the primary"""
+    read_engine = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.read_engine is not None and not self._flushing and not isinstance(clause, UpdateBase):
+            return self.read_engine
+        return engine
+
+SessionLocal = sessionmaker(class_=RoutingSession, bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
 def get_db():
@@ -22,3 +59,77 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def choose_replica():
+    """A random replica within the lag budget, or None to read from the primary"""
+    healthy = [
+        replica_engines[index] for index, lag in replica_lag.items()
+        if lag is not None and lag <= MAX_REPLICA_LAG_SECONDS
+    ]
+    return random.choice(healthy) if healthy else None
+
+def read_session(primary=False):
+    db = SessionLocal()
+    if not primary:
+        db.read_engine = choose_replica()
+    return db
+
+def primary_pin_seconds():
+    """Long enough for every usable replica to have replayed the write"""
+    lags = [lag for lag in replica_lag.values() if lag is not None and lag <= MAX_REPLICA_LAG_SECONDS]
+    return min(MAX_PRIMARY_PIN_SECONDS, max([PRIMARY_PIN_SECONDS] + [lag + 1 for lag in lags]))
+
+def pin_to_primary(response):
+    """Mark the client that just wrote so its next reads see the write (read-your-writes)"""
+    if not replica_engines:
+        return
+    seconds = primary_pin_seconds()
+    until = str(int(time.time() + seconds) + 1)
+    response.set_cookie(PRIMARY_PIN_COOKIE, until, max_age=int(seconds) + 1, httponly=True, samesite="lax")
+    # Non-browser clients without a cookie jar can echo this header back instead
+    response.headers[PRIMARY_PIN_HEADER] = until
+
+def is_pinned_to_primary(request: Request):
+    value = request.cookies.get(PRIMARY_PIN_COOKIE) or request.headers.get(PRIMARY_PIN_HEADER)
+    if not value or not replica_engines:
+        return False
+    try:
+        until = float(value)
+    except ValueError:
+        return False
+    now = time.time()
+    # Client-supplied, so never honour a pin longer than we would have issued
+    return now < until <= now + MAX_PRIMARY_PIN_SECONDS + 1
+
+def get_read_db(request: Request):
+    """Session for read-only handlers: a replica, unless the client recently wrote"""
+    db = read_session(primary=is_pinned_to_primary(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Postgres standby: zero when everything received has been replayed, otherwise the age of the last replayed commit
+_PG_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+def check_replica_lag():
+    """Measure every replica once; unreachable replicas are taken out of rotation"""
+    for index, replica in enumerate(replica_engines):
+        try:
+            with replica.connect() as conn:
+                if replica.dialect.name == "postgresql":
+                    lag = float(conn.execute(_PG_LAG_QUERY).scalar() or 0.0)
+                else:
+                    # No portable lag query; a reachable replica is assumed current
+                    conn.execute(text("SELECT 1"))
+                    lag = 0.0
+        except Exception as e:
+            logger.error(f"Replica {index} unreachable: {str(e)}")
+            lag = None
+        if lag is not None and lag > MAX_REPLICA_LAG_SECONDS and (replica_lag[index] or 0) <= MAX_REPLICA_LAG_SECONDS:
+            logger.warning(f"Replica {index} is {lag:.1f}s behind, routing its reads to other engines")
+        replica_lag[index] = lag
+        db_replica_lag.set(-1 if lag is None else lag, (f"replica{index}",))
@@ -0,0 +1,70 @@
+"""Fill size, duration and content type for chapters uploaded before they were recorded.
+
+Reads blob properties and the first HEAD_BYTES of each file from storage, so it
+never downloads whole audiobooks. Safe to re-run; only rows with NULL
+size_bytes are touched.
+
+    python -m jobs.backfill_chapter_media --batch-size 200
+"""
+import argparse
+import logging
+
+from sqlalchemy import select, update
+
+from database import SessionLocal
+from logging_config import setup_logging
+from models import Chapter
+from utils.audio_metadata import HEAD_BYTES, audio_duration
+from utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(db, batch_size=200):
+    storage = get_storage()
+    last_id, updated, failed = 0, 0, 0
+    while True:
+        rows = db.execute(
+            select(Chapter.id, Chapter.audio_url)
+            .where(Chapter.id > last_id, Chapter.size_bytes.is_(None))
+            .order_by(Chapter.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for chapter_id, audio_url in rows:
+            try:
+                info = storage.properties(audio_url)
+                head = storage.download_range(audio_url, 0, min(HEAD_BYTES, info.size))
+                duration = audio_duration(head, info.size, info.content_type)
+            except Exception as e:
+                logger.error(f"Could not inspect chapter {chapter_id}: {str(e)}")
+                failed += 1
+                continue
+            db.execute(
+                update(Chapter).where(Chapter.id == chapter_id).values(
+                    size_bytes=info.size, duration_seconds=duration, content_type=info.content_type
+                )
+            )
+            updated += 1
+        db.commit()
+        last_id = rows[-1][0]
+        logger.info(f"Backfilled {updated} chapters so far ({failed} failed)")
+    return updated, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill chapter size/duration/content type")
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_logging()
+    db = SessionLocal()
+    try:
+        backfill(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Offline job that rebuilds the book_similarities table.
+
+Run from the backend directory:
+
+    python -m jobs.build_item_similarity --top-k 20
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+
+from database import SessionLocal
+from logging_config import setup_logging
+from models import BookSimilarity, Like, ListeningHistory
+from utils.item_similarity import (
+    LIKE_WEIGHT,
+    LISTEN_WEIGHT,
+    PROGRESS_WEIGHT,
+    build_interaction_matrix,
+    similarity_rows,
+    top_k_similar_items,
+)
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = 5000
+
+
+def load_interactions(db):
+    """Read likes and listening history as flat arrays without building ORM objects."""
+    user_ids, book_ids, weights = [], [], []
+
+    likes = db.execute(select(Like.user_id, Like.book_id).where(Like.user_id.isnot(None), Like.book_id.isnot(None)))
+    for user_id, book_id in likes:
+        user_ids.append(user_id)
+        book_ids.append(book_id)
+        weights.append(LIKE_WEIGHT)
+
+    listens = db.execute(
+        select(ListeningHistory.user_id, ListeningHistory.book_id, ListeningHistory.progress)
+        .where(ListeningHistory.user_id.isnot(None), ListeningHistory.book_id.isnot(None))
+    )
+    for user_id, book_id, progress in listens:
+        user_ids.append(user_id)
+        book_ids.append(book_id)
+        weights.append(LISTEN_WEIGHT + PROGRESS_WEIGHT * min(max(progress or 0.0, 0.0), 1.0))
+
+    return np.array(user_ids, dtype=np.int64), np.array(book_ids, dtype=np.int64), np.array(weights, dtype=np.float32)
+
+
+def rebuild_similarities(db, top_k=20):
+    started = time.perf_counter()
+    user_ids, book_ids, weights = load_interactions(db)
+    logger.info(f"Loaded {len(weights)} interactions")
+
+    matrix, book_index = build_interaction_matrix(user_ids, book_ids, weights)
+    neighbors, scores = top_k_similar_items(matrix, k=top_k)
+
+    # Swap the whole table in one transaction so readers never see a half-built result
+    db.execute(delete(BookSimilarity))
+    batch, written = [], 0
+    for book_id, rank, similar_book_id, score in similarity_rows(book_index, neighbors, scores):
+        batch.append({"book_id": book_id, "rank": rank, "similar_book_id": similar_book_id, "score": score})
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.execute(insert(BookSimilarity), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.execute(insert(BookSimilarity), batch)
+        written += len(batch)
+    db.commit()
+
+    logger.info(
+        f"Stored {written} neighbours for {len(book_index)} books in {time.perf_counter() - started:.2f}s"
+    )
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the 'listeners also liked' table")
+    parser.add_argument("--top-k", type=int, default=20, help="neighbours stored per book")
+    args = parser.parse_args()
+
+    setup_logging()
+    db = SessionLocal()
+    try:
+        rebuild_similarities(db, top_k=args.top_k)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Dump the catalog as NDJSON (see utils.catalog_transfer). Run from the backend directory:
+
+    python -m jobs.export_catalog -o catalog.ndjson.gz
+    python -m jobs.export_catalog --tables users,likes > analytics.ndjson
+
+Tables the selected rows reference are exported too (likes also brings
+audiobooks and categories), so the dump can always be imported. Rows are read through a server-side cursor, so memory stays flat however
+large the tables are. A path ending in .gz is gzip-compressed.
+"""
+import argparse
+import gzip
+import logging
+import sys
+
+from database import choose_replica, engine
+from logging_config import setup_logging
+from utils.catalog_transfer import TRANSFER_TABLES, export_ndjson
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the catalog as NDJSON")
+    parser.add_argument("-o", "--output", default="-", help="file to write, or - for stdout")
+    parser.add_argument("--tables", help=f"comma-separated subset of {', '.join(TRANSFER_TABLES)}")
+    parser.add_argument("--include-credentials", action="store_true", help="also export password hashes")
+    args = parser.parse_args()
+
+    tables = args.tables.split(",") if args.tables else None
+    unknown = set(tables or ()) - set(TRANSFER_TABLES)
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    setup_logging()
+    if args.output == "-":
+        output = sys.stdout.buffer
+    elif args.output.endswith(".gz"):
+        output = gzip.open(args.output, "wb")
+    else:
+        output = open(args.output, "wb")
+    try:
+        # A replica when one is healthy; the dump is a long read the primary needn't serve
+        with (choose_replica() or engine).connect() as conn:
+            for chunk in export_ndjson(conn, tables, include_credentials=args.include_credentials):
+                output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
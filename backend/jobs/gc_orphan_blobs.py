@@ -0,0 +1,36 @@
+"""Delete media blobs that no chapter, banner or book summary references.
+
+See utils.blob_gc for how orphans are found. Run from the backend directory,
+with --dry-run first to see what would go:
+
+    python -m jobs.gc_orphan_blobs --dry-run
+    python -m jobs.gc_orphan_blobs --grace-hours 48
+"""
+import argparse
+import logging
+
+from database import SessionLocal
+from logging_config import setup_logging
+from utils.blob_gc import GRACE_PERIOD_SECONDS, collect_orphans
+from utils.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Garbage-collect unreferenced media blobs")
+    parser.add_argument("--grace-hours", type=float, default=GRACE_PERIOD_SECONDS / 3600,
+                        help="only blobs older than this are deleted")
+    parser.add_argument("--dry-run", action="store_true", help="report orphans without deleting them")
+    args = parser.parse_args()
+
+    setup_logging()
+    db = SessionLocal()
+    try:
+        collect_orphans(db, get_storage(), grace_period=args.grace_hours * 3600, dry_run=args.dry_run)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Load an NDJSON catalog dump written by jobs.export_catalog or GET /api/admin/export.
+
+    python -m jobs.import_catalog catalog.ndjson.gz
+
+Ids are re-allocated and foreign keys re-linked; rows already present (same
+email, category name, book, like, ...) are not duplicated, so a dump can be
+loaded twice safely. See utils.catalog_transfer. Everything is committed in
+one transaction, or nothing is.
+"""
+import argparse
+import gzip
+import json
+import logging
+import sys
+
+from database import SessionLocal
+from logging_config import setup_logging
+from utils.catalog_transfer import import_ndjson
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import an NDJSON catalog dump")
+    parser.add_argument("input", help="file to read (.gz is decompressed), or - for stdin")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.input == "-":
+        source = sys.stdin.buffer
+    elif args.input.endswith(".gz"):
+        source = gzip.open(args.input, "rb")
+    else:
+        source = open(args.input, "rb")
+    db = SessionLocal()
+    try:
+        counts = import_ndjson(db, source)
+        db.commit()
+        print(json.dumps(counts))
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        if source is not sys.stdin.buffer:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
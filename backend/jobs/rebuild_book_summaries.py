@@ -0,0 +1,28 @@
+"""Recompute the book_summaries read model from the source tables.
+
+Only needed after out-of-band SQL changes; normal writes keep it up to date.
+
+    python -m jobs.rebuild_book_summaries
+"""
+import logging
+
+from database import SessionLocal
+from logging_config import setup_logging
+from utils.catalog import rebuild_book_summaries
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    setup_logging()
+    db = SessionLocal()
+    try:
+        rebuild_book_summaries(db)
+        db.commit()
+        logger.info("Rebuilt book summaries")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Central logging setup: structured JSON, request IDs, off-thread I/O.
+
+Call setup_logging() once per process. Modules keep using
+logging.getLogger(__name__); nothing else calls basicConfig.
+
+- Records are handed to a QueueHandler and written by a QueueListener thread,
+  so a slow stdout/pipe never blocks a request.
+- Every record carries the request ID of the request that emitted it.
+- Records below WARNING are rate limited per logger (LOG_RATE_PER_SECOND,
+  LOG_BURST), so a per-item debug line inside a loop can't flood the pipeline.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logger for records below WARNING; dropped counts are reported"""
+
+    def __init__(self, rate_per_second, burst):
+        super().__init__()
+        self.rate = rate_per_second
+        self.burst = burst
+        self._buckets = {}  # logger name -> [tokens, last refill, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            dropped, bucket[2] = bucket[2], 0
+        if dropped:
+            record.dropped = dropped
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        dropped = getattr(record, "dropped", None)
+        if dropped:
+            entry["dropped_since_last"] = dropped
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    _exception_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        # Resolve only what can't cross threads (args, traceback objects);
+        # JSON formatting and the actual write happen on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level=None):
+    global _listener
+    if _listener is not None:
+        return
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    log_queue = queue.SimpleQueue()
+
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(RateLimitFilter(
+        float(os.getenv("LOG_RATE_PER_SECOND", 50)),
+        float(os.getenv("LOG_BURST", 200)),
+    ))
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        # Drains whatever is still queued before returning
+        _listener.stop()
+        _listener = None
+
+
+class RequestIdMiddleware:
+    """Takes X-Request-ID from the client (or makes one) and echoes it back"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,29 +1,65 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from auth import router as auth_router
 from models import Base
-from database import engine
+from database import engine, SessionLocal, replica_engines, check_replica_lag, REPLICA_LAG_CHECK_SECONDS
 from routes.upload_routes import router as upload_router
 from routes.category_routes import router as category_router
 from routes.user_books_routes import router as user_books_router
 from routes.banner_routes import router as banner_router
 from routes.book_routes import router as book_router
+from routes.activity_routes import router as activity_router
+from routes.trending_routes import router as trending_router
+from routes.home_routes import router as home_router
+from routes.stream_routes import router as stream_router
+from routes.media_routes import router as media_router
+from routes.progress_routes import router as progress_router
+from routes.admin_routes import router as admin_router
+from utils.trending import load_trending, checkpoint_trending, CHECKPOINT_INTERVAL_SECONDS
+from utils.content_index import content_index
+from utils.blob_gc import collect_orphans
+from utils.storage import get_storage
+from utils.metrics import MetricsMiddleware, instrument_engine, render_metrics
+from utils.query_log import instrument_queries
+from utils.negotiation import ContentNegotiationMiddleware
+from utils.profiling import ProfilingMiddleware
+from utils.admin import ADMIN_API_KEY
+from utils.rate_limit import RateLimitMiddleware
+from utils.upload_guard import UploadGuardMiddleware
+from logging_config import setup_logging, RequestIdMiddleware
+from schemas import HealthResponse, MessageResponse
+import asyncio
 import logging
+import os
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Structured, queue-backed logging for the whole process
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Create all tables on startup
 Base.metadata.create_all(bind=engine)
 
+# Count and time every SQL statement for /metrics, and fingerprint it for the slow-query log
+for database_engine in [engine] + replica_engines:
+    instrument_engine(database_engine)
+    instrument_queries(database_engine)
+
 # Create the FastAPI app
 app = FastAPI(
     title="Darati API",
     description="API for the Darati audiobook platform",
-    version="1.0.0"
+    version="1.0.0",
+    # Routes return validated response models; orjson renders them several times faster than json.dumps
+    default_response_class=ORJSONResponse
 )
 
+# Innermost: sniffs and size-checks upload bodies as they stream in, after the rate limiter admitted them
+app.add_middleware(UploadGuardMiddleware)
+
+# Per-client token buckets and per-route-class concurrency caps; inside CORS so 429/503 carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +69,17 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# gzip/brotli and msgpack negotiation; inside metrics so response sizes are bytes on the wire
+app.add_middleware(ContentNegotiationMiddleware)
+# X-Profile requests from admins; inside metrics so the profile can report the request's SQL time.
+# Without an admin key nobody can ask for a profile, so the middleware isn't installed at all
+if ADMIN_API_KEY:
+    app.add_middleware(ProfilingMiddleware)
+# Outermost, so latency includes CORS and every other middleware
+app.add_middleware(MetricsMiddleware)
+# Added last so it wraps everything and every log line of a request carries its ID
+app.add_middleware(RequestIdMiddleware)
+
 # Include routers with explicit prefixes
 app.include_router(auth_router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(upload_router, prefix="/api/audio", tags=["Upload"])
@@ -40,20 +87,113 @@ app.include_router(category_router, prefix="/api", tags=["Categories"])
 app.include_router(user_books_router, prefix="/api", tags=["User Books"])
 app.include_router(banner_router, prefix="/api/banners", tags=["Banners"])
 app.include_router(book_router, prefix="/api/books", tags=["Books"])
+app.include_router(activity_router, prefix="/api/books", tags=["Activity"])
+app.include_router(trending_router, prefix="/api", tags=["Trending"])
+app.include_router(home_router, prefix="/api", tags=["Home"])
+app.include_router(stream_router, prefix="/api/chapters", tags=["Streaming"])
+app.include_router(media_router, prefix="/api/media", tags=["Media"])
+app.include_router(progress_router, prefix="/api/uploads", tags=["Uploads"])
+app.include_router(admin_router, prefix="/api/admin", tags=["Admin"])
 
-@app.get("/")
+@app.get("/", response_model=MessageResponse)
 def read_root():
     logger.info("Root endpoint accessed")
     return {"message": "Welcome to the Darati API"}
 
-@app.get("/health")
+@app.get("/health", response_model=HealthResponse)
 def health_check():
-    logger.info("Health check endpoint accessed")
+    logger.debug("Health check endpoint accessed")
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Log all registered routes
 @app.on_event("startup")
 async def log_routes():
     logger.info("Registered routes:")
     for route in app.routes:
-        logger.info(f"{route.methods} {route.path}")
+        logger.debug("%s %s", getattr(route, "methods", None), route.path)
+
+async def checkpoint_trending_periodically():
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(checkpoint_trending)
+        except Exception as e:
+            logger.error(f"Trending checkpoint failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_trending():
+    await asyncio.to_thread(load_trending)
+    app.state.trending_task = asyncio.create_task(checkpoint_trending_periodically())
+
+def build_content_index():
+    db = SessionLocal()
+    try:
+        content_index.sync(db, force=True)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+async def start_content_index():
+    # Index the whole catalog before serving, so requests only ever sync what is new
+    try:
+        await asyncio.to_thread(build_content_index)
+        logger.info(f"Content index holds {len(content_index)} books")
+    except Exception as e:
+        logger.error(f"Content index build failed: {str(e)}")
+
+async def check_replica_lag_periodically():
+    while True:
+        try:
+            await asyncio.to_thread(check_replica_lag)
+        except Exception as e:
+            logger.error(f"Replica lag check failed: {str(e)}")
+        await asyncio.sleep(REPLICA_LAG_CHECK_SECONDS)
+
+@app.on_event("startup")
+async def start_replica_monitor():
+    # Replicas receive no reads until their lag has been measured once
+    if replica_engines:
+        app.state.replica_task = asyncio.create_task(check_replica_lag_periodically())
+
+@app.on_event("shutdown")
+async def stop_replica_monitor():
+    if replica_engines:
+        app.state.replica_task.cancel()
+
+# Hours between orphaned-blob sweeps; 0 disables. Enable it on one instance only
+BLOB_GC_INTERVAL_HOURS = float(os.getenv("BLOB_GC_INTERVAL_HOURS", 0))
+
+def collect_orphaned_blobs():
+    db = SessionLocal()
+    try:
+        collect_orphans(db, get_storage())
+    finally:
+        db.close()
+
+async def collect_orphaned_blobs_periodically():
+    while True:
+        await asyncio.sleep(BLOB_GC_INTERVAL_HOURS * 3600)
+        try:
+            await asyncio.to_thread(collect_orphaned_blobs)
+        except Exception as e:
+            logger.error(f"Blob garbage collection failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_blob_gc():
+    if BLOB_GC_INTERVAL_HOURS > 0:
+        app.state.blob_gc_task = asyncio.create_task(collect_orphaned_blobs_periodically())
+
+@app.on_event("shutdown")
+async def stop_blob_gc():
+    if BLOB_GC_INTERVAL_HOURS > 0:
+        app.state.blob_gc_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_trending():
+    app.state.trending_task.cancel()
+    # Flush whatever this worker saw since the last checkpoint
+    await asyncio.to_thread(checkpoint_trending)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Float, DateTime, func
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, ForeignKey, Text, Float, DateTime, func, Index, PrimaryKeyConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -51,12 +51,16 @@ class Chapter(Base):
     __tablename__ = "chapters"
 
     id = Column(Integer, primary_key=True, index=True)
-    audiobook_id = Column(Integer, ForeignKey("audiobooks.id"), nullable=False)
+    audiobook_id = Column(Integer, ForeignKey("audiobooks.id"), nullable=False, index=True)
     title = Column(String, nullable=False)
     audio_url = Column(String, nullable=False)
     thumbnail_url = Column(String)
     order = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Recorded at upload so players can plan prefetching without probing the file
+    size_bytes = Column(BigInteger, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    content_type = Column(String, nullable=True)
 
     audiobook = relationship("Audiobook", back_populates="chapters")
 
@@ -81,6 +85,8 @@ class Like(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     book_id = Column(Integer, ForeignKey("audiobooks.id"))
+    # NULL for likes recorded before the column existed
+    created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="likes")
     book = relationship("Audiobook", back_populates="likes")
@@ -101,4 +107,83 @@ class Banner(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     def __repr__(self):
-        return f"<Banner {self.id}>"
\ No newline at end of file
+        return f"<Banner {self.id}>"
+
+
+class BookSimilarity(Base):
+    """Precomputed "listeners also liked" neighbours, written by jobs/build_item_similarity.py"""
+    __tablename__ = "book_similarities"
+
+    book_id = Column(Integer, ForeignKey("audiobooks.id", ondelete="CASCADE"), nullable=False)
+    rank = Column(Integer, nullable=False)
+    similar_book_id = Column(Integer, ForeignKey("audiobooks.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+    # (book_id, rank) is the only access path, so the primary key doubles as the lookup index
+    __table_args__ = (PrimaryKeyConstraint("book_id", "rank"),)
+
+
+class TrendingScore(Base):
+    """Checkpointed log-space trending score, see utils/trending.py"""
+    __tablename__ = "trending_scores"
+
+    book_id = Column(Integer, ForeignKey("audiobooks.id", ondelete="CASCADE"), primary_key=True)
+    log_score = Column(Float, nullable=False, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BookSummary(Base):
+    """Denormalized catalog row per book, kept in step with writes by utils/catalog.py"""
+    __tablename__ = "book_summaries"
+
+    book_id = Column(Integer, ForeignKey("audiobooks.id", ondelete="CASCADE"), primary_key=True)
+    title = Column(String, nullable=False)
+    author = Column(String, nullable=False)
+    description = Column(String)
+    category_id = Column(Integer)
+    category_name = Column(String)
+    creator_id = Column(Integer, index=True)
+    is_public = Column(Boolean, default=True)
+    # Raw stored blob URLs of the first chapter, signed at read time
+    cover_thumbnail_url = Column(String)
+    first_chapter_audio_url = Column(String)
+    total_chapters = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, index=True)
+
+
+class IdempotencyKey(Base):
+    """Outcome of a write sent with an Idempotency-Key header, see utils/idempotency.py"""
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    # NULL while the first request with this key is still running
+    status_code = Column(Integer)
+    response_body = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (PrimaryKeyConstraint("scope", "key"),)
+
+
+class LibraryEntry(Base):
+    """One row per book in a user's personal library (owned, liked or played), kept in step by utils/library.py"""
+    __tablename__ = "library_entries"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    book_id = Column(Integer, ForeignKey("audiobooks.id", ondelete="CASCADE"), nullable=False)
+    last_activity = Column(DateTime, nullable=False)
+    owned = Column(Boolean, nullable=False, default=False)
+    liked = Column(Boolean, nullable=False, default=False)
+    # NULL until the user has played the book
+    progress = Column(Float)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("user_id", "book_id"),
+        # The library page is a keyset range over this index; INCLUDE makes it index-only on Postgres
+        Index(
+            "ix_library_entries_user_activity", "user_id", "last_activity", "book_id",
+            postgresql_include=["owned", "liked", "progress"],
+        ),
+    )
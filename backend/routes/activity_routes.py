@@ -0,0 +1,64 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from database import get_db
+from models import Audiobook, Like, ListeningHistory
+from schemas import LikeCreate, LikeResponse, ProgressUpdate, ProgressResponse
+from utils.trending import trending, PLAY_WEIGHT, LIKE_WEIGHT
+from utils.library import record_activity
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Progress reports closer together than this belong to the same listening session
+PLAY_SESSION_GAP = timedelta(minutes=30)
+
+def _require_book(db: Session, book_id: int):
+    if not db.query(Audiobook.id).filter(Audiobook.id == book_id).first():
+        raise HTTPException(status_code=404, detail="Book not found")
+
+@router.post("/{book_id}/like", tags=["Activity"], response_model=LikeResponse)
+def like_book(book_id: int, like: LikeCreate, db: Session = Depends(get_db)):
+    _require_book(db, book_id)
+
+    existing = db.query(Like.id).filter(Like.user_id == like.user_id, Like.book_id == book_id).first()
+    if existing:
+        return {"message": "Already liked", "like_id": existing.id}
+
+    now = datetime.utcnow()
+    new_like = Like(user_id=like.user_id, book_id=book_id, created_at=now)
+    db.add(new_like)
+    record_activity(db, like.user_id, book_id, now, liked=True)
+    db.commit()
+
+    trending.record(book_id, LIKE_WEIGHT)
+    logger.info(f"User {like.user_id} liked book {book_id}")
+    return {"message": "Book liked", "like_id": new_like.id}
+
+@router.post("/{book_id}/progress", tags=["Activity"], response_model=ProgressResponse)
+def update_progress(book_id: int, update: ProgressUpdate, db: Session = Depends(get_db)):
+    _require_book(db, book_id)
+    progress = min(max(update.progress, 0.0), 1.0)
+    now = datetime.utcnow()
+
+    history = db.query(ListeningHistory).filter(
+        ListeningHistory.user_id == update.user_id,
+        ListeningHistory.book_id == book_id
+    ).first()
+
+    # Only the first report of a listening session counts as a play
+    new_session = history is None or history.last_played is None or now - history.last_played > PLAY_SESSION_GAP
+
+    if history is None:
+        history = ListeningHistory(user_id=update.user_id, book_id=book_id)
+        db.add(history)
+    history.progress = progress
+    history.last_played = now
+    record_activity(db, update.user_id, book_id, now, progress=progress)
+    db.commit()
+
+    if new_session:
+        trending.record(book_id, PLAY_WEIGHT)
+    return {"message": "Progress saved", "progress": progress}
@@ -0,0 +1,266 @@
+from datetime import datetime
+from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import Session
+from database import choose_replica, engine, get_db
+from models import (
+    Audiobook, Banner, BookSimilarity, BookSummary, Category, Chapter, LibraryEntry, Like, ListeningHistory,
+    TrendingScore,
+)
+from schemas import (
+    AdminOperationResponse, BannerSelection, BookBulkUpdate, BookSelection, ChapterSelection, ProfileSummary,
+    QueryLogResponse,
+)
+from routes.home_routes import invalidate_shared_sections
+from routes.stream_routes import forget_chapters
+from utils.admin import chunked, delete_blobs, require_admin
+from utils.catalog import rebuild_book_summaries
+from utils.catalog_transfer import TRANSFER_TABLES, export_ndjson
+from utils.content_index import content_index
+from utils.profiling import profiles
+from utils.progress import progress, valid_upload_id
+from utils.query_log import query_log
+from utils.trending import trending
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+def _operation_id(x_operation_id):
+    # Progress goes to /api/uploads/{id}/events, the same channel uploads use
+    return x_operation_id if valid_upload_id(x_operation_id) else None
+
+def _select_books(db: Session, selection: BookSelection):
+    if selection.book_ids is None and selection.creator_id is None:
+        raise HTTPException(status_code=400, detail="Give book_ids, creator_id or both")
+    query = select(Audiobook.id)
+    if selection.book_ids is not None:
+        query = query.where(Audiobook.id.in_(selection.book_ids))
+    if selection.creator_id is not None:
+        query = query.where(Audiobook.creator_id == selection.creator_id)
+    return db.execute(query.order_by(Audiobook.id)).scalars().all()
+
+def _chapter_blobs(db: Session, chapter_filter):
+    references = []
+    for audio_url, thumbnail_url in db.execute(select(Chapter.audio_url, Chapter.thumbnail_url).where(chapter_filter)):
+        references.extend((audio_url, thumbnail_url))
+    return references
+
+def _renumber_chapters(db: Session, book_ids):
+    """Close the gaps deleted chapters leave, so the next upload's order (count + 1) stays unique"""
+    # Computed up front: a correlated UPDATE would see its own earlier writes on SQLite
+    position = func.row_number().over(partition_by=Chapter.audiobook_id, order_by=(Chapter.order, Chapter.id))
+    renumbered = [
+        {"id": chapter_id, "order": new_order}
+        for chapter_id, order, new_order in db.execute(
+            select(Chapter.id, Chapter.order, position).where(Chapter.audiobook_id.in_(book_ids))
+        )
+        if order != new_order
+    ]
+    if renumbered:
+        # Bulk UPDATE by primary key, one executemany
+        db.execute(update(Chapter), renumbered)
+
+@router.post("/books/delete", tags=["Admin"], response_model=AdminOperationResponse)
+def delete_books(selection: BookSelection, x_operation_id: str = Header(None), db: Session = Depends(get_db)):
+    """Delete books with their chapters, activity and derived rows, then their media"""
+    operation_id = _operation_id(x_operation_id)
+    try:
+        book_ids = _select_books(db, selection)
+        references, chapter_ids, processed = [], [], 0
+        for chunk in chunked(book_ids):
+            references.extend(_chapter_blobs(db, Chapter.audiobook_id.in_(chunk)))
+            chapter_ids.extend(db.execute(select(Chapter.id).where(Chapter.audiobook_id.in_(chunk))).scalars())
+            # Children first; SQLite doesn't enforce ON DELETE CASCADE, so nothing is left to it
+            for statement in (
+                delete(LibraryEntry).where(LibraryEntry.book_id.in_(chunk)),
+                delete(Like).where(Like.book_id.in_(chunk)),
+                delete(ListeningHistory).where(ListeningHistory.book_id.in_(chunk)),
+                delete(BookSimilarity).where(
+                    or_(BookSimilarity.book_id.in_(chunk), BookSimilarity.similar_book_id.in_(chunk))
+                ),
+                delete(TrendingScore).where(TrendingScore.book_id.in_(chunk)),
+                delete(BookSummary).where(BookSummary.book_id.in_(chunk)),
+                delete(Chapter).where(Chapter.audiobook_id.in_(chunk)),
+                delete(Audiobook).where(Audiobook.id.in_(chunk)),
+            ):
+                db.execute(statement.execution_options(synchronize_session=False))
+            processed += len(chunk)
+            progress.publish(operation_id, "deleting_rows", done=processed, total=len(book_ids))
+        db.commit()
+        invalidate_shared_sections()
+        forget_chapters(chapter_ids)
+        trending.forget(book_ids)
+        for chunk in chunked(book_ids):
+            content_index.remove_books(chunk)
+        logger.info(f"Deleted {len(book_ids)} books")
+
+        blobs_deleted = delete_blobs(db, references, operation_id)
+        result = {"message": "Books deleted", "matched": len(book_ids), "blobs_deleted": blobs_deleted}
+        progress.publish(operation_id, "complete", **result)
+        return result
+    except HTTPException as he:
+        progress.publish(operation_id, "error", status=he.status_code, detail=he.detail)
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting books: {str(e)}")
+        progress.publish(operation_id, "error", status=500, detail="Error deleting books")
+        raise HTTPException(status_code=500, detail=f"Error deleting books: {str(e)}")
+
+@router.post("/books/update", tags=["Admin"], response_model=AdminOperationResponse)
+def update_books(changes: BookBulkUpdate, x_operation_id: str = Header(None), db: Session = Depends(get_db)):
+    """Recategorize, re-attribute, edit descriptions or hide/unhide books in bulk"""
+    operation_id = _operation_id(x_operation_id)
+    values = changes.model_dump(include={"category_id", "author", "description", "is_public"}, exclude_none=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="Nothing to change")
+    try:
+        summary_values = dict(values)
+        if "category_id" in values:
+            category_name = db.execute(select(Category.name).where(Category.id == values["category_id"])).scalar()
+            if category_name is None:
+                raise HTTPException(status_code=404, detail="Category not found")
+            summary_values["category_name"] = category_name
+
+        book_ids = _select_books(db, changes)
+        processed = 0
+        for chunk in chunked(book_ids):
+            db.execute(
+                update(Audiobook).where(Audiobook.id.in_(chunk)).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            db.execute(
+                update(BookSummary).where(BookSummary.book_id.in_(chunk)).values(**summary_values)
+                .execution_options(synchronize_session=False)
+            )
+            processed += len(chunk)
+            progress.publish(operation_id, "updating_rows", done=processed, total=len(book_ids))
+        db.commit()
+        invalidate_shared_sections()
+        if "is_public" in values:
+            for chunk in chunked(book_ids):
+                forget_chapters(db.execute(select(Chapter.id).where(Chapter.audiobook_id.in_(chunk))).scalars())
+        if values.keys() & {"category_id", "author", "description"}:
+            for chunk in chunked(book_ids):
+                content_index.refresh(db, chunk)
+        logger.info(f"Updated {sorted(values)} on {len(book_ids)} books")
+
+        result = {"message": "Books updated", "matched": len(book_ids)}
+        progress.publish(operation_id, "complete", **result)
+        return result
+    except HTTPException as he:
+        progress.publish(operation_id, "error", status=he.status_code, detail=he.detail)
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error updating books: {str(e)}")
+        progress.publish(operation_id, "error", status=500, detail="Error updating books")
+        raise HTTPException(status_code=500, detail=f"Error updating books: {str(e)}")
+
+@router.post("/chapters/delete", tags=["Admin"], response_model=AdminOperationResponse)
+def delete_chapters(selection: ChapterSelection, x_operation_id: str = Header(None), db: Session = Depends(get_db)):
+    """Delete chapters, renumber what remains and refresh the affected book summaries"""
+    operation_id = _operation_id(x_operation_id)
+    try:
+        references, book_ids, deleted = [], set(), 0
+        for chunk in chunked(selection.chapter_ids):
+            book_ids.update(db.execute(
+                select(Chapter.audiobook_id).distinct().where(Chapter.id.in_(chunk))
+            ).scalars())
+            references.extend(_chapter_blobs(db, Chapter.id.in_(chunk)))
+            deleted += db.execute(
+                delete(Chapter).where(Chapter.id.in_(chunk)).execution_options(synchronize_session=False)
+            ).rowcount
+            progress.publish(operation_id, "deleting_rows", done=deleted, total=len(selection.chapter_ids))
+        for chunk in chunked(sorted(book_ids)):
+            _renumber_chapters(db, chunk)
+            # Chapter count and cover come from the first remaining chapter
+            rebuild_book_summaries(db, chunk)
+        db.commit()
+        invalidate_shared_sections()
+        forget_chapters(selection.chapter_ids)
+        logger.info(f"Deleted {deleted} chapters from {len(book_ids)} books")
+
+        blobs_deleted = delete_blobs(db, references, operation_id)
+        result = {"message": "Chapters deleted", "matched": deleted, "blobs_deleted": blobs_deleted}
+        progress.publish(operation_id, "complete", **result)
+        return result
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting chapters: {str(e)}")
+        progress.publish(operation_id, "error", status=500, detail="Error deleting chapters")
+        raise HTTPException(status_code=500, detail=f"Error deleting chapters: {str(e)}")
+
+@router.post("/banners/delete", tags=["Admin"], response_model=AdminOperationResponse)
+def delete_banners(selection: BannerSelection, x_operation_id: str = Header(None), db: Session = Depends(get_db)):
+    operation_id = _operation_id(x_operation_id)
+    try:
+        references, deleted = [], 0
+        for chunk in chunked(selection.banner_ids):
+            references.extend(db.execute(select(Banner.image_url).where(Banner.id.in_(chunk))).scalars())
+            deleted += db.execute(
+                delete(Banner).where(Banner.id.in_(chunk)).execution_options(synchronize_session=False)
+            ).rowcount
+        db.commit()
+        invalidate_shared_sections()
+        logger.info(f"Deleted {deleted} banners")
+
+        blobs_deleted = delete_blobs(db, references, operation_id)
+        result = {"message": "Banners deleted", "matched": deleted, "blobs_deleted": blobs_deleted}
+        progress.publish(operation_id, "complete", **result)
+        return result
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error deleting banners: {str(e)}")
+        progress.publish(operation_id, "error", status=500, detail="Error deleting banners")
+        raise HTTPException(status_code=500, detail=f"Error deleting banners: {str(e)}")
+
+@router.get("/export", tags=["Admin"])
+def export_catalog(
+    tables: str = Query(None, description=f"Comma-separated subset of {', '.join(TRANSFER_TABLES)}"),
+    include_credentials: bool = False,
+):
+    """Stream the catalog as NDJSON (see utils/catalog_transfer.py); load it with jobs.import_catalog"""
+    selected = tables.split(",") if tables else None
+    unknown = set(selected or ()) - set(TRANSFER_TABLES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(sorted(unknown))}")
+
+    def stream():
+        # Own connection for the life of the response; a replica when one is healthy
+        with (choose_replica() or engine).connect() as conn:
+            yield from export_ndjson(conn, selected, include_credentials=include_credentials)
+
+    logger.info(f"Exporting {selected or 'all tables'}{' with credentials' if include_credentials else ''}")
+    filename = f"catalog-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson"
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/queries", tags=["Admin"], response_model=QueryLogResponse)
+def slow_queries(limit: int = Query(50, ge=1, le=500)):
+    """This worker's slow-query log: costliest fingerprints, recent slow statements with plans, N+1 suspects"""
+    return query_log.report(limit)
+
+@router.get("/profiles", tags=["Admin"], response_model=List[ProfileSummary])
+def list_profiles():
+    """Profiles recorded by this worker for requests sent with X-Profile: 1, newest first"""
+    return profiles.list()
+
+@router.get("/profiles/{profile_id}", tags=["Admin"])
+def get_profile(profile_id: str, format: str = Query("speedscope", pattern="^(speedscope|collapsed)$")):
+    """One profile as speedscope JSON or collapsed stacks (flamegraph.pl / inferno input)"""
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found (profiles live in the worker that served the request)")
+    if not profile.finished:
+        raise HTTPException(status_code=409, detail="Request is still being profiled", headers={"Retry-After": "1"})
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.speedscope()
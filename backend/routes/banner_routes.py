@@ -1,15 +1,21 @@
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Form
+from typing import List
+from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Form, Header, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_read_db, pin_to_primary
 from models import Banner
-from datetime import datetime, timedelta
-import os
+from datetime import datetime
 from dotenv import load_dotenv
+import asyncio
 import logging
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+import orjson
+from utils.storage import get_storage, sign_url
+from utils.upload_guard import IMAGE_TYPES, blob_filename, sniffed_media_type
+from utils.progress import ProgressReporter, progress, valid_upload_id
+from utils import idempotency
+from schemas import BannerResponse, BannerUploadResponse
+from utils.json_response import ListingResponse
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -18,123 +24,83 @@ load_dotenv()
 # Create router
 router = APIRouter()
 
-# Initialize Azure Blob Service Client
-connection_string = os.getenv("AZURE_CONNECTION_STRING")
-container_name = os.getenv("AZURE_CONTAINER_NAME")
-account_name = os.getenv("AZURE_ACCOUNT_NAME")
-account_key = os.getenv("AZURE_ACCOUNT_KEY")
-
-if not all([connection_string, container_name, account_name, account_key]):
-    raise ValueError("Azure storage configuration is missing. Please check your .env file.")
-
-logger.info("Initializing Azure Blob Service Client...")
-try:
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-    container_client = blob_service_client.get_container_client(container_name)
-    logger.info(f"Connected to Azure container: {container_name}")
-except Exception as e:
-    logger.error(f"Failed to initialize Azure client: {str(e)}")
-    raise
-
-def generate_sas_url(blob_name: str) -> str:
-    """Generate a SAS URL for a blob that expires in 24 hours"""
-    if not blob_name:
-        return None
-    try:
-        # Extract blob name if it's a full URL
-        if 'blob.core.windows.net' in blob_name:
-            # Split by container name to get the path after it
-            parts = blob_name.split(container_name + '/')
-            if len(parts) > 1:
-                blob_name = parts[1].split('?')[0]  # Remove any existing query parameters
-            else:
-                # If we can't find the container name, just take the last part
-                blob_name = blob_name.split('/')[-1].split('?')[0]
-        
-        # Replace backslashes with forward slashes
-        blob_name = blob_name.replace('\\', '/')
-        
-        # Handle different types of blob paths
-        if 'thumb_' in blob_name or 'thumbnails' in blob_name:
-            # This is a thumbnail image
-            if not blob_name.startswith('audiobooks/'):
-                blob_name = f'audiobooks/{blob_name}'
-        elif 'audio_' in blob_name:
-            # This is an audio file
-            if not blob_name.startswith('audiobooks/'):
-                blob_name = f'audiobooks/{blob_name}'
-        elif 'banner' in blob_name:
-            # This is a banner
-            if not blob_name.startswith('banners/'):
-                blob_name = f'banners/{blob_name}'
-            
-        sas_token = generate_blob_sas(
-            account_name=account_name,
-            container_name=container_name,
-            blob_name=blob_name,
-            account_key=account_key,
-            permission=BlobSasPermissions(read=True),
-            expiry=datetime.utcnow() + timedelta(hours=24)
-        )
-        
-        # Ensure the URL is properly formatted
-        url = f"https://{account_name}.blob.core.windows.net/{container_name}/{blob_name}?{sas_token}"
-        logger.info(f"Generated SAS URL for blob: {blob_name}")
-        return url
-    except Exception as e:
-        logger.error(f"Error generating SAS URL for {blob_name}: {str(e)}")
-        return None
-
-@router.post("/upload", tags=["Banners"])
+@router.post("/upload", tags=["Banners"], response_model=BannerUploadResponse)
 async def upload_banner(
+    response: Response,
     banner: UploadFile = File(...),
     user_id: int = Form(...),
+    x_upload_id: str = Header(None),  # Progress is published to /api/uploads/{id}/events
+    idempotency_key: str = Header(None),  # Retries with the same key replay the first response
     db: Session = Depends(get_db)
 ):
+    upload_id = x_upload_id if valid_upload_id(x_upload_id) else None
+    call = idempotency.IdempotentCall()
+    if idempotency_key is not None:
+        request_fingerprint = idempotency.fingerprint(
+            user_id, await asyncio.to_thread(idempotency.file_digest, banner.file)
+        )
+        call = await asyncio.to_thread(idempotency.begin, "banner_upload", idempotency_key, request_fingerprint)
+        if call.replay is not None:
+            replayed = orjson.loads(call.replay.body)
+            # The stored signed URL may be close to expiry; hand out a fresh one
+            stored = db.query(Banner.image_url).filter(Banner.id == replayed["banner_id"]).scalar()
+            replayed["banner_url"] = sign_url(stored) if stored else None
+            progress.publish(upload_id, "complete", banner_id=replayed["banner_id"])
+            return ORJSONResponse(replayed, headers={"Idempotent-Replayed": "true"})
+    # With a key, a retry after a failed attempt overwrites the same blob instead of adding a new one
+    blob_prefix = call.token or datetime.now().timestamp()
     try:
         logger.info(f"Starting banner upload process for user: {user_id}")
         logger.info(f"Banner file: {banner.filename}, Content-Type: {banner.content_type}")
 
-        # Define file extensions based on MIME type
-        mime_to_extension = {
-            "image/jpeg": ".jpg",
-            "image/png": ".png",
-            "image/webp": ".webp"
-        }
+        # Detected from the file itself; UploadGuardMiddleware already refused non-images
+        banner_type = await sniffed_media_type(banner, IMAGE_TYPES)
 
         # Upload banner file
-        banner_ext = mime_to_extension.get(banner.content_type, ".jpg")
-        banner_blob_name = f"banners/{datetime.now().timestamp()}_{banner.filename}"
-        banner_blob_client = container_client.get_blob_client(banner_blob_name)
+        banner_blob_name = f"banners/{blob_prefix}_{blob_filename(banner.filename, banner_type)}"
 
         # Read banner file content and upload
         banner_file_content = await banner.read()
-        logger.info(f"Uploading banner file to Azure as {banner_blob_name}...")
-        banner_blob_client.upload_blob(banner_file_content, overwrite=True)
+        logger.info(f"Uploading banner file to storage as {banner_blob_name}...")
+        banner_reference = await asyncio.to_thread(
+            get_storage().upload, banner_blob_name, banner_file_content, banner_type,
+            ProgressReporter(upload_id, "storing", len(banner_file_content)),
+        )
+        progress.publish(upload_id, "processing")
         
-        # Generate SAS URL for the banner
-        banner_url = generate_sas_url(banner_blob_name)
+        # Generate a signed URL for the response; the DB keeps the unsigned reference
+        banner_url = sign_url(banner_reference)
         logger.info(f"Banner uploaded successfully. URL with SAS: {banner_url}")
 
         # Create banner record in database
         new_banner = Banner(
-            image_url=banner_url,
+            image_url=banner_reference,
             uploader_id=user_id
         )
         
         db.add(new_banner)
-        db.commit()
-        db.refresh(new_banner)
-        
-        logger.info(f"Banner record created successfully. ID: {new_banner.id}")
-        return {
+        db.flush()
+        result = {
             "message": "Banner uploaded successfully",
             "banner_id": new_banner.id,
             "banner_url": banner_url
         }
+        call.complete(db, 200, result)
+        db.commit()
         
+        logger.info(f"Banner record created successfully. ID: {new_banner.id}")
+        pin_to_primary(response)
+        progress.publish(upload_id, "complete", banner_id=new_banner.id)
+        return result
+        
+    except HTTPException as he:
+        progress.publish(upload_id, "error", status=he.status_code, detail=he.detail)
+        call.release()
+        raise
     except Exception as e:
         logger.error(f"Error uploading banner: {str(e)}")
+        progress.publish(upload_id, "error", status=500, detail="Error uploading banner")
+        call.release()
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(
@@ -142,39 +108,27 @@ async def upload_banner(
             detail=f"Error uploading banner: {str(e)}"
         )
 
-@router.get("/list", tags=["Banners"])
-async def list_banners(db: Session = Depends(get_db)):
+def list_banner_urls(db: Session):
+    """All banners, newest first, with freshly signed image URLs"""
+    banners = db.query(Banner.id, Banner.image_url, Banner.created_at).order_by(Banner.created_at.desc()).all()
+    formatted_banners = []
+
+    # Generate signed URLs for each banner
+    for banner in banners:
+        image_url = sign_url(banner.image_url)
+        if image_url:
+            formatted_banners.append({
+                "id": banner.id,
+                "image_url": image_url,
+                "created_at": banner.created_at
+            })
+
+    return formatted_banners
+
+@router.get("/list", tags=["Banners"], response_model=List[BannerResponse], response_class=ListingResponse)
+async def list_banners(db: Session = Depends(get_read_db)):
     try:
-        # Get all banners ordered by creation date
-        banners = db.query(Banner).order_by(Banner.created_at.desc()).all()
-        formatted_banners = []
-        
-        # Generate SAS URLs for each banner
-        for banner in banners:
-            try:
-                if banner.image_url:
-                    # Extract the blob name from the URL
-                    if 'blob.core.windows.net' in banner.image_url:
-                        blob_name = banner.image_url.split(container_name + '/')[1].split('?')[0]
-                        # Generate SAS URL
-                        sas_token = generate_blob_sas(
-                            account_name=account_name,
-                            container_name=container_name,
-                            blob_name=blob_name,
-                            account_key=account_key,
-                            permission=BlobSasPermissions(read=True),
-                            expiry=datetime.utcnow() + timedelta(hours=24)
-                        )
-                        sas_url = f"https://{account_name}.blob.core.windows.net/{container_name}/{blob_name}?{sas_token}"
-                        formatted_banners.append({
-                            "id": banner.id,
-                            "image_url": sas_url,
-                            "created_at": banner.created_at
-                        })
-            except Exception as e:
-                logger.error(f"Error processing banner {banner.id}: {str(e)}")
-                continue
-                
+        formatted_banners = list_banner_urls(db)
         logger.info(f"Successfully formatted {len(formatted_banners)} banners")
         return formatted_banners
     except Exception as e:
@@ -1,15 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Audiobook, Chapter
+from database import get_read_db
+from models import Audiobook, Chapter, BookSimilarity, BookSummary
 import logging
-from datetime import datetime, timedelta
-from azure.storage.blob import generate_blob_sas, BlobSasPermissions
-import os
 from dotenv import load_dotenv
+from utils.content_index import content_index
+from utils.storage import sign_url
+from schemas import BookSummaryResponse, ChapterResponse, ChapterManifestResponse, ScoredBookResponse
+from utils.json_response import ListingResponse
+import asyncio
+import base64
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -17,81 +20,54 @@ load_dotenv()
 
 router = APIRouter()
 
-# Get Azure credentials
-account_name = os.getenv("AZURE_ACCOUNT_NAME")
-account_key = os.getenv("AZURE_ACCOUNT_KEY")
-container_name = os.getenv("AZURE_CONTAINER_NAME")
+# Everything a listing shows, read as plain column rows rather than ORM instances
+BOOK_SUMMARY_COLUMNS = (
+    BookSummary.book_id,
+    BookSummary.title,
+    BookSummary.author,
+    BookSummary.description,
+    BookSummary.cover_thumbnail_url,
+    BookSummary.created_at,
+    BookSummary.first_chapter_audio_url,
+    BookSummary.total_chapters,
+    BookSummary.category_id,
+    BookSummary.category_name,
+)
 
-def generate_sas_url(blob_name: str) -> str:
-    """Generate a SAS URL for a blob that expires in 24 hours"""
-    if not blob_name:
-        return None
-    try:
-        # Extract blob name if it's a full URL
-        if 'blob.core.windows.net' in blob_name:
-            # Split by container name to get the path after it
-            parts = blob_name.split(container_name + '/')
-            if len(parts) > 1:
-                blob_name = parts[1].split('?')[0]  # Remove any existing query parameters
-            else:
-                # If we can't find the container name, just take the last part
-                blob_name = '/'.join(blob_name.split('/')[3:]).split('?')[0]
-        # Replace backslashes with forward slashes
-        blob_name = blob_name.replace('\\', '/')
-        # Do not rewrite thumbnail or audio paths; use as is
-        logger.info(f"Blob path used for SAS: {blob_name}")
-        sas_token = generate_blob_sas(
-            account_name=account_name,
-            container_name=container_name,
-            blob_name=blob_name,
-            account_key=account_key,
-            permission=BlobSasPermissions(read=True),
-            expiry=datetime.utcnow() + timedelta(hours=24)
-        )
-        url = f"https://{account_name}.blob.core.windows.net/{container_name}/{blob_name}?{sas_token}"
-        logger.info(f"Generated SAS URL for blob: {blob_name}")
-        return url
-    except Exception as e:
-        logger.error(f"Error generating SAS URL for {blob_name}: {str(e)}")
-        return None
+def format_book_summary(summary) -> dict:
+    """Response shape shared by every catalog listing (a BOOK_SUMMARY_COLUMNS row)"""
+    return {
+        "id": summary.book_id,
+        "title": summary.title,
+        "author": summary.author,
+        "description": summary.description,
+        "cover_image_url": sign_url(summary.cover_thumbnail_url),
+        "created_at": summary.created_at,
+        "first_chapter_url": sign_url(summary.first_chapter_audio_url),
+        "total_chapters": summary.total_chapters or 0,
+        "category": {
+            "id": summary.category_id,
+            "name": summary.category_name or "Uncategorized"
+        }
+    }
 
-@router.get("/all", tags=["Books"])
-async def get_all_books(db: Session = Depends(get_db)):
+@router.get("/all", tags=["Books"], response_model=List[BookSummaryResponse], response_class=ListingResponse)
+async def get_all_books(db: Session = Depends(get_read_db)):
     try:
-        # Fetch all books with their chapters and categories
-        books = db.query(Audiobook).order_by(Audiobook.created_at.desc()).all()
-        logger.info(f"Found {len(books)} books in database")
+        # Single scan of the catalog read model, no per-book chapter lookups
+        summaries = db.query(*BOOK_SUMMARY_COLUMNS).filter(
+            BookSummary.is_public.is_(True)
+        ).order_by(BookSummary.created_at.desc()).all()
+        logger.info(f"Found {len(summaries)} books in database")
         
         # Format the response
         formatted_books = []
-        for book in books:
+        for summary in summaries:
             try:
-                # Get the first chapter for this book
-                first_chapter = db.query(Chapter).filter(
-                    Chapter.audiobook_id == book.id
-                ).order_by(Chapter.order).first()
-                
-                # Generate SAS URLs for the stored blob paths
-                cover_image_url = generate_sas_url(first_chapter.thumbnail_url) if first_chapter and first_chapter.thumbnail_url else None
-                first_chapter_url = generate_sas_url(first_chapter.audio_url) if first_chapter and first_chapter.audio_url else None
-                
-                formatted_books.append({
-                    "id": book.id,
-                    "title": book.title,
-                    "author": book.author,
-                    "description": book.description,
-                    "cover_image_url": cover_image_url,
-                    "created_at": book.created_at,
-                    "first_chapter_url": first_chapter_url,
-                    "total_chapters": len(book.chapters) if book.chapters else 0,
-                    "category": {
-                        "id": book.category.id if book.category else None,
-                        "name": book.category.name if book.category else "Uncategorized"
-                    }
-                })
-                logger.info(f"Processed book {book.id}: {book.title}")
+                formatted_books.append(format_book_summary(summary))
+                logger.debug("Processed book %s: %s", summary.book_id, summary.title)
             except Exception as e:
-                logger.error(f"Error processing book {book.id}: {str(e)}")
+                logger.error(f"Error processing book {summary.book_id}: {str(e)}")
                 continue
         
         logger.info(f"Successfully formatted {len(formatted_books)} books")
@@ -104,40 +80,18 @@ async def get_all_books(db: Session = Depends(get_db)):
             detail=f"Error fetching books: {str(e)}"
         ) 
 
-@router.get("/{book_id}", tags=["Books"])
-async def get_book_details(book_id: int, db: Session = Depends(get_db)):
+@router.get("/{book_id}", tags=["Books"], response_model=BookSummaryResponse)
+async def get_book_details(book_id: int, db: Session = Depends(get_read_db)):
     try:
-        # Fetch the book with its category
-        book = db.query(Audiobook).filter(Audiobook.id == book_id).first()
-        if not book:
+        summary = db.query(*BOOK_SUMMARY_COLUMNS).filter(
+            BookSummary.book_id == book_id, BookSummary.is_public.is_(True)
+        ).first()
+        if not summary:
             raise HTTPException(status_code=404, detail="Book not found")
         
-        # Get the first chapter for this book
-        first_chapter = db.query(Chapter).filter(
-            Chapter.audiobook_id == book.id
-        ).order_by(Chapter.order).first()
-        
-        # Generate SAS URLs for the stored blob paths
-        cover_image_url = generate_sas_url(first_chapter.thumbnail_url) if first_chapter and first_chapter.thumbnail_url else None
-        first_chapter_url = generate_sas_url(first_chapter.audio_url) if first_chapter and first_chapter.audio_url else None
-        
-        # Format the response
-        formatted_book = {
-            "id": book.id,
-            "title": book.title,
-            "author": book.author,
-            "description": book.description,
-            "cover_image_url": cover_image_url,
-            "created_at": book.created_at,
-            "first_chapter_url": first_chapter_url,
-            "total_chapters": len(book.chapters) if book.chapters else 0,
-            "category": {
-                "id": book.category.id if book.category else None,
-                "name": book.category.name if book.category else "Uncategorized"
-            }
-        }
+        formatted_book = format_book_summary(summary)
         
-        logger.info(f"Successfully fetched book {book.id}: {book.title}")
+        logger.info(f"Successfully fetched book {summary.book_id}: {summary.title}")
         return formatted_book
         
     except HTTPException as he:
@@ -149,29 +103,34 @@ async def get_book_details(book_id: int, db: Session = Depends(get_db)):
             detail=f"Error fetching book: {str(e)}"
         )
 
-@router.get("/{book_id}/chapters", tags=["Books"])
-async def get_book_chapters(book_id: int, db: Session = Depends(get_db)):
+@router.get("/{book_id}/chapters", tags=["Books"], response_model=List[ChapterResponse], response_class=ListingResponse)
+async def get_book_chapters(book_id: int, db: Session = Depends(get_read_db)):
     try:
         # Verify book exists
-        book = db.query(Audiobook).filter(Audiobook.id == book_id).first()
+        book = db.query(Audiobook.id).filter(Audiobook.id == book_id, Audiobook.is_public.is_(True)).first()
         if not book:
             raise HTTPException(status_code=404, detail="Book not found")
         
         # Fetch all chapters for this book
-        chapters = db.query(Chapter).filter(
+        chapters = db.query(
+            Chapter.id, Chapter.title, Chapter.audio_url, Chapter.order,
+            Chapter.duration_seconds, Chapter.size_bytes, Chapter.content_type
+        ).filter(
             Chapter.audiobook_id == book_id
         ).order_by(Chapter.order).all()
         
         # Format the response
         formatted_chapters = []
         for chapter in chapters:
-            audio_url = generate_sas_url(chapter.audio_url) if chapter.audio_url else None
+            audio_url = sign_url(chapter.audio_url)
             formatted_chapters.append({
                 "id": chapter.id,
                 "title": chapter.title,
                 "audio_url": audio_url,
                 "order": chapter.order,
-                "duration": chapter.duration if hasattr(chapter, 'duration') else None
+                "duration": chapter.duration_seconds,
+                "size_bytes": chapter.size_bytes,
+                "content_type": chapter.content_type
             })
         
         logger.info(f"Successfully fetched {len(formatted_chapters)} chapters for book {book_id}")
@@ -185,3 +144,198 @@ async def get_book_chapters(book_id: int, db: Session = Depends(get_db)):
             status_code=500,
             detail=f"Error fetching chapters: {str(e)}"
         ) 
+
+MANIFEST_PAGE_SIZE = 50
+MANIFEST_MAX_PAGE_SIZE = 200
+# Chapters after the current one that get a signed URL; the rest are signed when the player gets there
+MANIFEST_SIGN_AHEAD = 2
+
+_MANIFEST_COLUMNS = (
+    Chapter.id, Chapter.title, Chapter.order, Chapter.audio_url,
+    Chapter.size_bytes, Chapter.duration_seconds, Chapter.content_type,
+)
+
+def _encode_manifest_cursor(order, chapter_id):
+    return base64.urlsafe_b64encode(f"{order}|{chapter_id}".encode()).decode().rstrip("=")
+
+def _decode_manifest_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        order, chapter_id = raw.split("|")
+        return int(order), int(chapter_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _manifest_entry(chapter, signed):
+    return {
+        "id": chapter.id,
+        "title": chapter.title,
+        "order": chapter.order,
+        "size_bytes": chapter.size_bytes,
+        "duration_seconds": chapter.duration_seconds,
+        "content_type": chapter.content_type,
+        "stream_url": f"/api/chapters/{chapter.id}/stream",
+        "audio_url": sign_url(chapter.audio_url) if signed else None,
+    }
+
+@router.get("/{book_id}/chapters/manifest", tags=["Books"], response_model=ChapterManifestResponse, response_class=ListingResponse)
+async def get_chapter_manifest(
+    book_id: int,
+    response: Response,
+    current: int = None,
+    cursor: str = None,
+    limit: int = MANIFEST_PAGE_SIZE,
+    db: Session = Depends(get_read_db),
+):
+    """Chapters ordered by (`order`, id), keyset-paginated with `cursor` (next_cursor of the previous page).
+
+    `order` is not unique (concurrent uploads can both take count + 1), so the
+    chapter id breaks ties and no chapter is skipped at a page boundary.
+
+    Only chapters from `current` (the order being played, default the first
+    chapter) up to MANIFEST_SIGN_AHEAD after it carry a signed audio_url, and
+    the next chapter is announced as a Link preload so players can prefetch it.
+    """
+    try:
+        limit = max(1, min(limit, MANIFEST_MAX_PAGE_SIZE))
+        total_chapters = db.query(BookSummary.total_chapters).filter(
+            BookSummary.book_id == book_id, BookSummary.is_public.is_(True)
+        ).scalar()
+        if total_chapters is None:
+            raise HTTPException(status_code=404, detail="Book not found")
+
+        query = db.query(*_MANIFEST_COLUMNS).filter(Chapter.audiobook_id == book_id)
+        if cursor:
+            query = query.filter(tuple_(Chapter.order, Chapter.id) > _decode_manifest_cursor(cursor))
+        page = query.order_by(Chapter.order, Chapter.id).limit(limit + 1).all()
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        if current is None:
+            window_start = page[0].order if not cursor and page else None
+        else:
+            window_start = current
+        entries = [
+            _manifest_entry(
+                chapter,
+                window_start is not None and window_start <= chapter.order <= window_start + MANIFEST_SIGN_AHEAD
+            )
+            for chapter in page
+        ]
+
+        # Next chapter to play: the first one when starting, otherwise the one after current
+        preload = None
+        if window_start is not None:
+            preload_after = window_start if current is not None else window_start - 1
+            preload = next((entry for entry in entries if entry["order"] > preload_after), None)
+            if preload is None:
+                chapter = db.query(*_MANIFEST_COLUMNS).filter(
+                    Chapter.audiobook_id == book_id, Chapter.order > preload_after
+                ).order_by(Chapter.order, Chapter.id).first()
+                preload = _manifest_entry(chapter, True) if chapter else None
+
+        links = []
+        if preload is not None and preload["audio_url"]:
+            media_type = f'; type="{preload["content_type"]}"' if preload["content_type"] else ""
+            links.append(f'<{preload["audio_url"]}>; rel=preload; as=audio{media_type}')
+        next_cursor = _encode_manifest_cursor(page[-1].order, page[-1].id) if has_more else None
+        if next_cursor is not None:
+            current_param = f"&current={current}" if current is not None else ""
+            links.append(
+                f'</api/books/{book_id}/chapters/manifest?cursor={next_cursor}&limit={limit}{current_param}>; rel="next"'
+            )
+        if links:
+            response.headers["Link"] = ", ".join(links)
+        # Signed URLs in the body are valid for much longer than this
+        response.headers["Cache-Control"] = "private, max-age=60"
+
+        return {
+            "book_id": book_id,
+            "total_chapters": total_chapters,
+            "current": current,
+            "chapters": entries,
+            "next_cursor": next_cursor,
+        }
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error building chapter manifest for book {book_id}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching chapters: {str(e)}"
+        )
+
+@router.get("/{book_id}/similar", tags=["Books"], response_model=List[ScoredBookResponse], response_class=ListingResponse)
+async def get_similar_books(book_id: int, limit: int = 10, db: Session = Depends(get_read_db)):
+    """Listeners also liked: reads the neighbours precomputed by jobs/build_item_similarity.py"""
+    try:
+        limit = max(1, min(limit, 50))
+        rows = db.query(
+            BookSimilarity.similar_book_id,
+            BookSimilarity.score,
+            Audiobook.title,
+            Audiobook.author,
+        ).join(
+            Audiobook, Audiobook.id == BookSimilarity.similar_book_id
+        ).filter(
+            BookSimilarity.book_id == book_id,
+            BookSimilarity.rank <= limit,
+            Audiobook.is_public.is_(True)
+        ).order_by(BookSimilarity.rank).all()
+
+        return [
+            {
+                "id": similar_book_id,
+                "title": title,
+                "author": author,
+                "score": round(score, 4)
+            }
+            for similar_book_id, score, title, author in rows
+        ]
+
+    except Exception as e:
+        logger.error(f"Error fetching similar books for {book_id}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching similar books: {str(e)}"
+        )
+
+@router.get("/{book_id}/more_like_this", tags=["Books"], response_model=List[ScoredBookResponse], response_class=ListingResponse)
+async def get_more_like_this(book_id: int, limit: int = 10, db: Session = Depends(get_read_db)):
+    """Content-based neighbours from the in-process TF-IDF index, works for brand new books too"""
+    try:
+        limit = max(1, min(limit, 50))
+        # Off the event loop: a sync after other workers' uploads reads and hashes their text
+        await asyncio.to_thread(content_index.sync, db)
+        neighbours = content_index.similar(book_id, k=limit)
+        if not neighbours:
+            if not db.query(Audiobook.id).filter(Audiobook.id == book_id).first():
+                raise HTTPException(status_code=404, detail="Book not found")
+            return []
+
+        scores = dict(neighbours)
+        rows = db.query(Audiobook.id, Audiobook.title, Audiobook.author).filter(
+            Audiobook.id.in_(scores.keys()), Audiobook.is_public.is_(True)
+        ).all()
+        books = {book_id: (title, author) for book_id, title, author in rows}
+
+        return [
+            {
+                "id": similar_book_id,
+                "title": books[similar_book_id][0],
+                "author": books[similar_book_id][1],
+                "score": round(score, 4)
+            }
+            for similar_book_id, score in neighbours
+            if similar_book_id in books
+        ]
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error fetching content matches for {book_id}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching similar books: {str(e)}"
+        )
@@ -1,10 +1,14 @@
+from typing import List
 from fastapi import APIRouter, Depends
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_read_db
 from models import Category
+from schemas import CategoryResponse
+from utils.json_response import ListingResponse, RowsResponse
 
 router = APIRouter()
 
-@router.get("/categories")
-def get_categories(db: Session = Depends(get_db)):
-    return db.query(Category).all()
+@router.get("/categories", response_model=List[CategoryResponse], response_class=ListingResponse)
+def get_categories(db: Session = Depends(get_read_db)):
+    return RowsResponse(db.execute(select(Category.id, Category.name)).all())
@@ -0,0 +1,128 @@
+from fastapi import APIRouter, Request
+from sqlalchemy import select
+from database import is_pinned_to_primary, read_session
+from models import BookSummary, Category, ListeningHistory
+from routes.banner_routes import list_banner_urls
+from routes.book_routes import BOOK_SUMMARY_COLUMNS, format_book_summary
+from schemas import HomeResponse
+from utils.json_response import ListingResponse
+from utils.storage import sign_url
+from utils.cache import TTLCache
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Whole-response budget; sections that miss it are served stale from cache or left out
+HOME_LATENCY_BUDGET_SECONDS = 1.5
+HOME_BOOKS_LIMIT = 20
+CONTINUE_LISTENING_LIMIT = 10
+
+# Shared sections change rarely and their SAS links are valid for 24h
+_shared_cache = TTLCache(ttl_seconds=60)
+_user_cache = TTLCache(ttl_seconds=10, max_entries=10000)
+
+def invalidate_shared_sections():
+    """Drop this worker's cached banners, categories and books after an admin change"""
+    _shared_cache.invalidate()
+
+def _load_banners(db):
+    return list_banner_urls(db)
+
+def _load_categories(db):
+    rows = db.execute(select(Category.id, Category.name).order_by(Category.name)).all()
+    return [{"id": category_id, "name": name} for category_id, name in rows]
+
+def _load_books(db):
+    summaries = db.query(*BOOK_SUMMARY_COLUMNS).filter(
+        BookSummary.is_public.is_(True)
+    ).order_by(BookSummary.created_at.desc()).limit(HOME_BOOKS_LIMIT).all()
+    return [format_book_summary(summary) for summary in summaries]
+
+def _load_continue_listening(db, user_id):
+    rows = db.execute(
+        select(
+            BookSummary.book_id,
+            BookSummary.title,
+            BookSummary.author,
+            ListeningHistory.progress,
+            ListeningHistory.last_played,
+            BookSummary.cover_thumbnail_url,
+        )
+        .join(BookSummary, BookSummary.book_id == ListeningHistory.book_id)
+        .where(ListeningHistory.user_id == user_id, ListeningHistory.progress < 1.0)
+        .order_by(ListeningHistory.last_played.desc())
+        .limit(CONTINUE_LISTENING_LIMIT)
+    ).all()
+    return [
+        {
+            "id": book_id,
+            "title": title,
+            "author": author,
+            "progress": progress,
+            "last_played": last_played,
+            "cover_image_url": sign_url(thumbnail_url)
+        }
+        for book_id, title, author, progress, last_played, thumbnail_url in rows
+    ]
+
+def _run_section(loader, cache, key, primary, *args):
+    # Runs in a worker thread with its own session so sections don't serialise on one connection
+    db = read_session(primary=primary)
+    try:
+        value = loader(db, *args)
+    finally:
+        db.close()
+    cache.set(key, value)
+    return value
+
+@router.get("/home", tags=["Home"], response_model=HomeResponse, response_class=ListingResponse, response_model_exclude_unset=True)
+async def get_home(request: Request, user_id: int = None):
+    started = time.perf_counter()
+    primary = is_pinned_to_primary(request)
+    sections = {
+        "banners": (_load_banners, _shared_cache, "banners", ()),
+        "categories": (_load_categories, _shared_cache, "categories", ()),
+        "books": (_load_books, _shared_cache, "books", ()),
+    }
+    if user_id:
+        sections["continue_listening"] = (_load_continue_listening, _user_cache, user_id, (user_id,))
+
+    result = {}
+    pending = {}
+    for name, (loader, cache, key, args) in sections.items():
+        # A client that just wrote must not be served a snapshot from before its write
+        cached = None if primary else cache.get(key)
+        if cached is not None:
+            result[name] = cached
+        else:
+            task = asyncio.create_task(asyncio.to_thread(_run_section, loader, cache, key, primary, *args))
+            pending[task] = name
+
+    if pending:
+        done, not_done = await asyncio.wait(pending.keys(), timeout=HOME_LATENCY_BUDGET_SECONDS)
+        for task in done:
+            name = pending[task]
+            if task.exception() is not None:
+                logger.error(f"Home section {name} failed: {str(task.exception())}")
+            else:
+                result[name] = task.result()
+        # Slow sections keep running and fill the cache for the next request
+        for task in not_done:
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    partial = []
+    for name, (loader, cache, key, args) in sections.items():
+        if name not in result:
+            stale = cache.get(key, allow_stale=True)
+            result[name] = stale if stale is not None else []
+            partial.append(name)
+
+    if partial:
+        logger.warning(f"Home served partial sections {partial} after {time.perf_counter() - started:.3f}s")
+    response = {name: result[name] for name in sections}
+    response["partial"] = partial
+    return response
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from utils.file_response import FileSegmentsResponse, parse_range, single_segment
+from utils.storage import LocalFileStorage, get_storage
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/{blob_name:path}", tags=["Media"])
+async def get_media(blob_name: str, expires: int, signature: str, request: Request):
+    """Serves blobs of the local storage backend through HMAC-signed, expiring URLs"""
+    storage = get_storage()
+    if not isinstance(storage, LocalFileStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not storage.verify(blob_name, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+    try:
+        info = storage.properties(blob_name)
+        handle = open(storage.path_for(blob_name), "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": info.etag,
+        # The signature already bounds the lifetime of this URL
+        "Cache-Control": f"private, max-age={max(0, expires - int(time.time()))}",
+    }
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != info.etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, info.size)
+    except ValueError:
+        handle.close()
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{info.size}", "Accept-Ranges": "bytes"})
+
+    if byte_range is None:
+        start, end, status_code = 0, info.size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    headers["Content-Length"] = str(max(0, end - start + 1))
+
+    return FileSegmentsResponse(single_segment(handle, start, end - start + 1), status_code, headers, info.content_type)
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+import logging
+import orjson
+from utils.progress import progress, valid_upload_id
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/{upload_id}/events", tags=["Uploads"])
+async def upload_events(upload_id: str):
+    """Server-sent events for one upload; the stream ends after the complete or error event"""
+    if not valid_upload_id(upload_id):
+        raise HTTPException(status_code=400, detail="upload_id must be 8-64 letters, digits, '-' or '_'")
+
+    async def stream():
+        # Tell EventSource to wait before reconnecting to a stream that closed normally
+        yield b"retry: 3000\n\n"
+        async for event in progress.events(upload_id):
+            if event is None:
+                # Comment line; keeps proxies from closing an idle connection
+                yield b": keep-alive\n\n"
+                continue
+            yield b"event: " + event["stage"].encode() + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,162 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+from database import SessionLocal
+from models import Audiobook, Chapter
+from utils.cache import TTLCache
+from utils.chunk_cache import ChunkCache
+from utils.file_response import FileSegmentsResponse, parse_range
+from utils.storage import get_storage
+import asyncio
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 1024 * 1024))
+STREAM_CACHE_MAX_BYTES = int(os.getenv("STREAM_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+STREAM_CACHE_DIR = os.getenv(
+    "STREAM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "chunks")
+)
+# Chunks fetched ahead of the one being sent
+STREAM_PREFETCH_CHUNKS = 4
+# Concurrent chunk downloads from Blob Storage per worker
+STREAM_MAX_FETCHES = 16
+
+chunk_cache = ChunkCache(STREAM_CACHE_DIR, STREAM_CHUNK_SIZE, STREAM_CACHE_MAX_BYTES)
+_blob_properties = TTLCache(ttl_seconds=300, max_entries=10000)
+_chapter_blobs = TTLCache(ttl_seconds=300, max_entries=100000)
+_fetch_slots = None
+_inflight = {}
+
+def forget_chapters(chapter_ids):
+    """Drop cached blob names for deleted or hidden chapters, so they 404 instead of streaming"""
+    for chapter_id in chapter_ids:
+        _chapter_blobs.invalidate(chapter_id)
+
+def _get_blob_properties(blob_name: str):
+    properties = _blob_properties.get(blob_name)
+    if properties is None:
+        properties = get_storage().properties(blob_name)
+        _blob_properties.set(blob_name, properties)
+    return properties
+
+def _download_chunk(blob_name: str, index: int, size: int) -> bytes:
+    offset = index * STREAM_CHUNK_SIZE
+    length = min(STREAM_CHUNK_SIZE, size - offset)
+    return get_storage().download_range(blob_name, offset, length)
+
+async def _fetch_chunk(blob_name: str, cache_key: str, index: int, size: int):
+    global _fetch_slots
+    if _fetch_slots is None:
+        _fetch_slots = asyncio.Semaphore(STREAM_MAX_FETCHES)
+    async with _fetch_slots:
+        data = await asyncio.to_thread(_download_chunk, blob_name, index, size)
+    await asyncio.to_thread(chunk_cache.put, cache_key, index, data)
+    return data
+
+async def _open_chunk(blob_name: str, cache_key: str, index: int, size: int):
+    handle = chunk_cache.open(cache_key, index)
+    if handle is not None:
+        return handle
+
+    # Several requests for the same cold chunk share one download
+    inflight_key = (cache_key, index)
+    future = _inflight.get(inflight_key)
+    if future is None:
+        future = asyncio.ensure_future(_fetch_chunk(blob_name, cache_key, index, size))
+        _inflight[inflight_key] = future
+        future.add_done_callback(lambda _: _inflight.pop(inflight_key, None))
+    data = await asyncio.shield(future)
+
+    handle = chunk_cache.open(cache_key, index)
+    if handle is None:
+        # Already evicted again (tiny cache budget); serve from an anonymous file
+        handle = tempfile.TemporaryFile()
+        handle.write(data)
+    return handle
+
+async def _range_segments(blob_name: str, cache_key: str, size: int, start: int, end: int):
+    """Yield (file, offset, count) covering bytes start..end, prefetching ahead"""
+    first, last = start // STREAM_CHUNK_SIZE, end // STREAM_CHUNK_SIZE
+    tasks = {}
+
+    def schedule(index):
+        if index <= last and index not in tasks:
+            tasks[index] = asyncio.ensure_future(_open_chunk(blob_name, cache_key, index, size))
+
+    try:
+        for index in range(first, min(first + STREAM_PREFETCH_CHUNKS, last + 1)):
+            schedule(index)
+        for index in range(first, last + 1):
+            schedule(index + STREAM_PREFETCH_CHUNKS - 1)
+            handle = await tasks.pop(index)
+            chunk_start = index * STREAM_CHUNK_SIZE
+            offset = max(start - chunk_start, 0)
+            count = min(end + 1, chunk_start + STREAM_CHUNK_SIZE) - chunk_start - offset
+            yield handle, offset, count
+    finally:
+        # Client went away: drop the prefetches and close anything already opened
+        for task in tasks.values():
+            if task.done() and not task.cancelled() and task.exception() is None:
+                task.result().close()
+            else:
+                task.cancel()
+
+@router.get("/{chapter_id}/stream", tags=["Streaming"])
+async def stream_chapter(chapter_id: int, request: Request):
+    blob_name = _chapter_blobs.get(chapter_id)
+    if blob_name is None:
+        # Not Depends(get_db): that session would hold a pooled connection until the whole stream is sent
+        db = SessionLocal()
+        try:
+            chapter = db.query(Chapter.audio_url).join(Audiobook, Audiobook.id == Chapter.audiobook_id).filter(
+                Chapter.id == chapter_id, Audiobook.is_public.is_(True)
+            ).first()
+        finally:
+            db.close()
+        if not chapter or not chapter.audio_url:
+            raise HTTPException(status_code=404, detail="Chapter not found")
+        blob_name = get_storage().blob_name(chapter.audio_url)
+        _chapter_blobs.set(chapter_id, blob_name)
+
+    try:
+        size, etag, content_type = await asyncio.to_thread(_get_blob_properties, blob_name)
+    except Exception as e:
+        logger.error(f"Error reading blob properties for chapter {chapter_id}: {str(e)}")
+        raise HTTPException(status_code=502, detail="Audio is temporarily unavailable")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=3600",
+    }
+
+    # If-Range: only honour Range when the client's copy is still current
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", "Accept-Ranges": "bytes"})
+
+    if size == 0:
+        return Response(status_code=200, headers=headers, media_type=content_type)
+
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    # Including the ETag in the cache key means an overwritten blob never serves stale chunks
+    cache_key = f"{blob_name}@{etag}"
+    segments = _range_segments(blob_name, cache_key, size, start, end)
+    return FileSegmentsResponse(segments, status_code, headers, content_type)
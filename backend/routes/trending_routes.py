@@ -0,0 +1,43 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from database import get_db
+from models import Audiobook
+from utils.trending import trending
+from schemas import ScoredBookResponse
+from utils.json_response import ListingResponse
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/trending", tags=["Trending"], response_model=List[ScoredBookResponse], response_class=ListingResponse)
+def get_trending(limit: int = 20, db: Session = Depends(get_db)):
+    try:
+        limit = max(1, min(limit, 100))
+        ranked = trending.top(limit)
+        if not ranked:
+            return []
+
+        rows = db.query(Audiobook.id, Audiobook.title, Audiobook.author).filter(
+            Audiobook.id.in_([book_id for book_id, _ in ranked]), Audiobook.is_public.is_(True)
+        ).all()
+        books = {book_id: (title, author) for book_id, title, author in rows}
+
+        return [
+            {
+                "id": book_id,
+                "title": books[book_id][0],
+                "author": books[book_id][1],
+                "score": round(score, 4)
+            }
+            for book_id, score in ranked
+            if book_id in books
+        ]
+    except Exception as e:
+        logger.error(f"Error fetching trending books: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching trending books: {str(e)}"
+        )
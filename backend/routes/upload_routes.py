@@ -1,15 +1,25 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from typing import List
+from fastapi import APIRouter, UploadFile, File, Form, Depends, Header, HTTPException, Response
 from sqlalchemy.orm import Session
-from database import SessionLocal
+from database import SessionLocal, get_read_db, pin_to_primary
 from models import Audiobook, Chapter
 from datetime import datetime
-import os
 from dotenv import load_dotenv
+import asyncio
 import logging
-from azure.storage.blob import BlobServiceClient
+import orjson
+from utils.storage import get_storage
+from utils.content_index import content_index
+from utils.catalog import add_book_summary, add_chapter_to_summary
+from utils.library import record_activity
+from utils.audio_metadata import HEAD_BYTES, audio_duration
+from utils.upload_guard import AUDIO_TYPES, IMAGE_TYPES, blob_filename, sniffed_media_type
+from utils.progress import ProgressReporter, progress, valid_upload_id
+from utils import idempotency
+from routes.user_books_routes import AUDIOBOOK_COLUMNS
+from schemas import AudiobookResponse, UploadResponse
+from utils.json_response import ListingResponse, RowsResponse
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -18,22 +28,6 @@ load_dotenv()
 # Create router
 router = APIRouter()
 
-# Initialize Azure Blob Service Client
-connection_string = os.getenv("AZURE_CONNECTION_STRING")
-container_name = os.getenv("AZURE_CONTAINER_NAME")
-
-if not connection_string or not container_name:
-    raise ValueError("Azure storage configuration is missing. Please check your .env file.")
-
-logger.info("Initializing Azure Blob Service Client...")
-try:
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-    container_client = blob_service_client.get_container_client(container_name)
-    logger.info(f"Connected to Azure container: {container_name}")
-except Exception as e:
-    logger.error(f"Failed to initialize Azure client: {str(e)}")
-    raise
-
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -42,8 +36,9 @@ def get_db():
     finally:
         db.close()
 
-@router.post("/upload", tags=["Audio Upload"])
+@router.post("/upload", tags=["Audio Upload"], response_model=UploadResponse, response_model_exclude_unset=True)
 async def upload_audio(
+    response: Response,
     title: str = Form(...),
     author: str = Form(...),
     description: str = Form(""),
@@ -51,8 +46,24 @@ async def upload_audio(
     thumbnail: UploadFile = File(None),
     audio: UploadFile = File(...),
     existing_book_id: int = Form(None),  # Optional parameter for existing book
+    x_upload_id: str = Header(None),  # Progress is published to /api/uploads/{id}/events
+    idempotency_key: str = Header(None),  # Retries with the same key replay the first response
     db: Session = Depends(get_db),
 ):
+    upload_id = x_upload_id if valid_upload_id(x_upload_id) else None
+    call = idempotency.IdempotentCall()
+    if idempotency_key is not None:
+        request_fingerprint = idempotency.fingerprint(
+            title, author, description, category_id, existing_book_id,
+            await asyncio.to_thread(idempotency.file_digest, audio.file),
+            await asyncio.to_thread(idempotency.file_digest, thumbnail.file) if thumbnail else "",
+        )
+        call = await asyncio.to_thread(idempotency.begin, "audio_upload", idempotency_key, request_fingerprint)
+        if call.replay is not None:
+            progress.publish(upload_id, "complete", **orjson.loads(call.replay.body))
+            return call.replay
+    # With a key, a retry after a failed attempt overwrites the same blobs instead of adding new ones
+    blob_prefix = call.token or datetime.now().timestamp()
     try:
         logger.info(f"Starting upload process for title: {title}")
         logger.info(f"Audio file: {audio.filename}, Content-Type: {audio.content_type}")
@@ -66,41 +77,44 @@ async def upload_audio(
                 detail="Missing required fields: title, author, or category_id"
             )
 
-        # Define file extensions based on MIME type
-        mime_to_extension = {
-            "image/jpeg": ".jpg",
-            "image/png": ".png",
-            "audio/mpeg": ".mp3",
-            "audio/wav": ".wav",
-            "audio/ogg": ".ogg"
-        }
+        # The type comes from the file's magic bytes, never from the client's Content-Type;
+        # UploadGuardMiddleware has already refused anything unsupported, oversized or too long
+        audio_type = await sniffed_media_type(audio, AUDIO_TYPES)
+        thumbnail_type = await sniffed_media_type(thumbnail, IMAGE_TYPES) if thumbnail else None
 
         # Upload audio file
-        audio_ext = mime_to_extension.get(audio.content_type, ".mp3")  # Default to .mp3 if unknown MIME type
-        audio_blob_name = f"audiobooks/{datetime.now().timestamp()}_{audio.filename}"
-        audio_blob_client = container_client.get_blob_client(audio_blob_name)
+        audio_blob_name = f"audiobooks/{blob_prefix}_{blob_filename(audio.filename, audio_type)}"
 
-        # Read audio file content and upload
+        # Read audio file content and upload; off the event loop so progress events keep flowing
         audio_file_content = await audio.read()
-        logger.info(f"Uploading audio file to Azure as {audio_blob_name}...")
-        audio_blob_client.upload_blob(audio_file_content, overwrite=True)
-        audio_url = f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{audio_blob_name}"
+        total_bytes = len(audio_file_content) + ((thumbnail.size or 0) if thumbnail else 0)
+        logger.info(f"Uploading audio file to storage as {audio_blob_name}...")
+        audio_url = await asyncio.to_thread(
+            get_storage().upload, audio_blob_name, audio_file_content, audio_type,
+            ProgressReporter(upload_id, "storing", total_bytes),
+        )
         logger.info(f"Audio uploaded successfully. URL: {audio_url}")
+        audio_metadata = {
+            "size_bytes": len(audio_file_content),
+            "duration_seconds": audio_duration(audio_file_content[:HEAD_BYTES], len(audio_file_content), audio_type),
+            "content_type": audio_type,
+        }
 
         # Upload thumbnail (if present)
         thumbnail_url = None
         if thumbnail:
-            thumbnail_ext = mime_to_extension.get(thumbnail.content_type, ".jpg")  # Default to .jpg
-            thumbnail_blob_name = f"thumbnails/{datetime.now().timestamp()}_{thumbnail.filename}"
-            thumbnail_blob_client = container_client.get_blob_client(thumbnail_blob_name)
+            thumbnail_blob_name = f"thumbnails/{blob_prefix}_{blob_filename(thumbnail.filename, thumbnail_type)}"
 
             # Read thumbnail content and upload
             thumbnail_file_content = await thumbnail.read()
-            logger.info(f"Uploading thumbnail file to Azure as {thumbnail_blob_name}...")
-            thumbnail_blob_client.upload_blob(thumbnail_file_content, overwrite=True)
-            thumbnail_url = f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{thumbnail_blob_name}"
+            logger.info(f"Uploading thumbnail file to storage as {thumbnail_blob_name}...")
+            thumbnail_url = await asyncio.to_thread(
+                get_storage().upload, thumbnail_blob_name, thumbnail_file_content, thumbnail_type,
+                ProgressReporter(upload_id, "storing", total_bytes, offset=len(audio_file_content)),
+            )
             logger.info(f"Thumbnail uploaded successfully. URL: {thumbnail_url}")
 
+        progress.publish(upload_id, "processing")
         if existing_book_id:
             # If existing book ID is provided, add a new chapter to the existing audiobook
             existing_book = db.query(Audiobook).filter(Audiobook.id == existing_book_id).first()
@@ -113,12 +127,19 @@ async def upload_audio(
                 title=f"{existing_book.title} - Chapter {chapter_count + 1}",
                 audio_url=audio_url,
                 thumbnail_url=thumbnail_url,  # Set chapter thumbnail (can be None)
-                order=chapter_count + 1
+                order=chapter_count + 1,
+                **audio_metadata
             )
             db.add(new_chapter)
+            db.flush()
+            add_chapter_to_summary(db, new_chapter)
+            result = {"message": "Chapter added successfully", "chapter_id": new_chapter.id}
+            call.complete(db, 200, result)
             db.commit()
             logger.info(f"New chapter added to existing book {existing_book_id}")
-            return {"message": "Chapter added successfully", "chapter_id": new_chapter.id}
+            pin_to_primary(response)
+            progress.publish(upload_id, "complete", book_id=existing_book_id, chapter_id=new_chapter.id)
+            return result
 
         # If no existing book, create a new audiobook
         new_book = Audiobook(
@@ -131,9 +152,7 @@ async def upload_audio(
             created_at=datetime.utcnow()
         )
         db.add(new_book)
-        db.commit()
-        db.refresh(new_book)
-        logger.info(f"New audiobook created successfully: {new_book.id}")
+        db.flush()
 
         # Add first chapter to the newly created book
         first_chapter = Chapter(
@@ -141,23 +160,45 @@ async def upload_audio(
             title=f"{title} - Chapter 1",
             audio_url=audio_url,
             thumbnail_url=thumbnail_url,  # Set chapter thumbnail
-            order=1
+            order=1,
+            **audio_metadata
         )
         db.add(first_chapter)
-        db.commit()
-        logger.info(f"First chapter added to new audiobook {new_book.id}")
+        db.flush()
 
-        return {
+        # Book, first chapter and catalog summary land in one transaction
+        add_book_summary(db, new_book, first_chapter)
+        record_activity(db, new_book.creator_id, new_book.id, new_book.created_at, owned=True)
+        result = {
             "message": "Audiobook uploaded successfully",
             "book_id": new_book.id,
             "chapter_id": first_chapter.id
         }
+        call.complete(db, 200, result)
+        db.commit()
+        logger.info(f"New audiobook {new_book.id} created with its first chapter")
+        # The uploader reads their new book back immediately; replicas may not have it yet
+        pin_to_primary(response)
+
+        # Make the new title discoverable by "more like this" right away
+        try:
+            await asyncio.to_thread(content_index.sync, db, True)
+        except Exception as e:
+            logger.error(f"Failed to index book {new_book.id} for content similarity: {str(e)}")
+
+        progress.publish(upload_id, "complete", book_id=new_book.id, chapter_id=first_chapter.id)
+
+        return result
 
     except HTTPException as he:
         logger.error(f"HTTP Exception: {str(he)}")
+        progress.publish(upload_id, "error", status=he.status_code, detail=he.detail)
+        call.release()
         raise he
     except Exception as e:
         logger.error(f"Unexpected error during upload: {str(e)}")
+        progress.publish(upload_id, "error", status=500, detail="Error during upload")
+        call.release()
         import traceback
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(
@@ -165,12 +206,12 @@ async def upload_audio(
             detail=f"Error during upload: {str(e)}"
         )
 
-@router.get("/user_books")
-async def get_user_books(db: Session = Depends(get_db)):
+@router.get("/user_books", response_model=List[AudiobookResponse], response_class=ListingResponse)
+async def get_user_books(db: Session = Depends(get_read_db)):
     try:
         # For now, we'll get all books since we don't have user authentication yet
-        books = db.query(Audiobook).all()
-        return books
+        books = db.query(*AUDIOBOOK_COLUMNS).all()
+        return RowsResponse(books)
     except Exception as e:
         logger.error(f"Error fetching user books: {str(e)}")
         raise HTTPException(
@@ -1,33 +1,50 @@
+from typing import List
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import or_, select, tuple_
 from sqlalchemy.orm import Session
-from models import Audiobook, User
-from database import get_db
+from models import Audiobook, BookSummary, LibraryEntry, User
+from database import get_read_db
+from schemas import AudiobookResponse, LibraryPageResponse
+from utils.json_response import ListingResponse, RowsResponse
+from utils.storage import sign_url
+from datetime import datetime
+import base64
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get("/user_books")
+# Column rows, not ORM instances: nothing to reflect over and no lazy loads
+AUDIOBOOK_COLUMNS = (
+    Audiobook.id,
+    Audiobook.title,
+    Audiobook.author,
+    Audiobook.description,
+    Audiobook.category_id,
+    Audiobook.creator_id,
+    Audiobook.is_public,
+    Audiobook.created_at,
+)
+
+@router.get("/user_books", response_model=List[AudiobookResponse], response_class=ListingResponse)
 def get_books_by_user(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     user_id: int = None,  # This will be passed from the frontend
     is_admin: bool = False  # This will be passed from the frontend
 ):
     try:
         # If user is admin, return all books
         if is_admin:
-            books = db.query(Audiobook).all()
+            books = db.query(*AUDIOBOOK_COLUMNS).all()
             logger.info(f"Admin access - Found {len(books)} total books.")
-            return books
+            return RowsResponse(books)
             
         # For regular users, return only their books
         if user_id:
-            books = db.query(Audiobook).filter(Audiobook.creator_id == user_id).all()
+            books = db.query(*AUDIOBOOK_COLUMNS).filter(Audiobook.creator_id == user_id).all()
             logger.info(f"User {user_id} - Found {len(books)} books.")
-            return books
+            return RowsResponse(books)
             
         # If no user_id provided, return empty list
         logger.info("No user_id provided, returning empty list.")
@@ -39,3 +56,89 @@ def get_books_by_user(
             status_code=500,
             detail=f"Error fetching books: {str(e)}"
         )
+
+LIBRARY_PAGE_SIZE = 20
+MAX_LIBRARY_PAGE_SIZE = 100
+
+LIBRARY_FILTERS = {
+    "all": None,
+    "owned": LibraryEntry.owned.is_(True),
+    "liked": LibraryEntry.liked.is_(True),
+    "in_progress": LibraryEntry.progress < 1.0,
+}
+
+def _encode_library_cursor(last_activity, book_id):
+    return base64.urlsafe_b64encode(f"{last_activity.isoformat()}|{book_id}".encode()).decode().rstrip("=")
+
+def _decode_library_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        last_activity, book_id = raw.split("|")
+        return datetime.fromisoformat(last_activity), int(book_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/library", tags=["User Books"], response_model=LibraryPageResponse, response_class=ListingResponse)
+def get_library(
+    user_id: int,
+    kind: str = "all",  # all, owned, liked or in_progress
+    cursor: str = None,  # next_cursor of the previous page
+    limit: int = LIBRARY_PAGE_SIZE,
+    db: Session = Depends(get_read_db),
+):
+    """A user's books (created, liked or started), most recent activity first"""
+    if kind not in LIBRARY_FILTERS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of: {', '.join(LIBRARY_FILTERS)}")
+    limit = max(1, min(limit, MAX_LIBRARY_PAGE_SIZE))
+
+    # Range scan of ix_library_entries_user_activity, then a primary-key probe per row for the display columns
+    query = (
+        select(
+            LibraryEntry.book_id,
+            LibraryEntry.last_activity,
+            LibraryEntry.owned,
+            LibraryEntry.liked,
+            LibraryEntry.progress,
+            BookSummary.title,
+            BookSummary.author,
+            BookSummary.cover_thumbnail_url,
+            BookSummary.total_chapters,
+        )
+        .join(BookSummary, BookSummary.book_id == LibraryEntry.book_id)
+        # Liked or played books that were made private since drop out; your own never do
+        .where(LibraryEntry.user_id == user_id, or_(BookSummary.is_public.is_(True), LibraryEntry.owned.is_(True)))
+        .order_by(LibraryEntry.last_activity.desc(), LibraryEntry.book_id.desc())
+        .limit(limit + 1)
+    )
+    if LIBRARY_FILTERS[kind] is not None:
+        query = query.where(LIBRARY_FILTERS[kind])
+    if cursor:
+        query = query.where(tuple_(LibraryEntry.last_activity, LibraryEntry.book_id) < _decode_library_cursor(cursor))
+
+    try:
+        rows = db.execute(query).all()
+    except Exception as e:
+        logger.error(f"Error fetching library for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching library: {str(e)}")
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _encode_library_cursor(page[-1].last_activity, page[-1].book_id)
+    return {
+        "items": [
+            {
+                "id": row.book_id,
+                "title": row.title,
+                "author": row.author,
+                "cover_image_url": sign_url(row.cover_thumbnail_url),
+                "total_chapters": row.total_chapters,
+                "owned": row.owned,
+                "liked": row.liked,
+                "progress": row.progress,
+                "last_activity": row.last_activity,
+            }
+            for row in page
+        ],
+        "next_cursor": next_cursor,
+    }
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -20,6 +20,213 @@ class UserResponse(UserBase):
     is_verified: bool
     created_at: datetime
     role: str
-    
-    class Config:
-        orm_mode = True
+
+    model_config = ConfigDict(from_attributes=True)
+
+class LikeCreate(BaseModel):
+    user_id: int
+
+class ProgressUpdate(BaseModel):
+    user_id: int
+    progress: float
+
+# Bulk admin requests: books are picked by id list and/or creator
+class BookSelection(BaseModel):
+    book_ids: Optional[List[int]] = None
+    creator_id: Optional[int] = None
+
+class BookBulkUpdate(BookSelection):
+    # Only the fields that are set are changed
+    category_id: Optional[int] = None
+    author: Optional[str] = None
+    description: Optional[str] = None
+    is_public: Optional[bool] = None
+
+class ChapterSelection(BaseModel):
+    chapter_ids: List[int]
+
+class BannerSelection(BaseModel):
+    banner_ids: List[int]
+
+# Response models. Routes return column rows (or plain dicts) and FastAPI
+# validates them against these with from_attributes, so no ORM instance is
+# ever reflected over by jsonable_encoder.
+
+class MessageResponse(BaseModel):
+    message: str
+
+class HealthResponse(BaseModel):
+    status: str
+
+class LoginResponse(MessageResponse):
+    user_id: int
+    name: Optional[str] = None
+
+class CategoryResponse(BaseModel):
+    id: int
+    name: str
+
+class AudiobookResponse(BaseModel):
+    id: int
+    title: str
+    author: str
+    description: Optional[str] = None
+    category_id: Optional[int] = None
+    creator_id: Optional[int] = None
+    is_public: Optional[bool] = None
+    created_at: Optional[datetime] = None
+
+class CategoryRef(BaseModel):
+    id: Optional[int] = None
+    name: str
+
+class BookSummaryResponse(BaseModel):
+    id: int
+    title: str
+    author: str
+    description: Optional[str] = None
+    cover_image_url: Optional[str] = None
+    created_at: Optional[datetime] = None
+    first_chapter_url: Optional[str] = None
+    total_chapters: int = 0
+    category: CategoryRef
+
+class ChapterResponse(BaseModel):
+    id: int
+    title: str
+    audio_url: Optional[str] = None
+    order: Optional[int] = None
+    duration: Optional[float] = None
+    size_bytes: Optional[int] = None
+    content_type: Optional[str] = None
+
+class ChapterManifestEntry(BaseModel):
+    id: int
+    title: str
+    order: int
+    size_bytes: Optional[int] = None
+    duration_seconds: Optional[float] = None
+    content_type: Optional[str] = None
+    stream_url: str
+    # Signed direct URL, only for chapters inside the window around the current one
+    audio_url: Optional[str] = None
+
+class ChapterManifestResponse(BaseModel):
+    book_id: int
+    total_chapters: int
+    current: Optional[int] = None
+    chapters: List[ChapterManifestEntry]
+    next_cursor: Optional[str] = None
+
+class ScoredBookResponse(BaseModel):
+    id: int
+    title: str
+    author: str
+    score: float
+
+class BannerResponse(BaseModel):
+    id: int
+    image_url: str
+    created_at: Optional[datetime] = None
+
+class ContinueListeningResponse(BaseModel):
+    id: int
+    title: str
+    author: str
+    progress: Optional[float] = None
+    last_played: Optional[datetime] = None
+    cover_image_url: Optional[str] = None
+
+class HomeResponse(BaseModel):
+    banners: List[BannerResponse]
+    categories: List[CategoryResponse]
+    books: List[BookSummaryResponse]
+    continue_listening: Optional[List[ContinueListeningResponse]] = None
+    partial: List[str]
+
+class LibraryEntryResponse(BaseModel):
+    id: int
+    title: str
+    author: str
+    cover_image_url: Optional[str] = None
+    total_chapters: int
+    owned: bool
+    liked: bool
+    progress: Optional[float] = None
+    last_activity: datetime
+
+class LibraryPageResponse(BaseModel):
+    items: List[LibraryEntryResponse]
+    next_cursor: Optional[str] = None
+
+class UploadResponse(MessageResponse):
+    book_id: Optional[int] = None
+    chapter_id: int
+
+class BannerUploadResponse(MessageResponse):
+    banner_id: int
+    banner_url: Optional[str] = None
+
+class AdminOperationResponse(MessageResponse):
+    matched: int
+    blobs_deleted: int = 0
+
+# Slow-query log (utils/query_log.py)
+class QueryPlan(BaseModel):
+    captured_at: datetime
+    elapsed_ms: float
+    # Postgres JSON plan, or SQLite's EXPLAIN QUERY PLAN lines
+    plan: Any
+
+class QueryStat(BaseModel):
+    fingerprint: str
+    statement: str
+    calls: int
+    total_ms: float
+    mean_ms: float
+    max_ms: float
+    plan: Optional[QueryPlan] = None
+
+class SlowQuery(BaseModel):
+    fingerprint: str
+    statement: str
+    elapsed_ms: float
+    at: datetime
+    request_id: Optional[str] = None
+
+class NPlusOneSuspect(BaseModel):
+    handler: str
+    fingerprint: str
+    statement: str
+    requests: int
+    last_seen: datetime
+
+# Request profiles (utils/profiling.py)
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    request_id: Optional[str] = None
+    status: Optional[int] = None
+    finished: bool
+    started_at: datetime
+    wall_ms: Optional[float] = None
+    interval_ms: float
+    samples: int
+    # Sampled time per category: app, db, storage, waiting
+    sampled_ms: Dict[str, float]
+    db_ms: Optional[float] = None
+    db_queries: Optional[int] = None
+
+class QueryLogResponse(BaseModel):
+    slow_query_ms: float
+    n_plus_one_threshold: int
+    top: List[QueryStat]
+    slow: List[SlowQuery]
+    n_plus_one: List[NPlusOneSuspect]
+
+class LikeResponse(MessageResponse):
+    like_id: int
+
+class ProgressResponse(MessageResponse):
+    progress: float
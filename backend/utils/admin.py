@@ -0,0 +1,79 @@
+"""Shared pieces of the bulk admin endpoints (routes/admin_routes.py).
+
+Admin calls authenticate with the X-Admin-Key header, which must match
+ADMIN_API_KEY. If ADMIN_API_KEY is unset the admin API is disabled.
+
+Bulk operations run set-based SQL over chunks of ids, so the cost is a few
+statements per ID_CHUNK_SIZE rows instead of a round trip per item. After the
+rows are committed, the blobs they referenced go through the storage batch
+delete (DELETE_BATCH_SIZE per sub-request). A blob that fails to delete here
+is an orphan that jobs.gc_orphan_blobs picks up later.
+"""
+import hmac
+import logging
+import os
+
+from fastapi import Header, HTTPException
+from sqlalchemy import select
+
+from models import Banner, BookSummary, Chapter
+from utils.progress import progress
+from utils.storage import DELETE_BATCH_SIZE, get_storage
+
+logger = logging.getLogger(__name__)
+
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+ID_CHUNK_SIZE = 1000
+
+# Every column that can point at a blob; a blob is only deleted once none of them do
+BLOB_REFERENCE_COLUMNS = (
+    Chapter.audio_url,
+    Chapter.thumbnail_url,
+    Banner.image_url,
+    BookSummary.cover_thumbnail_url,
+    BookSummary.first_chapter_audio_url,
+)
+
+
+def is_admin_key(value):
+    return bool(ADMIN_API_KEY) and bool(value) and hmac.compare_digest(value.encode(), ADMIN_API_KEY.encode())
+
+
+def require_admin(x_admin_key: str = Header(None)):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=503, detail="Admin API is disabled (ADMIN_API_KEY is not set)")
+    if not is_admin_key(x_admin_key):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
+
+def chunked(items, size=ID_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def still_referenced(db, references):
+    """Subset of references that some remaining row still points at"""
+    referenced = set()
+    for chunk in chunked(references):
+        for column in BLOB_REFERENCE_COLUMNS:
+            referenced.update(db.execute(select(column).distinct().where(column.in_(chunk))).scalars())
+    return referenced
+
+
+def delete_blobs(db, references, operation_id=None):
+    """Batch-delete the blobs no row references any more; returns how many were deleted"""
+    references = sorted(set(reference for reference in references if reference))
+    referenced = still_referenced(db, references)
+    doomed = [reference for reference in references if reference not in referenced]
+    storage = get_storage()
+    deleted = 0
+    for batch in chunked(doomed, DELETE_BATCH_SIZE):
+        try:
+            storage.delete_many(batch)
+            deleted += len(batch)
+        except Exception as e:
+            # Left for the orphan collector
+            logger.error(f"Batch delete of {len(batch)} blobs failed: {str(e)}")
+        progress.publish(operation_id, "deleting_blobs", done=deleted, total=len(doomed))
+    return deleted
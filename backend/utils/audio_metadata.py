@@ -0,0 +1,123 @@
+"""Duration of an audio file from its first bytes and total size.
+
+Only the head of the file is needed, so this works on an upload buffer as well
+as on a short ranged read from storage. Supported:
+
+* MP3 (MPEG audio layer III): exact from a Xing/Info or VBRI header when the
+  encoder wrote one, otherwise estimated from the first frame's bitrate (exact
+  for CBR files).
+* WAV (PCM RIFF): from the fmt chunk's byte rate.
+
+Anything else returns None; callers store NULL and players fall back to their
+own probing.
+"""
+import struct
+
+# Enough to get past a typical ID3v2 tag with cover art and reach the first frame
+HEAD_BYTES = 256 * 1024
+
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+_MP3_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+
+
+def _id3v2_size(head):
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in head[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _mp3_frame(head, offset):
+    """Decode the layer III frame header at offset, or None."""
+    if offset + 4 > len(head) or head[offset] != 0xFF or head[offset + 1] & 0xE0 != 0xE0:
+        return None
+    version = _MP3_VERSIONS.get((head[offset + 1] >> 3) & 0x03)
+    layer = (head[offset + 1] >> 1) & 0x03
+    bitrate_index = head[offset + 2] >> 4
+    rate_index = (head[offset + 2] >> 2) & 0x03
+    if version is None or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    mono = head[offset + 3] >> 6 == 3
+    samples_per_frame = 1152 if version == 1 else 576
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    return bitrate, sample_rate, samples_per_frame, side_info
+
+
+def _frame_length(head, offset, frame):
+    bitrate, sample_rate, samples_per_frame, _ = frame
+    padding = (head[offset + 2] >> 1) & 0x01
+    return samples_per_frame // 8 * bitrate // sample_rate + padding
+
+
+def find_mp3_frame(head, search_bytes=8192):
+    """Offset of the first MPEG layer III frame after any ID3v2 tag, or None.
+
+    A candidate only counts if the following frame header also decodes (when
+    it lies within head), so stray 0xFFE bit patterns in other data don't match.
+    """
+    start = _id3v2_size(head)
+    for offset in range(start, min(len(head) - 3, start + search_bytes)):
+        frame = _mp3_frame(head, offset)
+        if frame is None:
+            continue
+        following = offset + _frame_length(head, offset, frame)
+        if following + 4 > len(head) or _mp3_frame(head, following) is not None:
+            return offset
+    return None
+
+
+def mp3_duration(head, total_size):
+    offset = find_mp3_frame(head)
+    if offset is None:
+        return None
+    bitrate, sample_rate, samples_per_frame, side_info = _mp3_frame(head, offset)
+
+    xing = offset + 4 + side_info
+    if head[xing:xing + 4] in (b"Xing", b"Info") and len(head) >= xing + 12:
+        flags = struct.unpack(">I", head[xing + 4:xing + 8])[0]
+        if flags & 0x01:
+            frames = struct.unpack(">I", head[xing + 8:xing + 12])[0]
+            return frames * samples_per_frame / sample_rate
+    vbri = offset + 4 + 32
+    if head[vbri:vbri + 4] == b"VBRI" and len(head) >= vbri + 18:
+        frames = struct.unpack(">I", head[vbri + 14:vbri + 18])[0]
+        return frames * samples_per_frame / sample_rate
+
+    return (total_size - offset) * 8 / bitrate
+
+
+def wav_duration(head, total_size):
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None
+    position, byte_rate = 12, None
+    while position + 8 <= len(head):
+        chunk_id = head[position:position + 4]
+        chunk_size = struct.unpack("<I", head[position + 4:position + 8])[0]
+        if chunk_id == b"fmt " and position + 16 <= len(head):
+            byte_rate = struct.unpack("<I", head[position + 12:position + 16])[0]
+        elif chunk_id == b"data" and byte_rate:
+            data_size = min(chunk_size, total_size - position - 8)
+            return data_size / byte_rate
+        position += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def audio_duration(head, total_size, content_type=None):
+    """Seconds of audio, or None when the format isn't recognised."""
+    if content_type in ("audio/wav", "audio/x-wav", "audio/wave") or head[:4] == b"RIFF":
+        return wav_duration(head, total_size)
+    duration = mp3_duration(head, total_size)
+    return round(duration, 3) if duration else None
@@ -0,0 +1,126 @@
+"""Garbage collection of media blobs that no row references any more.
+
+Blobs are orphaned when the DB commit after an upload fails, and when
+content is replaced or deleted without removing the old file. collect_orphans
+finds and removes them in two streaming passes with bounded memory:
+
+1. Every stored media reference (chapter audio and thumbnails, banner images,
+   and the copies in book_summaries) is normalised to a blob name and added
+   to a Bloom filter, read from the DB in chunks.
+2. The container is listed page by page. A blob that is not in the filter is
+   certainly unreferenced, because Bloom filters have no false negatives.
+   If it is also older than the grace period it is deleted, in batches.
+
+A false positive only keeps an orphan alive. Each run salts its hashes
+differently, so the same orphan is not kept forever.
+
+The grace period covers uploads whose row hasn't been committed yet. It has
+to be longer than any upload request, and longer than the gap between
+building the filter and listing a blob.
+"""
+import hashlib
+import logging
+import math
+import os
+import time
+
+from sqlalchemy import func, select
+
+from models import BookSummary, Chapter, Banner
+from utils.metrics import storage_orphan_bytes_deleted, storage_orphans_deleted
+from utils.storage import DELETE_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Only prefixes the app itself writes to; anything else in the container is left alone
+MEDIA_PREFIXES = ("audiobooks/", "thumbnails/", "banners/")
+GRACE_PERIOD_SECONDS = float(os.getenv("BLOB_GC_GRACE_HOURS", 24)) * 3600
+FALSE_POSITIVE_RATE = 1e-4
+REFERENCE_CHUNK_SIZE = 10_000
+
+REFERENCE_COLUMNS = (
+    Chapter.audio_url,
+    Chapter.thumbnail_url,
+    Banner.image_url,
+    BookSummary.cover_thumbnail_url,
+    BookSummary.first_chapter_audio_url,
+)
+
+
+class BloomFilter:
+    """Set membership in ~2.4 bytes per item at a 1e-4 false positive rate"""
+
+    def __init__(self, capacity, false_positive_rate=FALSE_POSITIVE_RATE, salt=None):
+        capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.salt = salt if salt is not None else os.urandom(16)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16, key=self.salt).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        # Kirsch-Mitzenmacher: k positions from two hashes
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def count_references(db):
+    return sum(
+        db.execute(select(func.count(column)).where(column.isnot(None))).scalar() or 0
+        for column in REFERENCE_COLUMNS
+    )
+
+
+def referenced_blobs(db, storage):
+    bloom = BloomFilter(count_references(db))
+    for column in REFERENCE_COLUMNS:
+        result = db.execute(
+            select(column).where(column.isnot(None)).execution_options(yield_per=REFERENCE_CHUNK_SIZE)
+        )
+        for (reference,) in result:
+            bloom.add(storage.blob_name(reference))
+    return bloom
+
+
+def collect_orphans(db, storage, grace_period=GRACE_PERIOD_SECONDS, prefixes=MEDIA_PREFIXES, dry_run=False):
+    """Delete unreferenced blobs older than grace_period. Returns (deleted, bytes_freed)."""
+    started = time.time()
+    referenced = referenced_blobs(db, storage)
+    # Close the read transaction; the listing can take a long time
+    db.rollback()
+    logger.info(f"Built reference filter in {time.time() - started:.1f}s")
+
+    cutoff = started - grace_period
+    deleted, freed, pending = 0, 0, []
+
+    def flush():
+        nonlocal deleted, freed
+        if not dry_run:
+            storage.delete_many([entry.name for entry in pending])
+            storage_orphans_deleted.inc(len(pending), (storage.name,))
+            storage_orphan_bytes_deleted.inc(sum(entry.size for entry in pending), (storage.name,))
+        deleted += len(pending)
+        freed += sum(entry.size for entry in pending)
+        pending.clear()
+
+    for prefix in prefixes:
+        for page in storage.list_blobs(prefix):
+            for entry in page:
+                if entry.last_modified < cutoff and entry.name not in referenced:
+                    logger.debug(f"Orphaned blob {entry.name} ({entry.size} bytes)")
+                    pending.append(entry)
+            if len(pending) >= DELETE_BATCH_SIZE:
+                flush()
+    if pending:
+        flush()
+
+    verb = "Would delete" if dry_run else "Deleted"
+    logger.info(f"{verb} {deleted} orphaned blobs ({freed} bytes) in {time.time() - started:.1f}s")
+    return deleted, freed
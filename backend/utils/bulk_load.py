@@ -0,0 +1,76 @@
+"""Fast batched inserts shared by the dataset generator and the catalog importer.
+
+Rows are streamed in BATCH_ROWS chunks: COPY on PostgreSQL (psycopg2),
+executemany everywhere else. Callers allocate ids themselves (next_id) and
+call reset_sequences afterwards so later ORM inserts don't collide.
+"""
+import csv
+import io
+
+from sqlalchemy import func, insert, select, text
+
+BATCH_ROWS = 50_000
+
+
+def next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _copy_rows(conn, table, columns, rows):
+    cursor = conn.connection.dbapi_connection.cursor()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["\\N" if value is None else value for value in row])
+    buffer.seek(0)
+    quote = conn.dialect.identifier_preparer.quote
+    column_list = ", ".join(quote(column) for column in columns)
+    cursor.copy_expert(
+        f"COPY {quote(table.name)} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer
+    )
+    cursor.close()
+
+
+def bulk_load(conn, model, columns, rows):
+    """Write an iterable of tuples in BATCH_ROWS chunks; returns the row count."""
+    table = model.__table__
+    use_copy = conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2"
+    # Hand plain tuples straight to the driver's executemany; going through
+    # insert() re-processes every bound parameter in Python. Column defaults are
+    # therefore not applied, so callers pass every column they care about.
+    placeholder = {"qmark": "?", "format": "%s"}.get(conn.dialect.paramstyle)
+    quote = conn.dialect.identifier_preparer.quote
+    statement = (
+        f"INSERT INTO {quote(table.name)} ({', '.join(quote(column) for column in columns)}) "
+        f"VALUES ({', '.join([placeholder or ''] * len(columns))})"
+    )
+    written, batch = 0, []
+
+    def flush():
+        if use_copy:
+            _copy_rows(conn, table, columns, batch)
+        elif placeholder:
+            conn.exec_driver_sql(statement, batch)
+        else:
+            conn.execute(insert(table), [dict(zip(columns, row)) for row in batch])
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            flush()
+            written += len(batch)
+            batch = []
+    if batch:
+        flush()
+        written += len(batch)
+    return written
+
+
+def reset_sequences(conn, models):
+    if conn.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__tablename__
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
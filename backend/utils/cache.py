@@ -0,0 +1,36 @@
+"""Small thread-safe TTL cache for per-worker read caching."""
+import threading
+import time
+
+
+class TTLCache:
+    def __init__(self, ttl_seconds, max_entries=1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (stored_at, value)
+
+    def get(self, key, allow_stale=False):
+        """Return the cached value, or None if missing (or expired unless allow_stale)."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if not allow_stale and time.monotonic() - stored_at > self.ttl_seconds:
+            return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.max_entries:
+                # Drop the oldest entry; dicts keep insertion order
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (time.monotonic(), value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
@@ -0,0 +1,88 @@
+"""Write-side maintenance of the book_summaries read model.
+
+Catalog reads (get_all_books, get_book_details, the home rail) only ever touch
+book_summaries. Every write that changes what a listing shows must go through
+one of these helpers inside the same session/transaction as the write itself,
+so the projection can never drift from the source tables.
+"""
+from sqlalchemy import delete, func, insert, select, update
+
+from models import Audiobook, BookSummary, Category, Chapter
+
+
+def add_book_summary(db, book, first_chapter=None):
+    """Project a newly created book (and optionally its first chapter)."""
+    category_name = None
+    if book.category_id is not None:
+        category_name = db.execute(select(Category.name).where(Category.id == book.category_id)).scalar()
+
+    db.add(BookSummary(
+        book_id=book.id,
+        title=book.title,
+        author=book.author,
+        description=book.description,
+        category_id=book.category_id,
+        category_name=category_name,
+        creator_id=book.creator_id,
+        is_public=book.is_public,
+        cover_thumbnail_url=first_chapter.thumbnail_url if first_chapter else None,
+        first_chapter_audio_url=first_chapter.audio_url if first_chapter else None,
+        total_chapters=1 if first_chapter else 0,
+        created_at=book.created_at,
+    ))
+
+
+def add_chapter_to_summary(db, chapter):
+    """Account for a chapter appended to an existing book."""
+    db.execute(
+        update(BookSummary)
+        .where(BookSummary.book_id == chapter.audiobook_id)
+        .values(total_chapters=BookSummary.total_chapters + 1)
+    )
+    # Appended chapters only become the cover when the book had no chapters yet
+    db.execute(
+        update(BookSummary)
+        .where(BookSummary.book_id == chapter.audiobook_id, BookSummary.first_chapter_audio_url.is_(None))
+        .values(cover_thumbnail_url=chapter.thumbnail_url, first_chapter_audio_url=chapter.audio_url)
+    )
+
+
+def _summary_select():
+    def first_chapter(column):
+        return select(column).where(
+            Chapter.audiobook_id == Audiobook.id
+        ).order_by(Chapter.order).limit(1).scalar_subquery()
+
+    return select(
+        Audiobook.id,
+        Audiobook.title,
+        Audiobook.author,
+        Audiobook.description,
+        Audiobook.category_id,
+        Category.name,
+        Audiobook.creator_id,
+        Audiobook.is_public,
+        first_chapter(Chapter.thumbnail_url),
+        first_chapter(Chapter.audio_url),
+        select(func.count(Chapter.id)).where(Chapter.audiobook_id == Audiobook.id).scalar_subquery(),
+        Audiobook.created_at,
+    ).outerjoin(Category, Category.id == Audiobook.category_id)
+
+
+_SUMMARY_COLUMNS = [
+    "book_id", "title", "author", "description", "category_id", "category_name", "creator_id",
+    "is_public", "cover_thumbnail_url", "first_chapter_audio_url", "total_chapters", "created_at",
+]
+
+
+def rebuild_book_summaries(db, book_ids=None):
+    """Recompute summaries from the source tables (all books, or just book_ids)."""
+    query = _summary_select()
+    cleanup = delete(BookSummary)
+    if book_ids is not None:
+        book_ids = list(book_ids)
+        query = query.where(Audiobook.id.in_(book_ids))
+        cleanup = cleanup.where(BookSummary.book_id.in_(book_ids))
+
+    db.execute(cleanup)
+    db.execute(insert(BookSummary).from_select(_SUMMARY_COLUMNS, query))
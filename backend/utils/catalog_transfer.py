@@ -0,0 +1,269 @@
+"""Catalog dump and load as NDJSON, one row per line.
+
+    {"table": "_meta", "row": {"version": 1, "exported_at": "...", "tables": [...]}}
+    {"table": "users", "row": {"id": 1, "email": "...", ...}}
+
+Tables are written parents first (TRANSFER_TABLES order), so the importer can
+re-link foreign keys in a single pass. A subset export always includes the
+tables its rows reference (with_parents), and the importer refuses a dump that
+lacks them: without the parent rows there is nothing to re-link to. The export streams rows through a
+server-side cursor (yield_per / stream_results) and hands them out one
+partition at a time. Memory stays flat however many rows there are.
+
+The importer never trusts ids from the dump. Each row gets a fresh id after
+the target's current maximum, and foreign keys are rewritten through
+old -> new id maps. Only referenced tables keep a map (categories, users,
+audiobooks). A row that matches an existing one on its natural key
+(natural_key in TRANSFER_TABLES) is not inserted again:
+
+* categories match on name and users on email; the existing row is reused;
+* audiobooks match on (creator, title, author), where a book without a
+  creator matches one without a creator;
+* chapters match on (book, order), likes and listening history on
+  (user, book), and banners on image_url; a match is skipped.
+
+Re-importing the same dump is therefore a no-op. A reference to a row that is
+missing from its table in the dump is set to NULL when the column allows it,
+otherwise the row is skipped. The whole import is one transaction. Afterwards the derived
+book_summaries and library_entries rows are rebuilt for what changed.
+
+Password hashes are only exported with include_credentials. Users imported
+without one cannot log in until they reset their password.
+"""
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+import orjson
+from sqlalchemy import DateTime, select, tuple_
+
+from models import Audiobook, Banner, Category, Chapter, Like, ListeningHistory, User
+from utils.admin import chunked
+from utils.bulk_load import bulk_load, next_id, reset_sequences
+from utils.catalog import rebuild_book_summaries
+from utils.library import rebuild_library
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+EXPORT_BATCH_ROWS = 10_000
+IMPORT_BATCH_ROWS = 5_000
+CREDENTIAL_COLUMNS = {"users": ("password_hash",)}
+
+# references: column -> (parent table, whether a row without the parent is skipped rather than nulled)
+TransferTable = namedtuple("TransferTable", ["model", "references", "natural_key"])
+
+TRANSFER_TABLES = {
+    "categories": TransferTable(Category, {}, ("name",)),
+    "users": TransferTable(User, {}, ("email",)),
+    "audiobooks": TransferTable(
+        Audiobook, {"category_id": ("categories", False), "creator_id": ("users", False)},
+        ("creator_id", "title", "author"),
+    ),
+    "chapters": TransferTable(Chapter, {"audiobook_id": ("audiobooks", True)}, ("audiobook_id", "order")),
+    "banners": TransferTable(Banner, {"uploader_id": ("users", True)}, ("image_url",)),
+    "likes": TransferTable(Like, {"user_id": ("users", True), "book_id": ("audiobooks", True)}, ("user_id", "book_id")),
+    "listening_history": TransferTable(
+        ListeningHistory, {"user_id": ("users", True), "book_id": ("audiobooks", True)}, ("user_id", "book_id"),
+    ),
+}
+# Existing rows that match on these are reused (their id is mapped) instead of skipped
+REUSED_TABLES = ("categories", "users", "audiobooks")
+
+
+def _line(table, row):
+    return orjson.dumps({"table": table, "row": row}) + b"\n"
+
+
+def export_columns(name, include_credentials=False):
+    excluded = () if include_credentials else CREDENTIAL_COLUMNS.get(name, ())
+    return [column for column in TRANSFER_TABLES[name].model.__table__.columns if column.name not in excluded]
+
+
+def with_parents(tables):
+    """tables plus every table their rows reference, in TRANSFER_TABLES order"""
+    needed = set(tables)
+    # Children come after their parents, so walking backwards also reaches grandparents
+    for name in reversed(TRANSFER_TABLES):
+        if name in needed:
+            needed.update(parent for parent, _ in TRANSFER_TABLES[name].references.values())
+    return [name for name in TRANSFER_TABLES if name in needed]
+
+
+def export_ndjson(conn, tables=None, include_credentials=False, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield the dump as bytes, one chunk per batch_rows rows"""
+    if tables is None:
+        tables = list(TRANSFER_TABLES)
+    else:
+        selected, tables = set(tables), with_parents(tables)
+        if len(tables) > len(selected):
+            logger.info(f"Also exporting {', '.join(name for name in tables if name not in selected)} to keep references")
+    yield _line("_meta", {"version": FORMAT_VERSION, "exported_at": datetime.utcnow(), "tables": tables})
+    streaming = conn.execution_options(stream_results=True, yield_per=batch_rows)
+    for name in tables:
+        columns = export_columns(name, include_credentials)
+        keys = [column.name for column in columns]
+        result = streaming.execute(select(*columns).order_by(TRANSFER_TABLES[name].model.__table__.c.id))
+        exported = 0
+        for partition in result.partitions():
+            yield b"".join(_line(name, dict(zip(keys, row))) for row in partition)
+            exported += len(partition)
+        logger.info(f"Exported {exported} {name}")
+
+
+class CatalogImporter:
+    """Feed it parsed lines with add(); finish() writes the last batch and rebuilds derived tables"""
+
+    def __init__(self, db, batch_rows=IMPORT_BATCH_ROWS):
+        self.db = db
+        self.conn = db.connection()
+        self.batch_rows = batch_rows
+        self.id_maps = {name: {} for name in REUSED_TABLES}
+        self.next_ids = {}
+        self.counts = {name: {"inserted": 0, "matched": 0, "skipped": 0} for name in TRANSFER_TABLES}
+        self.touched_book_ids = set()
+        self.touched_user_ids = set()
+        self.tables = None
+        self._table = None
+        self._batch = []
+
+    def add(self, record):
+        table, row = record.get("table"), record.get("row")
+        if table == "_meta":
+            if row.get("version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported catalog dump version {row.get('version')}")
+            self.tables = set(row.get("tables") or ())
+            missing = [name for name in with_parents(self.tables & set(TRANSFER_TABLES)) if name not in self.tables]
+            if missing:
+                raise ValueError(f"Catalog dump references {', '.join(missing)} but does not include them")
+            return
+        if table not in TRANSFER_TABLES or not isinstance(row, dict):
+            raise ValueError(f"Unknown catalog table {table!r}")
+        if self.tables is None:
+            raise ValueError("Catalog dump must start with a _meta line")
+        if table not in self.tables:
+            raise ValueError(f"Catalog table {table!r} is not listed in the dump's _meta line")
+        if table != self._table:
+            self._flush()
+            self._table = table
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_rows:
+            self._flush()
+
+    def finish(self):
+        self._flush()
+        models = [spec.model for spec in TRANSFER_TABLES.values()]
+        reset_sequences(self.conn, models)
+        for chunk in chunked(sorted(self.touched_book_ids)):
+            rebuild_book_summaries(self.db, chunk)
+        for chunk in chunked(sorted(self.touched_user_ids)):
+            rebuild_library(self.db, chunk)
+        return self.counts
+
+    def _flush(self):
+        if not self._batch:
+            return
+        name, rows = self._table, self._batch
+        self._batch = []
+        spec = TRANSFER_TABLES[name]
+        table = spec.model.__table__
+        counts = self.counts[name]
+
+        columns = [column.name for column in table.columns if column.name != "id" and column.name in rows[0]]
+        dates = [column.name for column in table.columns if isinstance(column.type, DateTime) and column.name in columns]
+        linked = []
+        for row in rows:
+            row = {column: row.get(column) for column in columns} | {"id": row.get("id")}
+            if not self._relink(spec, row):
+                counts["skipped"] += 1
+                continue
+            for column in dates:
+                if isinstance(row[column], str):
+                    row[column] = datetime.fromisoformat(row[column])
+            linked.append(row)
+
+        existing = self._existing(table, spec.natural_key, linked)
+        id_map = self.id_maps.get(name)
+        if name not in self.next_ids:
+            self.next_ids[name] = next_id(self.conn, spec.model)
+        new_rows = []
+        for row in linked:
+            key = tuple(row.get(column) for column in spec.natural_key)
+            if all(value is None for value in key):
+                key = None
+            match = existing.get(key) if key is not None else None
+            if match is not None:
+                counts["matched"] += 1
+                if id_map is not None and row["id"] is not None:
+                    id_map[row["id"]] = match
+                continue
+            new_id = self.next_ids[name]
+            self.next_ids[name] += 1
+            if id_map is not None and row["id"] is not None:
+                id_map[row["id"]] = new_id
+            if key is not None:
+                # Later duplicates in the same dump match this row
+                existing[key] = new_id
+            new_rows.append((new_id, *(row[column] for column in columns)))
+            self._touch(name, new_id, row)
+
+        counts["inserted"] += bulk_load(self.conn, spec.model, ["id", *columns], new_rows)
+
+    def _touch(self, name, new_id, row):
+        """Note the books and users whose derived rows the new row changes"""
+        if name == "audiobooks":
+            self.touched_book_ids.add(new_id)
+            if row.get("creator_id") is not None:
+                self.touched_user_ids.add(row["creator_id"])
+        elif name == "chapters":
+            self.touched_book_ids.add(row["audiobook_id"])
+        elif name in ("likes", "listening_history"):
+            self.touched_user_ids.add(row["user_id"])
+
+    def _relink(self, spec, row):
+        for column, (parent, required) in spec.references.items():
+            if row.get(column) is None:
+                continue
+            row[column] = self.id_maps[parent].get(row[column])
+            if row[column] is None and required:
+                return False
+        return True
+
+    def _existing(self, table, natural_key, rows):
+        """{natural key: id} of target rows matching rows; a None in a key matches NULL"""
+        # IN never matches NULL, so keys are grouped by which of their columns are None
+        by_nulls = {}
+        for row in rows:
+            key = tuple(row.get(column) for column in natural_key)
+            by_nulls.setdefault(tuple(value is None for value in key), set()).add(key)
+        key_columns = [table.c[column] for column in natural_key]
+        existing = {}
+        for nulls, keys in by_nulls.items():
+            if all(nulls):
+                continue
+            present = [column for column, null in zip(key_columns, nulls) if not null]
+            values = [tuple(value for value, null in zip(key, nulls) if not null) for key in keys]
+            if len(present) == 1:
+                condition = present[0].in_([value[0] for value in values])
+            else:
+                condition = tuple_(*present).in_(values)
+            absent = [column.is_(None) for column, null in zip(key_columns, nulls) if null]
+            for row in self.conn.execute(select(table.c.id, *key_columns).where(condition, *absent)):
+                existing[tuple(row[1:])] = row[0]
+        return existing
+
+
+def import_ndjson(db, lines):
+    """Load a dump from an iterable of NDJSON lines (bytes or str) in db's transaction; returns per-table counts"""
+    importer = CatalogImporter(db)
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {str(e)}")
+        importer.add(record)
+    counts = importer.finish()
+    logger.info(f"Imported catalog: {counts}")
+    return counts
@@ -0,0 +1,103 @@
+"""On-disk LRU cache of fixed-size blob segments for the streaming proxy.
+
+Each blob is split into chunk_size pieces stored as individual files under
+<directory>/<sha1(blob)[:2]>/<sha1(blob)>.<index>. The LRU order and byte total
+are kept in memory and rebuilt from file mtimes on startup, so a restarted worker
+keeps its warm cache.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class ChunkCache:
+    def __init__(self, directory, chunk_size, max_bytes):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_existing()
+
+    def _load_existing(self):
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.startswith("."):
+                    # Leftover temp file from an interrupted write
+                    os.unlink(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, key, index):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.{index}")
+
+    def open(self, key, index):
+        """Return an open binary file for a cached chunk, or None on a miss.
+
+        The file is opened under the lock, so a concurrent eviction can unlink
+        it but the caller can still read it to the end.
+        """
+        path = self._path(key, index)
+        with self._lock:
+            if path not in self._entries:
+                return None
+            try:
+                handle = open(path, "rb")
+            except FileNotFoundError:
+                self._total_bytes -= self._entries.pop(path)
+                return None
+            self._entries.move_to_end(path)
+        return handle
+
+    def put(self, key, index, data):
+        path = self._path(key, index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial chunk
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if path in self._entries:
+                self._total_bytes -= self._entries.pop(path)
+            self._entries[path] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        # Caller holds the lock (or is the constructor)
+        while self._total_bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, key):
+        """Forget every chunk of a blob, e.g. after it was overwritten."""
+        prefix = self._path(key, "")
+        with self._lock:
+            for path in [path for path in self._entries if path.startswith(prefix)]:
+                self._total_bytes -= self._entries.pop(path)
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
@@ -0,0 +1,211 @@
+"""In-process TF-IDF index over book metadata for "more like this".
+
+Collaborative filtering (utils/item_similarity.py) can't place books nobody has
+listened to yet, so this index compares the text itself: title, author,
+description and category name. Terms are hashed into a fixed-size feature space,
+which keeps the index append-only: a new book is one more sparse float32 row and
+a document-frequency update, no vocabulary rebuild. IDF weights are applied at
+query time so old rows never have to be rewritten.
+"""
+import math
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import or_, select
+
+from models import Audiobook, Category
+
+N_FEATURES = 2 ** 18
+
+# Fields are prefixed so an author called "Rose" doesn't match a title about roses
+FIELD_WEIGHTS = {
+    "title": 2.0,
+    "author": 1.5,
+    "category": 1.0,
+    "description": 1.0,
+}
+
+# How often a worker checks the DB for books uploaded through another worker
+SYNC_INTERVAL_SECONDS = 5.0
+# Ids are assigned at flush, not commit, so a lower id can become visible after a
+# higher one. Unseen ids below the high-water mark are re-checked for this long
+# (longer than any upload transaction) before they are taken to be rolled back or deleted.
+MISSING_ID_TTL_SECONDS = 600.0
+# Caps the id list sent with each sync; a gap this wide is old deletions, not uncommitted uploads
+MAX_MISSING_IDS = 1000
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _hash_terms(fields):
+    """Turn {field: text} into {feature: weighted sublinear term frequency}."""
+    counts = {}
+    for field, text in fields.items():
+        if not text:
+            continue
+        weight = FIELD_WEIGHTS[field]
+        for token in _TOKEN_RE.findall(text.lower()):
+            if len(token) < 2:
+                continue
+            feature = zlib.crc32(f"{field}:{token}".encode("utf-8")) % N_FEATURES
+            counts[feature] = counts.get(feature, 0.0) + weight
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+class ContentIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._book_ids = np.zeros(0, dtype=np.int64)
+        self._rows = sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+        self._pending_ids = []
+        self._pending_rows = []
+        self._doc_freq = np.zeros(N_FEATURES, dtype=np.float32)
+        self._indexed = set()
+        self._last_book_id = 0
+        # Ids below _last_book_id not seen yet -> when the gap was noticed
+        self._missing = {}
+        self._last_sync = 0.0
+
+    def __len__(self):
+        return len(self._book_ids) + len(self._pending_ids)
+
+    def add_book(self, book_id, title, author, description, category):
+        terms = _hash_terms({
+            "title": title,
+            "author": author,
+            "description": description,
+            "category": category,
+        })
+        features = np.fromiter(terms.keys(), dtype=np.int32, count=len(terms))
+        values = np.fromiter(terms.values(), dtype=np.float32, count=len(terms))
+        row = sparse.csr_matrix((values, (np.zeros(len(terms), dtype=np.int32), features)), shape=(1, N_FEATURES))
+
+        with self._lock:
+            if book_id in self._indexed:
+                return
+            self._pending_ids.append(book_id)
+            self._pending_rows.append(row)
+            self._doc_freq[features] += 1.0
+            self._indexed.add(book_id)
+            self._missing.pop(book_id, None)
+            if book_id > self._last_book_id:
+                now = time.monotonic()
+                for gap_id in range(max(self._last_book_id + 1, book_id - MAX_MISSING_IDS), book_id):
+                    if gap_id not in self._indexed:
+                        self._missing[gap_id] = now
+                self._last_book_id = book_id
+
+    def sync(self, db, force=False):
+        """Index any books committed since the last sync (e.g. by another worker)."""
+        now = time.monotonic()
+        if not force and now - self._last_sync < SYNC_INTERVAL_SECONDS:
+            return
+        self._last_sync = now
+
+        with self._lock:
+            for book_id, noticed in list(self._missing.items()):
+                if now - noticed > MISSING_ID_TTL_SECONDS:
+                    del self._missing[book_id]
+            missing = sorted(self._missing)[-MAX_MISSING_IDS:]
+            last_book_id = self._last_book_id
+
+        condition = Audiobook.id > last_book_id
+        if missing:
+            condition = or_(condition, Audiobook.id.in_(missing))
+        self._load(db, condition)
+
+    def refresh(self, db, book_ids):
+        """Re-index edited books and drop deleted ones, after the change is committed.
+
+        Only this worker's index is updated; other workers keep the old terms
+        for these books until they restart.
+        """
+        self.remove_books(book_ids)
+        self._load(db, Audiobook.id.in_(book_ids))
+
+    def remove_books(self, book_ids):
+        removed = set(book_ids)
+        with self._lock:
+            self._compact()
+            mask = np.isin(self._book_ids, np.fromiter(removed, dtype=np.int64, count=len(removed)))
+            if mask.any():
+                # Each row holds a feature at most once, so its indices are its document-frequency contribution
+                dropped = self._rows[mask]
+                self._doc_freq -= np.bincount(dropped.indices, minlength=N_FEATURES).astype(np.float32)
+                self._rows = self._rows[~mask]
+                self._book_ids = self._book_ids[~mask]
+            self._indexed -= removed
+            for book_id in removed:
+                self._missing.pop(book_id, None)
+
+    def _load(self, db, condition):
+        rows = db.execute(
+            select(Audiobook.id, Audiobook.title, Audiobook.author, Audiobook.description, Category.name)
+            .outerjoin(Category, Category.id == Audiobook.category_id)
+            .where(condition)
+            .order_by(Audiobook.id)
+        )
+        for book_id, title, author, description, category in rows:
+            self.add_book(book_id, title, author, description, category)
+
+    def _compact(self):
+        # Caller holds the lock. Appending one row at a time to a CSR matrix is
+        # quadratic, so new rows are buffered and stacked on the next query.
+        if self._pending_rows:
+            self._rows = sparse.vstack([self._rows] + self._pending_rows, format="csr", dtype=np.float32)
+            self._book_ids = np.concatenate([self._book_ids, np.array(self._pending_ids, dtype=np.int64)])
+            self._pending_rows = []
+            self._pending_ids = []
+        return self._rows, self._book_ids, self._doc_freq.copy()
+
+    def similar_many(self, book_ids, k=10):
+        """Return {book_id: [(similar_book_id, score), ...]} for every indexed query id."""
+        with self._lock:
+            rows, indexed_ids, doc_freq = self._compact()
+
+        if not len(indexed_ids):
+            return {}
+        positions = {book_id: i for i, book_id in enumerate(indexed_ids.tolist())}
+        query_positions = [positions[book_id] for book_id in book_ids if book_id in positions]
+        if not query_positions:
+            return {}
+
+        n_docs = np.float32(len(indexed_ids))
+        idf = np.log((1.0 + n_docs) / (1.0 + doc_freq)).astype(np.float32) + np.float32(1.0)
+        idf_squared = idf * idf
+
+        # ||tf * idf|| for every row, computed without materialising the weighted matrix
+        norms = np.sqrt(rows.multiply(rows) @ idf_squared).astype(np.float32)
+        norms[norms == 0] = 1.0
+
+        queries = rows[query_positions]
+        # One sparse matrix product scores every query against every book
+        weighted_queries = (queries @ sparse.diags(idf_squared)).T.tocsc()
+        scores = (rows @ weighted_queries).toarray()
+        scores /= norms[:, None]
+        scores /= norms[query_positions][None, :]
+
+        k = min(k, len(indexed_ids) - 1)
+        results = {}
+        for column, position in enumerate(query_positions):
+            column_scores = scores[:, column]
+            column_scores[position] = -1.0
+            if k <= 0:
+                results[int(indexed_ids[position])] = []
+                continue
+            top = np.argpartition(column_scores, -k)[-k:]
+            top = top[np.argsort(-column_scores[top])]
+            results[int(indexed_ids[position])] = [
+                (int(indexed_ids[i]), float(column_scores[i])) for i in top if column_scores[i] > 0
+            ]
+        return results
+
+    def similar(self, book_id, k=10):
+        return self.similar_many([book_id], k).get(book_id, [])
+
+
+content_index = ContentIndex()
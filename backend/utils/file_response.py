@@ -0,0 +1,75 @@
+"""Range parsing and zero-copy file responses shared by the media endpoints."""
+from fastapi.responses import Response
+
+
+def parse_range(header: str, size: int):
+    """Parse a single 'bytes=' range into inclusive (start, end).
+
+    Returns None when the header should be ignored (absent, malformed or multiple
+    ranges; serving the full body is always allowed) and raises ValueError when
+    the range can't be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[6:].strip().partition("-")
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+    if start is None:
+        if not end:
+            raise ValueError("empty suffix range")
+        return max(size - end, 0), size - 1
+    end = size - 1 if end is None else end
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, min(end, size - 1)
+
+
+async def single_segment(handle, offset, count):
+    yield handle, offset, count
+
+
+class FileSegmentsResponse(Response):
+    """Sends (file, offset, count) segments, zero-copy when the server offers it.
+
+    ASGI apps never see the socket, so os.sendfile is only reachable through the
+    server's 'http.response.zerocopysend' extension; without it each segment is
+    read from the (page-cached) file and sent as a normal body message. Every
+    file handed out by the segment iterator is closed once sent.
+    """
+
+    read_size = 1024 * 1024
+
+    def __init__(self, segments, status_code: int, headers: dict, media_type: str):
+        self.segments = segments
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        async for handle, offset, count in self.segments:
+            try:
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": handle.fileno(),
+                        "offset": offset,
+                        "count": count,
+                        "more_body": True,
+                    })
+                    continue
+                handle.seek(offset)
+                while count > 0:
+                    data = handle.read(min(count, self.read_size))
+                    if not data:
+                        break
+                    count -= len(data)
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            finally:
+                handle.close()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,184 @@
+"""Idempotency-Key support for write endpoints.
+
+A client that may retry a write sends the same Idempotency-Key header on
+every attempt. Only the first attempt runs. Later attempts get the stored
+response back, with an Idempotent-Replayed: true header, and nothing is
+uploaded or inserted again.
+
+    call = begin("audio_upload", idempotency_key, fingerprint(...))
+    if call.replay is not None:
+        return call.replay
+    try:
+        ...
+        call.complete(db, 200, result)   # same transaction as the rows it created
+        db.commit()
+    except Exception:
+        call.release()                   # a failed attempt may be retried
+        raise
+
+Keys are scoped per endpoint and remembered for RETENTION_HOURS. Outcomes:
+
+* a key reused with a different request gets 422;
+* a key whose first request is still running gets 409;
+* a key held by a request that died without finishing is taken over after
+  LOCK_TIMEOUT_SECONDS.
+
+The in-flight claim is committed on its own, so concurrent retries see it
+immediately. The stored response is written in the handler's transaction,
+so a crash can never leave rows created without a response to replay.
+"""
+import hashlib
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+import orjson
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import and_, delete, update
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+RETENTION_HOURS = float(os.getenv("IDEMPOTENCY_RETENTION_HOURS", 24))
+# Longer than the slowest upload, so a live request is never taken over
+LOCK_TIMEOUT_SECONDS = 15 * 60
+# Share of claims that also delete expired keys, so the table stays bounded without a job
+PURGE_PROBABILITY = 0.01
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def fingerprint(*parts):
+    """Stable digest of the parts of a request that must match on a retry"""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def file_digest(handle):
+    """SHA-256 of a spooled upload, read in chunks; rewinds the file afterwards"""
+    digest = hashlib.sha256()
+    handle.seek(0)
+    for chunk in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    handle.seek(0)
+    return digest.hexdigest()
+
+
+class IdempotentCall:
+    def __init__(self, scope=None, key=None, request_fingerprint=None, replay=None):
+        self.scope = scope
+        self.key = key
+        self.request_fingerprint = request_fingerprint
+        self.replay = replay
+
+    @property
+    def token(self):
+        """Short stable name for this key and request (e.g. for blob names)
+
+        A retry gets the same token, so it overwrites instead of duplicating.
+        A different request that takes over an expired or abandoned key gets
+        another one, so it can't overwrite the first request's blobs.
+        """
+        if self.key is None:
+            return None
+        return fingerprint(self.scope, self.key, self.request_fingerprint)[:16]
+
+    def complete(self, db, status_code, body):
+        """Store the response in db's transaction; commit it together with the work it describes"""
+        if self.key is None:
+            return
+        db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.scope == self.scope, IdempotencyKey.key == self.key)
+            .values(status_code=status_code, response_body=orjson.dumps(body).decode("utf-8"))
+        )
+
+    def release(self):
+        """Forget an unfinished claim so the client's next retry runs again"""
+        if self.key is None:
+            return
+        session = SessionLocal()
+        try:
+            session.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.scope == self.scope,
+                    IdempotencyKey.key == self.key,
+                    IdempotencyKey.status_code.is_(None),
+                )
+            )
+            session.commit()
+        except Exception as e:
+            logger.error(f"Could not release idempotency key {self.scope}/{self.key}: {str(e)}")
+        finally:
+            session.close()
+
+
+def _replay(record):
+    response = ORJSONResponse(orjson.loads(record.response_body), status_code=record.status_code)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def begin(scope, key, request_fingerprint):
+    """Claim key for this request, or return the stored response. Without a key, a no-op call."""
+    if key is None:
+        return IdempotentCall()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    session = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        if random.random() < PURGE_PROBABILITY:
+            session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.created_at < now - timedelta(hours=RETENTION_HOURS))
+            )
+            session.commit()
+
+        session.add(IdempotencyKey(scope=scope, key=key, fingerprint=request_fingerprint, created_at=now))
+        try:
+            session.commit()
+            return IdempotentCall(scope, key, request_fingerprint)
+        except IntegrityError:
+            session.rollback()
+
+        record = session.get(IdempotencyKey, (scope, key))
+        if record is None:
+            # Released between our insert and this read; the client retries
+            raise HTTPException(status_code=409, detail="Request with this Idempotency-Key is being retried",
+                                headers={"Retry-After": "1"})
+        expired = record.created_at < now - timedelta(hours=RETENTION_HOURS)
+        if record.fingerprint != request_fingerprint and not expired:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if record.status_code is not None and not expired:
+            return IdempotentCall(scope, key, request_fingerprint, replay=_replay(record))
+        if record.status_code is None and record.created_at > now - timedelta(seconds=LOCK_TIMEOUT_SECONDS):
+            raise HTTPException(status_code=409, detail="Request with this Idempotency-Key is still in progress",
+                                headers={"Retry-After": "5"})
+
+        # Expired, or abandoned by a request that died: take it over unless someone else just did
+        taken = session.execute(
+            update(IdempotencyKey)
+            .where(and_(
+                IdempotencyKey.scope == scope,
+                IdempotencyKey.key == key,
+                IdempotencyKey.created_at == record.created_at,
+            ))
+            .values(fingerprint=request_fingerprint, status_code=None, response_body=None, created_at=now)
+        ).rowcount
+        session.commit()
+        if not taken:
+            raise HTTPException(status_code=409, detail="Request with this Idempotency-Key is still in progress",
+                                headers={"Retry-After": "5"})
+        return IdempotentCall(scope, key, request_fingerprint)
+    finally:
+        session.close()
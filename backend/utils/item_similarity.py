@@ -0,0 +1,93 @@
+"""Item-to-item collaborative filtering for "listeners also liked".
+
+Everything here works on plain NumPy/SciPy arrays so the same code is used by the
+offline job (jobs/build_item_similarity.py) and by the benchmark
+(benchmarks/bench_item_similarity.py).
+"""
+import numpy as np
+from scipy import sparse
+
+# How much a single signal counts towards a user/book interaction
+LIKE_WEIGHT = 1.0
+LISTEN_WEIGHT = 0.5
+PROGRESS_WEIGHT = 0.5
+
+# Upper bound for the dense similarity block held in memory at once (bytes)
+DEFAULT_BLOCK_BYTES = 256 * 1024 * 1024
+
+
+def build_interaction_matrix(user_ids, book_ids, weights):
+    """Build a sparse users x books matrix from parallel arrays of interactions.
+
+    Returns (matrix, book_index) where book_index[i] is the book id of column i.
+    Duplicate (user, book) pairs are summed.
+    """
+    user_ids = np.asarray(user_ids)
+    book_ids = np.asarray(book_ids)
+    weights = np.asarray(weights, dtype=np.float32)
+
+    _, user_rows = np.unique(user_ids, return_inverse=True)
+    book_index, book_cols = np.unique(book_ids, return_inverse=True)
+
+    matrix = sparse.csr_matrix(
+        (weights, (user_rows, book_cols)),
+        shape=(int(user_rows.max()) + 1 if len(user_rows) else 0, len(book_index)),
+        dtype=np.float32,
+    )
+    matrix.sum_duplicates()
+    return matrix, book_index
+
+
+def top_k_similar_items(matrix, k=20, block_bytes=DEFAULT_BLOCK_BYTES, min_score=0.0):
+    """Compute the top-k cosine neighbours of every column of a users x items matrix.
+
+    Similarities are computed one block of items at a time so that the dense
+    block never exceeds block_bytes. Returns (neighbors, scores), both shaped
+    (n_items, k); missing neighbours are marked with -1 and a score of 0.
+    """
+    n_items = matrix.shape[1]
+    k = max(0, min(k, n_items - 1))
+    neighbors = np.full((n_items, k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, k), dtype=np.float32)
+    if n_items == 0 or k == 0:
+        return neighbors, scores
+
+    # Normalise columns so a plain dot product is the cosine similarity
+    matrix = sparse.csc_matrix(matrix, dtype=np.float32)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = matrix @ sparse.diags(inv_norms.astype(np.float32))
+    items_by_users = normalized.T.tocsr()
+    normalized = normalized.tocsc()
+
+    block_size = max(1, min(n_items, block_bytes // (n_items * 4)))
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        block = (items_by_users[start:stop] @ normalized).toarray()
+
+        # An item is never its own neighbour
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -1.0
+
+        top = np.argpartition(block, -k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        keep = top_scores > min_score
+        neighbors[start:stop] = np.where(keep, top, -1)
+        scores[start:stop] = np.where(keep, top_scores, 0.0)
+
+    return neighbors, scores
+
+
+def similarity_rows(book_index, neighbors, scores):
+    """Yield (book_id, rank, similar_book_id, score) tuples ready for bulk insert."""
+    for item, (item_neighbors, item_scores) in enumerate(zip(neighbors, scores)):
+        rank = 0
+        for neighbor, score in zip(item_neighbors, item_scores):
+            if neighbor < 0:
+                break
+            rank += 1
+            yield int(book_index[item]), rank, int(book_index[neighbor]), float(score)
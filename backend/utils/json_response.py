@@ -0,0 +1,58 @@
+"""Response classes for listings: orjson by default, MessagePack on request."""
+from datetime import date, datetime
+
+from fastapi.responses import ORJSONResponse
+
+from utils.negotiation import MSGPACK_MEDIA_TYPE, wants_msgpack
+
+try:
+    import msgpack
+except ImportError:  # optional: without it every client gets JSON
+    msgpack = None
+
+
+def _msgpack_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} as MessagePack")
+
+
+def encode_msgpack(content):
+    """Shared MessagePack encoder. Datetimes become ISO strings, as in the JSON."""
+    return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+
+class ListingResponse(ORJSONResponse):
+    """JSON for everyone, MessagePack for clients that send Accept: application/msgpack.
+
+    The decision comes from ContentNegotiationMiddleware via wants_msgpack, since
+    FastAPI builds the response without handing it the request. The payload has
+    the same structure in both encodings.
+    """
+
+    def __init__(self, content=None, status_code=200, headers=None, **kwargs):
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept"
+        super().__init__(content, status_code, headers, **kwargs)
+
+    def render(self, content):
+        if msgpack is not None and wants_msgpack.get():
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return encode_msgpack(content)
+        return super().render(content)
+
+
+class RowsResponse(ListingResponse):
+    """A JSON array of objects built straight from SQLAlchemy column rows.
+
+    FastAPI skips response_model validation when a route returns a Response, so
+    listings of rows whose columns already match the route's response_model go
+    from tuples to bytes without building a model per row. Validating Row
+    objects with from_attributes costs several times more than the encoding
+    itself. Keep response_model on the route for the OpenAPI schema, and only
+    use this for rows whose column labels are exactly the model's fields.
+    """
+
+    def __init__(self, rows, **kwargs):
+        keys = rows[0]._fields if rows else ()
+        super().__init__([dict(zip(keys, row)) for row in rows], **kwargs)
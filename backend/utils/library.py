@@ -0,0 +1,87 @@
+"""Write-side maintenance of the library_entries read model.
+
+A user's library is every book they created, liked or started listening to,
+ordered by their latest activity on it. The /library endpoint pages through
+library_entries with a keyset range on (user_id, last_activity, book_id),
+which the covering index answers with an index-only scan. Merging likes,
+listening history and owned books at read time would mean aggregating all of
+a user's rows for every page.
+
+Like utils/catalog.py, every write that changes a library must call
+record_activity in the same session and transaction as the write.
+"""
+from datetime import datetime
+
+from sqlalchemy import Integer, case, delete, func, insert, literal, null, select, union_all, update
+
+from models import Audiobook, LibraryEntry, Like, ListeningHistory
+
+# Activity time for likes recorded before likes had a timestamp
+UNKNOWN_ACTIVITY = datetime(1970, 1, 1)
+
+
+def record_activity(db, user_id, book_id, at, owned=None, liked=None, progress=None):
+    """Move a book to the top of a user's library, setting whichever flags are given"""
+    if user_id is None or book_id is None:
+        return
+    values = {"last_activity": at}
+    if owned is not None:
+        values["owned"] = owned
+    if liked is not None:
+        values["liked"] = liked
+    if progress is not None:
+        values["progress"] = progress
+
+    updated = db.execute(
+        update(LibraryEntry)
+        .where(LibraryEntry.user_id == user_id, LibraryEntry.book_id == book_id)
+        .values(**values)
+    ).rowcount
+    if not updated:
+        db.add(LibraryEntry(
+            user_id=user_id, book_id=book_id, last_activity=at,
+            owned=bool(owned), liked=bool(liked), progress=progress,
+        ))
+        # Surface a concurrent insert of the same entry here, inside the caller's error handling
+        db.flush()
+
+
+def _library_select(user_ids=None):
+    sources = union_all(
+        select(
+            Audiobook.creator_id.label("user_id"), Audiobook.id.label("book_id"),
+            Audiobook.created_at.label("at"), literal(1, Integer).label("owned"),
+            literal(0, Integer).label("liked"), null().label("progress"),
+        ).where(Audiobook.creator_id.isnot(None)),
+        select(
+            Like.user_id, Like.book_id, Like.created_at, literal(0, Integer), literal(1, Integer), null(),
+        ).where(Like.user_id.isnot(None), Like.book_id.isnot(None)),
+        select(
+            ListeningHistory.user_id, ListeningHistory.book_id, ListeningHistory.last_played,
+            literal(0, Integer), literal(0, Integer), ListeningHistory.progress,
+        ).where(ListeningHistory.user_id.isnot(None), ListeningHistory.book_id.isnot(None)),
+    ).subquery()
+
+    query = select(
+        sources.c.user_id,
+        sources.c.book_id,
+        func.coalesce(func.max(sources.c.at), UNKNOWN_ACTIVITY),
+        case((func.max(sources.c.owned) == 1, True), else_=False),
+        case((func.max(sources.c.liked) == 1, True), else_=False),
+        func.max(sources.c.progress),
+    ).group_by(sources.c.user_id, sources.c.book_id)
+    if user_ids is not None:
+        query = query.where(sources.c.user_id.in_(user_ids))
+    return query
+
+
+def rebuild_library(db, user_ids=None):
+    """Recompute library entries from the source tables (all users, or just user_ids)."""
+    cleanup = delete(LibraryEntry)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        cleanup = cleanup.where(LibraryEntry.user_id.in_(user_ids))
+    db.execute(cleanup)
+    db.execute(insert(LibraryEntry).from_select(
+        ["user_id", "book_id", "last_activity", "owned", "liked", "progress"], _library_select(user_ids)
+    ))
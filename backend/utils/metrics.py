@@ -0,0 +1,249 @@
+"""Prometheus-style metrics without a lock on the hot path.
+
+Every metric keeps one shard per thread. A thread only ever writes to its own
+shard, so recording is a plain dict/list update; the shards are summed only when
+/metrics is scraped. Registering a new thread's shard is the only locked step
+and happens once per thread.
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+_registry = []
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        _registry.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _snapshot(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        # dict.copy() is atomic under the GIL, so a concurrently written shard is safe to copy
+        return [shard.copy() for shard in shards]
+
+    def _labels(self, labels):
+        if not labels:
+            return ""
+        pairs = []
+        for name, value in zip(self.labelnames, labels):
+            value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+            pairs.append(f'{name}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1.0, labels=()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+    def _totals(self):
+        totals = {}
+        for shard in self._snapshot():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0.0) + value
+        return totals
+
+    def _render_samples(self):
+        for labels, value in sorted(self._totals().items()):
+            yield f"{self.name}{self._labels(labels)} {value}"
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount=1.0, labels=()):
+        self.inc(-amount, labels)
+
+    def set(self, value, labels=()):
+        """Only for gauges with a single (serialised) writer: moves the summed total to value"""
+        self.inc(value - self._totals().get(labels, 0.0), labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        series = shard.get(labels)
+        if series is None:
+            # [per-bucket counts..., +Inf count, sum]
+            series = [0] * (len(self.buckets) + 1) + [0.0]
+            shard[labels] = series
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _render_samples(self):
+        totals = {}
+        for shard in self._snapshot():
+            for labels, series in shard.items():
+                merged = totals.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+                for i, value in enumerate(list(series)):
+                    merged[i] += value
+
+        for labels, series in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                bucket_labels = self._labels(labels)[:-1] + "," if labels else "{"
+                yield f'{self.name}_bucket{bucket_labels}le="{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{self._labels(labels)} {series[-1]}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# HTTP
+http_request_duration = Histogram(
+    "darati_http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+http_requests_in_flight = Gauge(
+    "darati_http_requests_in_flight", "Requests currently being handled")
+http_response_size = Histogram(
+    "darati_http_response_size_bytes", "Response body size by route", ("route",), SIZE_BUCKETS)
+http_requests_rejected = Counter(
+    "darati_http_requests_rejected_total", "Requests refused by rate limiting or admission control",
+    ("route_class", "reason"))
+
+# Database
+db_query_duration = Histogram(
+    "darati_db_query_duration_seconds", "Duration of individual SQL statements")
+db_queries_per_request = Histogram(
+    "darati_db_queries_per_request", "SQL statements issued per request", ("route",), COUNT_BUCKETS)
+db_time_per_request = Histogram(
+    "darati_db_time_per_request_seconds", "Total SQL time per request", ("route",))
+db_replica_lag = Gauge(
+    "darati_db_replica_lag_seconds", "Replication lag of each read replica (-1 when unreachable)", ("replica",))
+
+# Storage
+storage_upload_bytes = Counter(
+    "darati_storage_upload_bytes_total", "Bytes uploaded to media storage", ("backend",))
+storage_upload_duration = Histogram(
+    "darati_storage_upload_duration_seconds", "Media upload latency", ("backend",))
+storage_orphans_deleted = Counter(
+    "darati_storage_orphans_deleted_total", "Unreferenced blobs removed by garbage collection", ("backend",))
+storage_orphan_bytes_deleted = Counter(
+    "darati_storage_orphan_bytes_deleted_total", "Bytes freed by blob garbage collection", ("backend",))
+storage_sign_duration = Histogram(
+    "darati_storage_sign_duration_seconds", "Time to sign a media URL", ("backend",),
+    (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01))
+
+
+class RequestStats:
+    __slots__ = ("db_queries", "db_time", "query_counts", "scope")
+
+    def __init__(self, scope=None):
+        self.db_queries = 0
+        self.db_time = 0.0
+        # Statements per query fingerprint, for N+1 detection (utils/query_log.py)
+        self.query_counts = {}
+        self.scope = scope
+
+
+# Set by the middleware for the duration of a request; the SQLAlchemy hooks add to it
+current_request_stats = contextvars.ContextVar("current_request_stats", default=None)
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        db_query_duration.observe(elapsed)
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.db_queries += 1
+            stats.db_time += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("metrics_query_start"):
+            connection.info["metrics_query_start"].pop()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware so streaming responses are measured to the last byte"""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route_label(self, scope):
+        if self._route_paths is None:
+            # Map endpoint -> path template once, so labels stay low-cardinality
+            self._route_paths = {
+                getattr(route, "endpoint", None): route.path for route in scope["app"].routes
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stats = RequestStats(scope)
+        token = current_request_stats.set(stats)
+        status = [500]
+        size = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                size[0] += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                size[0] += message.get("count", 0)
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            current_request_stats.reset(token)
+            route = self._route_label(scope)
+            http_request_duration.observe(time.perf_counter() - started, (scope["method"], route, status[0]))
+            http_response_size.observe(size[0], (route,))
+            db_queries_per_request.observe(stats.db_queries, (route,))
+            db_time_per_request.observe(stats.db_time, (route,))
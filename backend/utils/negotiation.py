@@ -0,0 +1,206 @@
+"""Content negotiation for API responses: compression and binary encodings.
+
+ContentNegotiationMiddleware does two things per HTTP request:
+
+* records whether the client asked for MessagePack (Accept: application/msgpack)
+  in wants_msgpack, which ListingResponse reads when it renders;
+* compresses compressible responses above a size threshold with brotli (when
+  the optional brotli package is installed) or gzip, as negotiated through
+  Accept-Encoding.
+
+Clients that send neither header get exactly the same JSON bytes as before.
+Audio, images, range responses and event streams are never compressed.
+"""
+import asyncio
+import zlib
+from contextvars import ContextVar
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MINIMUM_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Compressing a multi-megabyte listing takes tens of ms; keep it off the event loop
+THREAD_OFFLOAD_BYTES = 256 * 1024
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    MSGPACK_MEDIA_TYPE,
+    "text/",
+    "application/javascript",
+    "image/svg+xml",
+)
+
+wants_msgpack = ContextVar("wants_msgpack", default=False)
+
+
+def _parse_header_qualities(value):
+    """'gzip;q=0.5, br' -> {'gzip': 0.5, 'br': 1.0}"""
+    qualities = {}
+    for part in value.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[token] = quality
+    return qualities
+
+
+def choose_encoding(accept_encoding):
+    qualities = _parse_header_qualities(accept_encoding)
+    wildcard = qualities.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in candidates:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def accepts_msgpack(accept):
+    qualities = _parse_header_qualities(accept)
+    return qualities.get(MSGPACK_MEDIA_TYPE, qualities.get("application/x-msgpack", 0.0)) > qualities.get(
+        "application/json", 0.0
+    )
+
+
+def _compressor(encoding):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+class ContentNegotiationMiddleware:
+    """Pure ASGI so streamed bodies are compressed incrementally, not buffered"""
+
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {}
+        for name, value in scope["headers"]:
+            if name in (b"accept", b"accept-encoding"):
+                headers[name] = value.decode("latin-1")
+
+        token = wants_msgpack.set(accepts_msgpack(headers.get(b"accept", "")))
+        try:
+            encoding = choose_encoding(headers.get(b"accept-encoding", ""))
+            if encoding is None:
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+        finally:
+            wants_msgpack.reset(token)
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding, minimum_size):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.passthrough = False
+        self.compress = None
+        self.flush = None
+
+    def _eligible(self, message):
+        if message["status"] in (204, 206, 304) or message["status"] < 200:
+            return False
+        content_type = ""
+        for name, value in message.get("headers", []):
+            name = name.lower()
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+        # Event streams must reach the client event by event; a compressor would hold them back
+        return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+
+    def _start_headers(self, content_length=None):
+        headers = [
+            (name, value) for name, value in self.start.get("headers", [])
+            if name.lower() not in (b"content-length", b"vary")
+        ]
+        vary = [value for name, value in self.start.get("headers", []) if name.lower() == b"vary"]
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode()))
+        return headers
+
+    async def _compress(self, body, final):
+        def run():
+            data = self.compress(body)
+            return data + self.flush() if final else data
+
+        if len(body) > THREAD_OFFLOAD_BYTES:
+            return await asyncio.to_thread(run)
+        return run()
+
+    async def __call__(self, message):
+        message_type = message["type"]
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message_type == "http.response.start":
+            if self._eligible(message):
+                self.start = message
+            else:
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message_type != "http.response.body":
+            # e.g. zerocopysend: nothing we could compress, hand over untouched
+            if self.start is not None:
+                await self.send(self.start)
+                self.start = None
+            self.passthrough = True
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compress is None:
+            if not more_body and len(body) < self.minimum_size:
+                await self.send({**self.start, "headers": self._start_headers(len(body))})
+                await self.send(message)
+                self.passthrough = True
+                return
+
+            self.compress, self.flush = _compressor(self.encoding)
+            if not more_body:
+                compressed = await self._compress(body, final=True)
+                headers = self._start_headers(len(compressed))
+                headers.append((b"content-encoding", self.encoding.encode()))
+                await self.send({**self.start, "headers": headers})
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+            headers = self._start_headers()
+            headers.append((b"content-encoding", self.encoding.encode()))
+            await self.send({**self.start, "headers": headers})
+
+        compressed = await self._compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
@@ -0,0 +1,334 @@
+"""On-demand sampling profiler for single requests.
+
+An admin sends a request with X-Profile: 1 and a valid X-Admin-Key. The
+request then runs normally, with a sampler thread beside it that records the
+request's Python stack about every PROFILE_INTERVAL_MS. The response carries an
+X-Profile-Id header. Fetch the profile from
+GET /api/admin/profiles/{id}?format=speedscope (open in speedscope.app) or
+?format=collapsed (flamegraph.pl, inferno). The last PROFILE_HISTORY
+profiles are kept in this worker's memory.
+
+A sample belongs to the request when:
+
+* on the event loop thread, the request's coroutine (this middleware's frame)
+  is on the running stack;
+* on a worker thread (sync handlers and dependencies, asyncio.to_thread,
+  sync streaming bodies), the work item being run carries the request's
+  context, since both anyio and asyncio copy contextvars into the thread.
+
+Each sample is weighted by the time since the previous tick, because the
+sampler can only run when it gets the GIL. A busy request is sampled less
+often, but each sample counts for longer. A tick where neither holds is
+recorded as [waiting]. That is time spent
+awaiting I/O or queued behind other work. Samples inside a DB driver call get
+a leaf frame naming the statement. Samples inside utils/storage.py count as
+storage time. The profile's summary adds the exact SQL time and statement
+count from utils.metrics.
+
+Without ADMIN_API_KEY the middleware is not installed. Otherwise a request
+without the header costs one scan of its headers. No sampler thread or
+tracing is started for it.
+"""
+import concurrent.futures.thread
+import contextvars
+import logging
+import os
+import queue
+import site
+import sys
+import sysconfig
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+from anyio._backends._asyncio import WorkerThread
+
+from logging_config import request_id_var
+from utils.admin import is_admin_key
+from utils.metrics import current_request_stats
+from utils.query_log import normalize
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 1))
+PROFILE_HISTORY = 20
+MAX_ACTIVE_PROFILES = 2
+MAX_STACK_DEPTH = 128
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+# Frames that run a work item on behalf of some context in a worker thread
+_ANYIO_RUN = WorkerThread.run.__code__
+_EXECUTOR_RUN = concurrent.futures.thread._WorkItem.run.__code__
+_QUEUE_GET = queue.Queue.get.__code__
+_DB_CALLS = ("do_execute", "do_executemany", "do_execute_no_params")
+_STORAGE_FILE = os.path.join("utils", "storage.py")
+_LIBRARY_ROOTS = sorted(
+    {path for path in sysconfig.get_paths().values() if path} | set(site.getsitepackages()), key=len, reverse=True
+)
+
+
+@lru_cache(maxsize=8192)
+def _frame_label(code):
+    """(function, short path, first line); library paths are shown relative to site-packages or the stdlib"""
+    filename = code.co_filename
+    for root in _LIBRARY_ROOTS:
+        if filename.startswith(root):
+            return code.co_name, filename[len(root):].lstrip(os.sep), code.co_firstlineno
+    if os.path.isabs(filename):
+        filename = os.path.relpath(filename)
+    return code.co_name, filename, code.co_firstlineno
+
+
+class Profile:
+    def __init__(self, method, path, request_id):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.request_id = request_id
+        self.started_at = datetime.utcnow()
+        self.interval_ms = PROFILE_INTERVAL_MS
+        # Milliseconds per root-first stack and per category (app, db, storage, waiting)
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.samples = 0
+        self.status = None
+        self.finished = False
+        self.wall_ms = None
+        self.db_ms = None
+        self.db_queries = None
+
+    def add(self, stack, category, weight_ms):
+        self.stacks[stack] += weight_ms
+        self.categories[category] += weight_ms
+        self.samples += 1
+
+    def _snapshot(self):
+        # dict.copy is atomic under the GIL, so this is safe while the sampler is still adding
+        return dict.copy(self.stacks), dict.copy(self.categories)
+
+    def summary(self):
+        stacks, categories = self._snapshot()
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "request_id": self.request_id,
+            "status": self.status,
+            "finished": self.finished,
+            "started_at": self.started_at,
+            "wall_ms": self.wall_ms,
+            "interval_ms": self.interval_ms,
+            "samples": self.samples,
+            # Concurrent threads (the loop plus a worker) can add up to more than wall time
+            "sampled_ms": {category: round(weight, 2) for category, weight in categories.items()},
+            "db_ms": self.db_ms,
+            "db_queries": self.db_queries,
+        }
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format, root;...;leaf microseconds"""
+        lines = []
+        for stack, weight in Counter(self._snapshot()[0]).most_common():
+            names = [frame if isinstance(frame, str) else f"{frame[0]} ({frame[1]}:{frame[2]})" for frame in stack]
+            lines.append(f"{';'.join(name.replace(';', ',') for name in names)} {max(1, round(weight * 1000))}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self):
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, weight in Counter(self._snapshot()[0]).most_common():
+            sample = []
+            for frame in stack:
+                position = index.get(frame)
+                if position is None:
+                    position = index[frame] = len(frames)
+                    if isinstance(frame, str):
+                        frames.append({"name": frame})
+                    else:
+                        frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                sample.append(position)
+            samples.append(sample)
+            weights.append(round(weight, 3))
+        name = f"{self.method} {self.path}"
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "darati",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 3),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, profile, loop_thread, request_frame):
+        super().__init__(name=f"profiler-{profile.id}", daemon=True)
+        self.profile = profile
+        self.loop_thread = loop_thread
+        self.request_frame = request_frame
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = self.profile.interval_ms / 1000
+        last = time.perf_counter()
+        while not self.stopped.wait(interval):
+            now = time.perf_counter()
+            weight_ms = (now - last) * 1000
+            last = now
+            sampled = False
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                sample = self._sample(thread_id, frame)
+                if sample is not None:
+                    self.profile.add(*sample, weight_ms)
+                    sampled = True
+            if not sampled:
+                self.profile.add(("[waiting]",), "waiting", weight_ms)
+
+    def _sample(self, thread_id, frame):
+        """(root-first stack, category) if this thread is running the request, else None"""
+        inner = []
+        category = "app"
+        owned = False
+        while frame is not None:
+            code = frame.f_code
+            if thread_id == self.loop_thread and frame is self.request_frame:
+                owned = True
+                inner.append(frame)
+                break
+            if code is _ANYIO_RUN or code is _EXECUTOR_RUN:
+                owned = self._runs_request(frame, inner)
+                if owned:
+                    inner.append("[worker thread]")
+                break
+            inner.append(frame)
+            frame = frame.f_back
+        if not owned:
+            return None
+
+        stack = []
+        for entry in reversed(inner):
+            if isinstance(entry, str):
+                stack.append(entry)
+                continue
+            code = entry.f_code
+            stack.append(_frame_label(code))
+            if code.co_name in _DB_CALLS and code.co_filename.endswith(os.path.join("engine", "default.py")):
+                category = "db"
+                statement = entry.f_locals.get("statement")
+                if isinstance(statement, str):
+                    stack.append(f"SQL {normalize(statement)[:120]}")
+                break
+            if category == "app" and code.co_filename.endswith(_STORAGE_FILE):
+                category = "storage"
+        return tuple(stack[-MAX_STACK_DEPTH:]), category
+
+    def _runs_request(self, frame, inner):
+        # An anyio worker keeps its last context in a local while it waits for the next item
+        if inner and inner[-1].f_code is _QUEUE_GET:
+            return False
+        if frame.f_code is _ANYIO_RUN:
+            context = frame.f_locals.get("context")
+        else:
+            work_item = frame.f_locals.get("self")
+            # asyncio.to_thread submits functools.partial(context.run, func, ...)
+            context = getattr(getattr(getattr(work_item, "fn", None), "func", None), "__self__", None)
+        return isinstance(context, contextvars.Context) and context.get(_current_profile) is self.profile
+
+
+class ProfileStore:
+    def __init__(self):
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles[profile.id] = profile
+            while len(self._profiles) > PROFILE_HISTORY:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id):
+        return self._profiles.get(profile_id)
+
+    def list(self):
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [profile.summary() for profile in reversed(profiles)]
+
+
+profiles = ProfileStore()
+
+
+def _wants_profile(scope):
+    profile_flag = admin_key = None
+    for name, value in scope["headers"]:
+        if name == b"x-profile":
+            profile_flag = value
+        elif name == b"x-admin-key":
+            admin_key = value
+    if profile_flag is None or profile_flag.lower() not in (b"1", b"true", b"yes"):
+        return False
+    return is_admin_key(admin_key.decode("latin-1") if admin_key else None)
+
+
+class ProfilingMiddleware:
+    """Pure ASGI: profiles requests that ask for it with X-Profile and an admin key"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if profiles.active >= MAX_ACTIVE_PROFILES:
+            logger.warning(f"Not profiling {scope['path']}: {MAX_ACTIVE_PROFILES} profiles already running")
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], request_id_var.get())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        sampler = _Sampler(profile, threading.get_ident(), sys._getframe())
+        profiles.active += 1
+        # Listed (unfinished) from the start, so the X-Profile-Id a client just received always resolves
+        profiles.add(profile)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stopped.set()
+            sampler.join()
+            profiles.active -= 1
+            _current_profile.reset(token)
+            profile.wall_ms = round((time.perf_counter() - started) * 1000, 2)
+            stats = current_request_stats.get()
+            if stats is not None:
+                profile.db_ms = round(stats.db_time * 1000, 2)
+                profile.db_queries = stats.db_queries
+            profile.finished = True
+            logger.info(
+                f"Profiled {profile.method} {profile.path} as {profile.id}: {profile.wall_ms} ms, "
+                f"{profile.samples} samples"
+            )
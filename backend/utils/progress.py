@@ -0,0 +1,157 @@
+"""In-process pub/sub for upload progress, keyed by a client-chosen upload ID.
+
+Bulk admin operations publish here too, keyed by their X-Operation-Id, with
+stages such as deleting_rows and deleting_blobs before complete.
+
+The client generates an ID, opens GET /api/uploads/{id}/events (SSE), and then
+sends the upload with an X-Upload-Id header. The server publishes these
+stages:
+
+    receiving   bytes of the request body read so far (UploadGuardMiddleware)
+    storing     bytes forwarded to media storage
+    processing  database writes and indexing
+    complete    final result (ids), terminal
+    error       status code and detail, terminal
+
+Any number of listeners can follow one upload. Each listener has its own
+bounded queue, and a slow listener loses intermediate progress events, never
+the terminal one. A listener that joins late receives the latest event
+first. Finished channels are kept for RETAIN_SECONDS so a client that
+reconnects still sees the outcome.
+
+State lives in this worker's memory. With several workers, the upload and
+its event stream must reach the same one (sticky routing on X-Upload-Id, or
+a single upload worker).
+"""
+import asyncio
+import re
+import threading
+import time
+
+TERMINAL_STAGES = ("complete", "error")
+QUEUE_SIZE = 64
+RETAIN_SECONDS = 60
+IDLE_SECONDS = 3600
+PRUNE_INTERVAL_SECONDS = 30
+HEARTBEAT_SECONDS = 15
+UPLOAD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def valid_upload_id(upload_id):
+    return bool(upload_id) and UPLOAD_ID_PATTERN.match(upload_id) is not None
+
+
+class _Channel:
+    __slots__ = ("subscribers", "last", "updated_at", "finished")
+
+    def __init__(self):
+        self.subscribers = set()
+        self.last = None
+        self.updated_at = time.monotonic()
+        self.finished = False
+
+
+class ProgressBroker:
+    def __init__(self):
+        self._channels = {}
+        self._loop = None
+        self._loop_thread = None
+        self._pruned_at = time.monotonic()
+
+    def publish(self, upload_id, stage, **fields):
+        """Safe to call from the event loop or from worker threads; a no-op without an upload ID"""
+        if not upload_id:
+            return
+        event = {"upload_id": upload_id, "stage": stage, **fields}
+        if threading.get_ident() == self._loop_thread:
+            self._deliver(event)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            self._bind(loop)
+            self._deliver(event)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, event)
+
+    def _bind(self, loop):
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+
+    def _channel(self, upload_id):
+        channel = self._channels.get(upload_id)
+        if channel is None:
+            channel = self._channels[upload_id] = _Channel()
+        return channel
+
+    def _deliver(self, event):
+        channel = self._channel(event["upload_id"])
+        channel.last = event
+        channel.updated_at = time.monotonic()
+        channel.finished = event["stage"] in TERMINAL_STAGES
+        for queue in channel.subscribers:
+            if queue.full():
+                # Drop the oldest progress update; the newest carries the same information
+                queue.get_nowait()
+            queue.put_nowait(event)
+        self._prune()
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = now
+        for upload_id, channel in list(self._channels.items()):
+            age = now - channel.updated_at
+            if not channel.subscribers and (age > IDLE_SECONDS or (channel.finished and age > RETAIN_SECONDS)):
+                del self._channels[upload_id]
+
+    async def events(self, upload_id, heartbeat=HEARTBEAT_SECONDS):
+        """Yield events until a terminal one, and None every `heartbeat` seconds of silence"""
+        self._bind(asyncio.get_running_loop())
+        channel = self._channel(upload_id)
+        queue = asyncio.Queue(QUEUE_SIZE)
+        if channel.last is not None:
+            queue.put_nowait(channel.last)
+        channel.subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event["stage"] in TERMINAL_STAGES:
+                    return
+        finally:
+            channel.subscribers.discard(queue)
+            self._prune()
+
+
+class ProgressReporter:
+    """Callable taking bytes done so far; publishes at most every min_interval seconds, and always the last"""
+
+    def __init__(self, upload_id, stage, total, offset=0, min_interval=0.25):
+        self.upload_id = upload_id
+        self.stage = stage
+        self.total = total
+        self.offset = offset
+        self.min_interval = min_interval
+        self._published_at = 0.0
+
+    def __call__(self, done):
+        if not self.upload_id:
+            return
+        done += self.offset
+        now = time.monotonic()
+        finished = self.total is not None and done >= self.total
+        if not finished and now - self._published_at < self.min_interval:
+            return
+        self._published_at = now
+        progress.publish(self.upload_id, self.stage, bytes=done, total=self.total)
+
+
+progress = ProgressBroker()
@@ -0,0 +1,269 @@
+"""Slow-query log: per-fingerprint timings, sampled EXPLAIN plans and N+1 detection.
+
+Every SQL statement is reduced to a fingerprint: literals, bind parameters
+and IN / VALUES lists are collapsed to "?", so the same query with different
+arguments always gets the same fingerprint. For each fingerprint we keep the
+call count, total time and slowest call.
+
+A statement slower than SLOW_QUERY_MS is logged and kept in a ring of recent
+slow queries. A sample of them (EXPLAIN_SAMPLE_RATE, at most once per
+fingerprint every EXPLAIN_INTERVAL_SECONDS) is re-run under EXPLAIN on a
+background thread, never on the request's connection:
+
+* PostgreSQL: EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON), in a transaction that
+  is rolled back, with a statement timeout;
+* SQLite: EXPLAIN QUERY PLAN.
+
+ANALYZE executes the statement again, so only plain SELECTs are explained.
+
+When one fingerprint runs N_PLUS_ONE_THRESHOLD times within a single request,
+the handler is flagged as an N+1 suspect (a query issued per row of an earlier
+result).
+
+Like the timings in utils.metrics, recording takes no lock: each thread
+writes its own shard and GET /api/admin/queries merges them. State is per
+worker process.
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+
+from sqlalchemy import event
+
+from logging_config import request_id_var
+from utils.metrics import Counter, current_request_stats
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+EXPLAIN_SAMPLE_RATE = float(os.getenv("EXPLAIN_SAMPLE_RATE", 0.2))
+EXPLAIN_INTERVAL_SECONDS = 600
+EXPLAIN_TIMEOUT_MS = 10_000
+# Slow queries waiting for EXPLAIN beyond this are not explained
+EXPLAIN_QUEUE_LIMIT = 4
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 20))
+SLOW_QUERY_HISTORY = 200
+MAX_FINGERPRINTS = 5000
+MAX_STATEMENT_CHARS = 2000
+
+db_slow_queries = Counter(
+    "darati_db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS")
+db_n_plus_one = Counter(
+    "darati_db_n_plus_one_total", "Requests that repeated one query N_PLUS_ONE_THRESHOLD times", ("handler",))
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+|\?")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+_SPACES = re.compile(r"\s+")
+_EXPLAINABLE = re.compile(r"^\s*(select|with)\b", re.I)
+_WRITES = re.compile(r"\b(insert|update|delete|merge|nextval|setval)\b", re.I)
+
+
+@lru_cache(maxsize=4096)
+def normalize(statement):
+    """Statement with every literal, parameter and value list replaced by ?"""
+    text = _COMMENTS.sub(" ", statement)
+    text = _STRINGS.sub("?", text)
+    text = _PLACEHOLDERS.sub("?", text)
+    text = _NUMBERS.sub("?", text)
+    text = _LISTS.sub("(?)", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement):
+    """(id, normalized text); the id is short enough for log lines and URLs"""
+    normalized = normalize(statement)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16], normalized
+
+
+class QueryLog:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._texts = {}
+        self._slow = deque(maxlen=SLOW_QUERY_HISTORY)
+        self._plans = {}
+        self._explained_at = {}
+        self._n_plus_one = {}
+        self._explain_lock = threading.Lock()
+        self._explain_pending = 0
+        self._executor = None
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record(self, conn, statement, parameters, elapsed, executemany):
+        if getattr(self._local, "explaining", False):
+            return
+        query_id, normalized = fingerprint(statement)
+        shard = self._shard()
+        stats = shard.get(query_id)
+        if stats is None:
+            if len(shard) >= MAX_FINGERPRINTS:
+                return
+            # [calls, total seconds, slowest seconds]
+            stats = shard[query_id] = [0, 0.0, 0.0]
+            self._texts.setdefault(query_id, normalized[:MAX_STATEMENT_CHARS])
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+
+        request = current_request_stats.get()
+        if request is not None:
+            count = request.query_counts[query_id] = request.query_counts.get(query_id, 0) + 1
+            if count == N_PLUS_ONE_THRESHOLD:
+                self._flag_n_plus_one(query_id, request)
+
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            self._record_slow(conn, query_id, statement, parameters, elapsed, executemany)
+
+    def _flag_n_plus_one(self, query_id, request):
+        endpoint = request.scope.get("endpoint") if request.scope else None
+        handler = f"{endpoint.__module__}.{endpoint.__name__}" if endpoint else "unmatched"
+        db_n_plus_one.inc(labels=(handler,))
+        logger.warning(
+            f"Possible N+1 in {handler}: query {query_id} ran {N_PLUS_ONE_THRESHOLD} times in one request: "
+            f"{self._texts.get(query_id, '')[:200]}"
+        )
+        key = (handler, query_id)
+        entry = self._n_plus_one.get(key)
+        if entry is None:
+            entry = self._n_plus_one[key] = {"handler": handler, "fingerprint": query_id, "requests": 0}
+        entry["requests"] += 1
+        entry["last_seen"] = datetime.utcnow()
+
+    def _record_slow(self, conn, query_id, statement, parameters, elapsed, executemany):
+        db_slow_queries.inc()
+        elapsed_ms = round(elapsed * 1000, 2)
+        logger.warning(f"Slow query {query_id} took {elapsed_ms} ms: {self._texts.get(query_id, '')[:200]}")
+        self._slow.append({
+            "fingerprint": query_id,
+            "elapsed_ms": elapsed_ms,
+            "at": datetime.utcnow(),
+            "request_id": request_id_var.get(),
+        })
+        if executemany or not self._should_explain(query_id, statement):
+            return
+        self._executor.submit(self._explain, conn.engine, query_id, statement, parameters, elapsed_ms)
+
+    def _should_explain(self, query_id, statement):
+        if not explainable(statement) or random.random() >= EXPLAIN_SAMPLE_RATE:
+            return False
+        now = time.monotonic()
+        with self._explain_lock:
+            last = self._explained_at.get(query_id)
+            if self._explain_pending >= EXPLAIN_QUEUE_LIMIT or (
+                last is not None and now - last < EXPLAIN_INTERVAL_SECONDS
+            ):
+                return False
+            self._explained_at[query_id] = now
+            self._explain_pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+        return True
+
+    def _explain(self, engine, query_id, statement, parameters, elapsed_ms):
+        self._local.explaining = True
+        try:
+            with engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    with conn.begin() as transaction:
+                        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                        plan = conn.exec_driver_sql(
+                            "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, parameters
+                        ).scalar()
+                        # ANALYZE ran the statement for real; keep nothing it did
+                        transaction.rollback()
+                elif conn.dialect.name == "sqlite":
+                    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+                    plan = [row[-1] for row in rows]
+                else:
+                    return
+            self._plans[query_id] = {"captured_at": datetime.utcnow(), "elapsed_ms": elapsed_ms, "plan": plan}
+            logger.info(f"Captured plan for slow query {query_id}")
+        except Exception as e:
+            logger.warning(f"Could not EXPLAIN slow query {query_id}: {str(e)}")
+        finally:
+            with self._explain_lock:
+                self._explain_pending -= 1
+            self._local.explaining = False
+
+    def report(self, limit=50):
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            for query_id, (calls, total, slowest) in shard.copy().items():
+                merged = totals.setdefault(query_id, [0, 0.0, 0.0])
+                merged[0] += calls
+                merged[1] += total
+                merged[2] = max(merged[2], slowest)
+
+        top = sorted(totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return {
+            "slow_query_ms": SLOW_QUERY_MS,
+            "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+            "top": [
+                {
+                    "fingerprint": query_id,
+                    "statement": self._texts.get(query_id, ""),
+                    "calls": calls,
+                    "total_ms": round(total * 1000, 2),
+                    "mean_ms": round(total * 1000 / calls, 3),
+                    "max_ms": round(slowest * 1000, 2),
+                    "plan": self._plans.get(query_id),
+                }
+                for query_id, (calls, total, slowest) in top
+            ],
+            "slow": [
+                dict(entry, statement=self._texts.get(entry["fingerprint"], ""))
+                for entry in list(self._slow)[-limit:][::-1]
+            ],
+            "n_plus_one": [
+                dict(entry, statement=self._texts.get(entry["fingerprint"], ""))
+                for entry in sorted(self._n_plus_one.values(), key=lambda entry: entry["requests"], reverse=True)
+            ][:limit],
+        }
+
+
+def explainable(statement):
+    """Only read-only SELECTs are safe to run again under EXPLAIN ANALYZE"""
+    return _EXPLAINABLE.match(statement) is not None and _WRITES.search(statement) is None
+
+
+query_log = QueryLog()
+
+
+def instrument_queries(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_log_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_log_start"].pop()
+        query_log.record(conn, statement, parameters, elapsed, executemany)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_log_start"):
+            connection.info["query_log_start"].pop()
@@ -0,0 +1,251 @@
+"""Per-client rate limiting and per-route-class admission control.
+
+Every API request is mapped to a route class (auth, upload, listing, stream,
+events, default). Two checks run before the app sees the request:
+
+1. A token bucket keyed by (route class, client IP). Requests beyond the
+   bucket get 429 with Retry-After. Buckets live in this worker's memory, or
+   in Redis when RATE_LIMIT_BACKEND=redis, so the budget is shared across
+   workers and hosts.
+2. A per-worker concurrency cap per route class. A request that finds its
+   class full waits at most ADMISSION_MAX_WAIT_SECONDS for a slot, and only if
+   the wait queue is shorter than the cap. Otherwise it gets 503 straight
+   away. The DB-bound caps are sized below the SQLAlchemy pool (5 + 10
+   overflow), so overload turns into fast 503s instead of pool timeouts and
+   tail latency stays bounded.
+
+The API has no authenticated identity yet (user ids arrive as client-supplied
+parameters), so buckets are keyed by client IP. Set TRUSTED_PROXY_HOPS when
+running behind a load balancer to take the IP from X-Forwarded-For.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from fastapi.responses import JSONResponse
+
+from utils.metrics import http_requests_rejected
+
+logger = logging.getLogger(__name__)
+
+RoutePolicy = namedtuple("RoutePolicy", ["rate", "burst", "max_concurrency"])
+
+# rate is tokens per second per client, burst the bucket size
+ROUTE_POLICIES = {
+    # bcrypt makes every login ~250ms of CPU, and it's the brute-force target
+    "auth": RoutePolicy(rate=0.2, burst=10, max_concurrency=4),
+    "upload": RoutePolicy(rate=0.2, burst=5, max_concurrency=4),
+    "listing": RoutePolicy(rate=5, burst=30, max_concurrency=8),
+    # Range requests from one player arrive in quick succession and mostly hit the chunk cache
+    "stream": RoutePolicy(rate=20, burst=100, max_concurrency=64),
+    # Long-lived SSE connections that mostly sit idle; they must not occupy "default" slots
+    "events": RoutePolicy(rate=1, burst=10, max_concurrency=256),
+    "default": RoutePolicy(rate=10, burst=50, max_concurrency=16),
+}
+
+# First matching prefix wins
+ROUTE_CLASSES = (
+    ("/api/auth/", "auth"),
+    ("/api/audio/upload", "upload"),
+    ("/api/banners/upload", "upload"),
+    ("/api/chapters/", "stream"),
+    ("/api/media/", "stream"),
+    ("/api/uploads/", "events"),
+    ("/api/books/all", "listing"),
+    ("/api/home", "listing"),
+    ("/api/user_books", "listing"),
+    ("/api/library", "listing"),
+    ("/api/audio/user_books", "listing"),
+    ("/api/categories", "listing"),
+    ("/api/trending", "listing"),
+    ("/api/banners/list", "listing"),
+    ("/api/", "default"),
+)
+
+ADMISSION_MAX_WAIT_SECONDS = 0.1
+MEMORY_MAX_KEYS = 100_000
+
+
+def route_class(path):
+    for prefix, name in ROUTE_CLASSES:
+        if path.startswith(prefix):
+            return name
+    return None
+
+
+def client_ip(scope, trusted_proxy_hops=0):
+    if trusted_proxy_hops:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                hops = [hop.strip() for hop in value.decode("latin-1").split(",")]
+                if len(hops) >= trusted_proxy_hops:
+                    return hops[-trusted_proxy_hops]
+                break
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class MemoryBucketStore:
+    """Token buckets in this worker's memory; limits are per worker process"""
+
+    def __init__(self, max_keys=MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at); least recently used first
+
+    async def take(self, key, rate, burst, cost=1.0):
+        """Returns (allowed, retry_after_seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.pop(next(iter(self._buckets)))
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+
+# Atomic refill-and-take; the server clock is used so app hosts may disagree on time
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(retry)}
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker through Redis.
+
+    Fails open: if Redis is unreachable requests are let through (and logged),
+    so the limiter can never take the API down on its own.
+    """
+
+    def __init__(self, url, prefix="darati:ratelimit:"):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_TAKE_SCRIPT)
+        self.prefix = prefix
+
+    async def take(self, key, rate, burst, cost=1.0):
+        try:
+            allowed, retry_after = await self._script(keys=[self.prefix + key], args=[rate, burst, cost])
+        except Exception as e:
+            logger.error(f"Rate limit store unavailable, allowing request: {str(e)}")
+            return True, 0.0
+        return bool(allowed), float(retry_after)
+
+
+def create_bucket_store():
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    if backend == "redis":
+        return RedisBucketStore(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    if backend == "memory":
+        return MemoryBucketStore()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+class ConcurrencyLimiter:
+    """Bounded slots with a short, bounded wait queue (single event loop)"""
+
+    def __init__(self, limit, max_wait=ADMISSION_MAX_WAIT_SECONDS):
+        self.limit = limit
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            if self._waiters >= self.limit:
+                return False
+            self._waiters += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self._waiters -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class RateLimitMiddleware:
+    """Pure ASGI so a concurrency slot is held until the last body byte is sent"""
+
+    def __init__(self, app, store=None, policies=None, enabled=None):
+        self.app = app
+        if enabled is None:
+            enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+        self.enabled = enabled
+        self.policies = policies or ROUTE_POLICIES
+        self.store = store or (create_bucket_store() if enabled else None)
+        self.trusted_proxy_hops = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+        self.limiters = {
+            name: ConcurrencyLimiter(policy.max_concurrency) for name, policy in self.policies.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        policy = self.policies[name]
+        key = f"{name}:{client_ip(scope, self.trusted_proxy_hops)}"
+        allowed, retry_after = await self.store.take(key, policy.rate, policy.burst)
+        if not allowed:
+            http_requests_rejected.inc(labels=(name, "rate_limited"))
+            response = JSONResponse(
+                {"detail": "Too many requests"}, status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+            await response(scope, receive, send)
+            return
+
+        limiter = self.limiters[name]
+        if not await limiter.acquire():
+            http_requests_rejected.inc(labels=(name, "overloaded"))
+            logger.warning(f"Shedding {name} request, {limiter.in_flight} in flight")
+            response = JSONResponse(
+                {"detail": "Server busy, retry shortly"}, status_code=503, headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
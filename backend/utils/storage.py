@@ -0,0 +1,322 @@
+"""Media storage backends.
+
+Routes never talk to Azure directly; they call get_storage() and use:
+
+    upload(name, data, content_type, progress) -> reference stored in the DB
+    signed_url(reference)            -> short-lived URL a client can fetch
+    properties(reference)            -> BlobInfo(size, etag, content_type)
+    download_range(reference, offset, length) -> bytes
+    delete(reference)
+    delete_many(references)
+    list_blobs(prefix)               -> pages of BlobEntry(name, size, last_modified)
+
+STORAGE_BACKEND selects "azure" (default, existing deployments) or "local"
+(on-prem/dev, no cloud dependency). References are whatever the backend
+returned from upload(): full blob URLs for Azure, which is what older rows
+already contain, and plain blob names for local storage. Both backends accept
+either form.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import mimetypes
+import os
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import quote, unquote
+
+from dotenv import load_dotenv
+
+from utils.metrics import storage_sign_duration, storage_upload_bytes, storage_upload_duration
+
+logger = logging.getLogger(__name__)
+
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+SIGNED_URL_LIFETIME = timedelta(hours=24)
+
+BlobInfo = namedtuple("BlobInfo", ["size", "etag", "content_type"])
+# last_modified is a Unix timestamp
+BlobEntry = namedtuple("BlobEntry", ["name", "size", "last_modified"])
+
+LIST_PAGE_SIZE = 1000
+# Azure's limit for a single batch request
+DELETE_BATCH_SIZE = 256
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+def _guess_content_type(name):
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+class StorageBackend:
+    name = None
+
+    def blob_name(self, reference: str) -> str:
+        return reference.split('?')[0].replace('\\', '/')
+
+    def upload(self, name: str, data: bytes, content_type: str = None, progress=None) -> str:
+        """progress, if given, is called with the number of bytes written so far"""
+        started = time.perf_counter()
+        reference = self._upload(name, data, content_type, progress)
+        storage_upload_duration.observe(time.perf_counter() - started, (self.name,))
+        storage_upload_bytes.inc(len(data), (self.name,))
+        return reference
+
+    def signed_url(self, reference: str, expires_in: timedelta = SIGNED_URL_LIFETIME) -> str:
+        started = time.perf_counter()
+        url = self._signed_url(reference, expires_in)
+        storage_sign_duration.observe(time.perf_counter() - started, (self.name,))
+        return url
+
+    def _upload(self, name, data, content_type, progress):
+        raise NotImplementedError
+
+    def _signed_url(self, reference, expires_in):
+        raise NotImplementedError
+
+    def properties(self, reference: str) -> BlobInfo:
+        raise NotImplementedError
+
+    def download_range(self, reference: str, offset: int, length: int) -> bytes:
+        raise NotImplementedError
+
+    def delete(self, reference: str):
+        raise NotImplementedError
+
+    def delete_many(self, references):
+        for reference in references:
+            self.delete(reference)
+
+    def list_blobs(self, prefix: str = "", page_size: int = LIST_PAGE_SIZE):
+        """Yield lists of BlobEntry, at most page_size each, never the whole container at once"""
+        raise NotImplementedError
+
+
+class AzureBlobStorage(StorageBackend):
+    name = "azure"
+
+    def __init__(self, connection_string, container_name, account_name, account_key):
+        from azure.storage.blob import BlobServiceClient
+
+        if not all([connection_string, container_name, account_name, account_key]):
+            raise ValueError("Azure storage configuration is missing. Please check your .env file.")
+
+        logger.info("Initializing Azure Blob Service Client...")
+        self.container_name = container_name
+        self.account_name = account_name
+        self.account_key = account_key
+        self.blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        self.container_client = self.blob_service_client.get_container_client(container_name)
+        logger.info(f"Connected to Azure container: {container_name}")
+
+    def blob_name(self, reference: str) -> str:
+        # Extract blob name if it's a full URL
+        if 'blob.core.windows.net' in reference:
+            parts = reference.split(self.container_name + '/', 1)
+            reference = parts[1] if len(parts) > 1 else '/'.join(reference.split('/')[3:])
+        return super().blob_name(reference)
+
+    def _url(self, blob_name):
+        return f"https://{self.account_name}.blob.core.windows.net/{self.container_name}/{blob_name}"
+
+    def _upload(self, name, data, content_type, progress):
+        from azure.storage.blob import ContentSettings
+
+        settings = ContentSettings(content_type=content_type) if content_type else None
+        hook = (lambda current, total: progress(current)) if progress else None
+        self.container_client.get_blob_client(name).upload_blob(
+            data, overwrite=True, content_settings=settings, progress_hook=hook
+        )
+        return self._url(name)
+
+    def _signed_url(self, reference, expires_in):
+        from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+
+        blob_name = self.blob_name(reference)
+        sas_token = generate_blob_sas(
+            account_name=self.account_name,
+            container_name=self.container_name,
+            blob_name=blob_name,
+            account_key=self.account_key,
+            permission=BlobSasPermissions(read=True),
+            expiry=datetime.utcnow() + expires_in
+        )
+        return f"{self._url(blob_name)}?{sas_token}"
+
+    def properties(self, reference):
+        blob_name = self.blob_name(reference)
+        props = self.container_client.get_blob_client(blob_name).get_blob_properties()
+        content_type = props.content_settings.content_type
+        if not content_type or content_type == "application/octet-stream":
+            content_type = _guess_content_type(blob_name)
+        return BlobInfo(props.size, props.etag, content_type)
+
+    def download_range(self, reference, offset, length):
+        blob_client = self.container_client.get_blob_client(self.blob_name(reference))
+        return blob_client.download_blob(offset=offset, length=length).readall()
+
+    def delete(self, reference):
+        self.container_client.get_blob_client(self.blob_name(reference)).delete_blob()
+
+    def delete_many(self, references):
+        names = [self.blob_name(reference) for reference in references]
+        for start in range(0, len(names), DELETE_BATCH_SIZE):
+            # A blob deleted concurrently shows up as a failed sub-request, not an exception
+            self.container_client.delete_blobs(*names[start:start + DELETE_BATCH_SIZE], raise_on_any_failure=False)
+
+    def list_blobs(self, prefix="", page_size=LIST_PAGE_SIZE):
+        pages = self.container_client.list_blobs(name_starts_with=prefix or None, results_per_page=page_size).by_page()
+        for page in pages:
+            yield [BlobEntry(blob.name, blob.size, blob.last_modified.timestamp()) for blob in page]
+
+
+class LocalFileStorage(StorageBackend):
+    """Blobs as files under a sharded directory tree, served by /api/media.
+
+    A blob named "audiobooks/1.mp3" lives at <root>/<h[0:2]>/<h[2:4]>/audiobooks%2F1.mp3
+    where h is the SHA-1 of the name, so no directory grows past a few thousand
+    entries. Writes go to a temp file in the target directory and are renamed
+    into place, so readers only ever see complete files.
+    """
+
+    name = "local"
+
+    def __init__(self, root, signing_key, base_url=""):
+        if not signing_key:
+            raise ValueError("STORAGE_SIGNING_KEY must be set for local storage")
+        self.root = root
+        self.signing_key = signing_key.encode("utf-8")
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, reference: str) -> str:
+        blob_name = self.blob_name(reference)
+        digest = hashlib.sha1(blob_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], quote(blob_name, safe=""))
+
+    def _upload(self, name, data, content_type, progress):
+        path = self.path_for(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                view = memoryview(data)
+                for offset in range(0, len(view), WRITE_CHUNK_SIZE):
+                    handle.write(view[offset:offset + WRITE_CHUNK_SIZE])
+                    if progress:
+                        progress(min(offset + WRITE_CHUNK_SIZE, len(view)))
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+    def signature(self, blob_name: str, expires: int) -> str:
+        digest = hmac.new(self.signing_key, f"{blob_name}\n{expires}".encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    def verify(self, blob_name: str, expires: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        # Bytes, not str: compare_digest rejects non-ASCII str, and the signature comes from the query string
+        return hmac.compare_digest(
+            self.signature(blob_name, expires).encode("ascii"), signature.encode("utf-8", "surrogateescape")
+        )
+
+    def _signed_url(self, reference, expires_in):
+        blob_name = self.blob_name(reference)
+        expires = int(time.time() + expires_in.total_seconds())
+        return (
+            f"{self.base_url}/api/media/{quote(blob_name)}"
+            f"?expires={expires}&signature={self.signature(blob_name, expires)}"
+        )
+
+    def properties(self, reference):
+        blob_name = self.blob_name(reference)
+        stat = os.stat(self.path_for(blob_name))
+        return BlobInfo(stat.st_size, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', _guess_content_type(blob_name))
+
+    def download_range(self, reference, offset, length):
+        with open(self.path_for(reference), "rb") as handle:
+            handle.seek(offset)
+            return handle.read(length)
+
+    def delete(self, reference):
+        try:
+            os.unlink(self.path_for(reference))
+        except FileNotFoundError:
+            pass
+
+    def list_blobs(self, prefix="", page_size=LIST_PAGE_SIZE):
+        # Sharding scatters a prefix across every directory, so the whole tree is walked
+        page = []
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.startswith(".upload-"):
+                    continue
+                name = unquote(filename)
+                if not name.startswith(prefix):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    continue
+                page.append(BlobEntry(name, stat.st_size, stat.st_mtime))
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+
+_storage = None
+
+
+def create_storage() -> StorageBackend:
+    backend = os.getenv("STORAGE_BACKEND", "azure").lower()
+    if backend == "azure":
+        return AzureBlobStorage(
+            os.getenv("AZURE_CONNECTION_STRING"),
+            os.getenv("AZURE_CONTAINER_NAME"),
+            os.getenv("AZURE_ACCOUNT_NAME"),
+            os.getenv("AZURE_ACCOUNT_KEY"),
+        )
+    if backend == "local":
+        return LocalFileStorage(
+            os.getenv("LOCAL_STORAGE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")),
+            os.getenv("STORAGE_SIGNING_KEY"),
+            os.getenv("MEDIA_BASE_URL", ""),
+        )
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+
+def set_storage(backend: StorageBackend):
+    """Swap the process-wide backend (benchmarks and tooling use an in-memory fake)."""
+    global _storage
+    _storage = backend
+
+
+def sign_url(reference: str):
+    """Signed URL for a stored reference, or None if it is empty or can't be signed"""
+    if not reference:
+        return None
+    try:
+        return get_storage().signed_url(reference)
+    except Exception as e:
+        logger.error(f"Error signing URL for {reference}: {str(e)}")
+        return None
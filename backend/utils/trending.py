@@ -0,0 +1,151 @@
+"""Incrementally maintained "trending now" ranking.
+
+Every play or like adds weight * exp(-decay * age) to a book's score. Instead of
+decaying every score as time passes, events are weighted *up* relative to a fixed
+epoch and stored as logarithms:
+
+    log_score = logaddexp(log_score, log(weight) + decay * (t - EPOCH))
+
+All scores shrink by the same factor over time, so the order never changes
+without a new event and nothing needs a periodic recompute. The real decayed
+value is exp(log_score - decay * (now - EPOCH)), which is only evaluated for the
+handful of books that are actually served.
+
+Each worker keeps the ranking in a sorted list and periodically merges the
+increments it has seen since the last checkpoint into the trending_scores table,
+reloading the merged values (including other workers' events) afterwards.
+"""
+import bisect
+import logging
+import math
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import TrendingScore
+
+logger = logging.getLogger(__name__)
+
+HALF_LIFE_SECONDS = 24 * 3600
+DECAY_RATE = math.log(2) / HALF_LIFE_SECONDS
+EPOCH = datetime(2024, 1, 1).timestamp()
+
+PLAY_WEIGHT = 1.0
+LIKE_WEIGHT = 3.0
+
+CHECKPOINT_INTERVAL_SECONDS = 30
+# Books reloaded from the table on every checkpoint so other workers' trends show up
+RELOAD_TOP_N = 500
+
+
+def _logaddexp(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(low - high))
+
+
+class TrendingRanking:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scores = {}        # book_id -> log score
+        self._ranking = []       # sorted [(log score, book_id)], best last
+        self._pending = {}       # book_id -> log of increments not yet checkpointed
+
+    def _set_score(self, book_id, log_score):
+        # Caller holds the lock
+        old = self._scores.get(book_id)
+        if old is not None:
+            index = bisect.bisect_left(self._ranking, (old, book_id))
+            if index < len(self._ranking) and self._ranking[index] == (old, book_id):
+                del self._ranking[index]
+        self._scores[book_id] = log_score
+        bisect.insort(self._ranking, (log_score, book_id))
+
+    def record(self, book_id, weight=PLAY_WEIGHT, at=None):
+        at = time.time() if at is None else at
+        increment = math.log(weight) + DECAY_RATE * (at - EPOCH)
+        with self._lock:
+            self._pending[book_id] = _logaddexp(self._pending.get(book_id), increment)
+            self._set_score(book_id, _logaddexp(self._scores.get(book_id), increment))
+
+    def top(self, n=20, now=None):
+        """Return [(book_id, decayed score)] for the n best books, best first."""
+        now = time.time() if now is None else now
+        offset = DECAY_RATE * (now - EPOCH)
+        with self._lock:
+            best = self._ranking[-n:] if n > 0 else []
+        return [(book_id, math.exp(log_score - offset)) for log_score, book_id in reversed(best)]
+
+    def load(self, db, limit=None):
+        query = select(TrendingScore.book_id, TrendingScore.log_score).order_by(TrendingScore.log_score.desc())
+        if limit:
+            query = query.limit(limit)
+        rows = db.execute(query).all()
+        with self._lock:
+            for book_id, log_score in rows:
+                # Keep whatever this worker has not flushed yet on top of the stored value
+                self._set_score(book_id, _logaddexp(log_score, self._pending.get(book_id)))
+        return len(rows)
+
+    def forget(self, book_ids):
+        """Drop deleted books, including increments not yet checkpointed"""
+        with self._lock:
+            for book_id in book_ids:
+                self._pending.pop(book_id, None)
+                old = self._scores.pop(book_id, None)
+                if old is not None:
+                    index = bisect.bisect_left(self._ranking, (old, book_id))
+                    if index < len(self._ranking) and self._ranking[index] == (old, book_id):
+                        del self._ranking[index]
+
+    def checkpoint(self, db):
+        """Merge pending increments into trending_scores and refresh from the merged values."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            try:
+                stored = dict(db.execute(
+                    select(TrendingScore.book_id, TrendingScore.log_score)
+                    .where(TrendingScore.book_id.in_(pending.keys()))
+                    .with_for_update()
+                ).all())
+                now = datetime.utcnow()
+                for book_id, increment in pending.items():
+                    merged = _logaddexp(stored.get(book_id), increment)
+                    db.merge(TrendingScore(book_id=book_id, log_score=merged, updated_at=now))
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Put the increments back so they are retried on the next checkpoint
+                with self._lock:
+                    for book_id, increment in pending.items():
+                        self._pending[book_id] = _logaddexp(self._pending.get(book_id), increment)
+                raise
+            logger.info(f"Checkpointed trending scores for {len(pending)} books")
+        self.load(db, limit=RELOAD_TOP_N)
+
+
+trending = TrendingRanking()
+
+
+def checkpoint_trending():
+    db = SessionLocal()
+    try:
+        trending.checkpoint(db)
+    finally:
+        db.close()
+
+
+def load_trending():
+    db = SessionLocal()
+    try:
+        count = trending.load(db)
+        logger.info(f"Loaded {count} trending scores")
+    finally:
+        db.close()
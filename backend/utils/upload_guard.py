@@ -0,0 +1,266 @@
+"""Reject bad media uploads while they are still arriving.
+
+Starlette spools a multipart body to disk before the route runs, so checks in
+the handler only happen after the whole file has been received.
+UploadGuardMiddleware sits in front and parses the multipart stream as it
+comes in. For each file field of an upload route it:
+
+* sniffs the media type from the first bytes (magic numbers, not the
+  client-supplied Content-Type) and answers 415 if it isn't allowed;
+* answers 413 as soon as the field exceeds its size limit, or the audio
+  exceeds its duration limit (estimated from the MP3 frame header or WAV
+  format chunk as the bytes arrive).
+
+A declared Content-Length above the route's total limit is refused before
+anything is read. A rejected request is never read to the end. The server
+closes the connection instead of draining it.
+
+Handlers call sniffed_media_type() to use the detected type for the blob name
+and stored content type.
+
+Requests with an X-Upload-Id header get "receiving" progress events, and
+rejections are published as "error" events (see utils.progress).
+"""
+import logging
+import os
+from collections import namedtuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from multipart.multipart import MultipartParser, parse_options_header
+
+from utils.audio_metadata import HEAD_BYTES, audio_duration, find_mp3_frame
+from utils.progress import ProgressReporter, progress, valid_upload_id
+
+logger = logging.getLogger(__name__)
+
+SNIFF_BYTES = 64
+DURATION_CHECK_BYTES = 1024 * 1024
+MB = 1024 * 1024
+
+MEDIA_EXTENSIONS = {
+    "audio/mpeg": ".mp3",
+    "audio/ogg": ".ogg",
+    "audio/wav": ".wav",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+}
+AUDIO_TYPES = ("audio/mpeg", "audio/ogg", "audio/wav")
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp")
+
+FieldPolicy = namedtuple("FieldPolicy", ["media_types", "max_bytes", "max_duration"])
+
+AUDIO_POLICY = FieldPolicy(
+    AUDIO_TYPES,
+    int(float(os.getenv("MAX_AUDIO_UPLOAD_MB", 600)) * MB),
+    float(os.getenv("MAX_AUDIO_DURATION_HOURS", 8)) * 3600,
+)
+IMAGE_POLICY = FieldPolicy(IMAGE_TYPES, int(float(os.getenv("MAX_IMAGE_UPLOAD_MB", 10)) * MB), None)
+
+# File fields each upload route accepts; any other file field is refused
+UPLOAD_POLICIES = {
+    "/api/audio/upload": {"audio": AUDIO_POLICY, "thumbnail": IMAGE_POLICY},
+    "/api/banners/upload": {"banner": IMAGE_POLICY},
+}
+# Room for the text fields and multipart framing on top of the files
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+def sniff_media_type(head):
+    """Media type from magic bytes, or None if it isn't one we accept"""
+    if head[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    # Identification header of the first logical stream: Opus or Vorbis, not Theora video
+    if head[:4] == b"OggS" and (head[28:36] == b"OpusHead" or head[28:35] == b"\x01vorbis"):
+        return "audio/ogg"
+    if head[:3] == b"ID3" or find_mp3_frame(head, search_bytes=len(head)) is not None:
+        return "audio/mpeg"
+    return None
+
+
+async def sniffed_media_type(upload: UploadFile, allowed):
+    """Detected type of an already-received upload; 415 if not in allowed"""
+    head = await upload.read(SNIFF_BYTES)
+    await upload.seek(0)
+    media_type = sniff_media_type(head)
+    if media_type not in allowed:
+        raise HTTPException(status_code=415, detail=f"{upload.filename} is not a supported {' / '.join(allowed)} file")
+    return media_type
+
+
+def blob_filename(filename, media_type):
+    """Client filename with the extension of the detected type, so storage serves the right Content-Type"""
+    stem = os.path.splitext(os.path.basename(filename or ""))[0] or "upload"
+    return stem + MEDIA_EXTENSIONS[media_type]
+
+
+class _FilePart:
+    __slots__ = ("field", "policy", "head", "received", "media_type", "next_duration_check")
+
+    def __init__(self, field, policy):
+        self.field = field
+        self.policy = policy
+        self.head = b""
+        self.received = 0
+        self.media_type = None
+        self.next_duration_check = HEAD_BYTES
+
+
+class _UploadInspector:
+    """Feeds a multipart body through python-multipart's push parser and records the first violation"""
+
+    def __init__(self, boundary, policies):
+        self.policies = policies
+        self.error = None
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._part = None
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, chunk):
+        if self.error is None:
+            self._parser.write(chunk)
+        return self.error
+
+    def _fail(self, status_code, detail):
+        if self.error is None:
+            self.error = (status_code, detail)
+
+    def _on_part_begin(self):
+        self._part = None
+        self._disposition = b""
+
+    def _on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"filename" not in options:
+            return
+        field = options.get(b"name", b"").decode("latin-1")
+        policy = self.policies.get(field)
+        if policy is None:
+            self._fail(400, f"Unexpected file field: {field}")
+            return
+        self._part = _FilePart(field, policy)
+
+    def _on_part_data(self, data, start, end):
+        part = self._part
+        if part is None:
+            return
+        part.received += end - start
+        if part.received > part.policy.max_bytes:
+            self._fail(413, f"{part.field} exceeds {part.policy.max_bytes // MB} MB")
+            return
+        if len(part.head) < HEAD_BYTES:
+            part.head += data[start:min(end, start + HEAD_BYTES - len(part.head))]
+        if part.media_type is None and len(part.head) >= SNIFF_BYTES:
+            self._sniff(part)
+        if part.media_type is not None and part.received >= part.next_duration_check:
+            part.next_duration_check = part.received + DURATION_CHECK_BYTES
+            self._check_duration(part)
+
+    def _on_part_end(self):
+        part = self._part
+        if part is not None:
+            if part.media_type is None:
+                self._sniff(part)
+            if part.media_type is not None:
+                self._check_duration(part)
+        self._part = None
+
+    def _sniff(self, part):
+        part.media_type = sniff_media_type(part.head)
+        if part.media_type not in part.policy.media_types:
+            self._fail(415, f"{part.field} is not a supported {' / '.join(part.policy.media_types)} file")
+            self._part = None
+
+    def _check_duration(self, part):
+        if not part.policy.max_duration or part.media_type not in ("audio/mpeg", "audio/wav"):
+            return
+        # Duration of what has arrived so far; only ever grows as more bytes come in
+        duration = audio_duration(part.head, part.received, part.media_type)
+        if duration and duration > part.policy.max_duration:
+            self._fail(413, f"{part.field} is longer than {part.policy.max_duration / 3600:g} hours")
+
+
+class UploadGuardMiddleware:
+    """Pure ASGI: inspects upload bodies chunk by chunk as the route's form parser pulls them"""
+
+    def __init__(self, app, policies=None):
+        self.app = app
+        self.policies = policies or UPLOAD_POLICIES
+
+    async def __call__(self, scope, receive, send):
+        policies = self.policies.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if policies is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        max_request_bytes = sum(policy.max_bytes for policy in policies.values()) + FORM_OVERHEAD_BYTES
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > max_request_bytes:
+            response = JSONResponse({"detail": f"Upload exceeds {max_request_bytes // MB} MB"}, status_code=413)
+            await response(scope, receive, send)
+            return
+
+        content_type, options = parse_options_header(headers.get(b"content-type", b""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            # Not a file upload; FastAPI's own validation answers it
+            await self.app(scope, receive, send)
+            return
+
+        inspector = _UploadInspector(options[b"boundary"], policies)
+        total = 0
+        upload_id = headers.get(b"x-upload-id", b"").decode("latin-1")
+        upload_id = upload_id if valid_upload_id(upload_id) else None
+        report = ProgressReporter(upload_id, "receiving", declared or None)
+
+        async def guarded_receive():
+            nonlocal total
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                total += len(body)
+                if total > max_request_bytes:
+                    inspector._fail(413, f"Upload exceeds {max_request_bytes // MB} MB")
+                error = inspector.write(body)
+                if error is not None:
+                    status_code, detail = error
+                    logger.warning(f"Rejected upload to {scope['path']} after {total} bytes: {detail}")
+                    progress.publish(upload_id, "error", status=status_code, detail=detail)
+                    # Raised inside the route's form parsing, so the normal exception handlers render it
+                    raise HTTPException(status_code=status_code, detail=detail)
+                report(total)
+            return message
+
+        await self.app(scope, guarded_receive, send)